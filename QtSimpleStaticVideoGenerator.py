@@ -1,20 +1,25 @@
 #!/usr/bin/env python3
 import sys
 import os
-import math
 import subprocess
 import platform
 import re
+import time
+import threading
 from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QPushButton, QLineEdit, QLabel, 
-                             QFileDialog, QProgressBar, QTextEdit, QComboBox, QCheckBox)
-from PySide6.QtCore import QThread, Signal, Qt, QRect
-from PySide6.QtGui import QPixmap, QPainter, QColor, QFont, QPen
-from PIL import Image
+                             QFileDialog, QProgressBar, QTextEdit, QComboBox, QCheckBox,
+                             QTableWidget, QTableWidgetItem, QHeaderView, QAbstractItemView, QSpinBox)
+from PySide6.QtCore import QThread, Signal, Qt, QRect, QTimer
+from PySide6.QtGui import QPixmap, QImage, QPainter, QColor, QFont, QPen
 
-import os
-import subprocess
 import shutil
+from staticvideo.cache import MediaCache
+from staticvideo.render import render
+from staticvideo.progress import format_eta, STAGE_LABELS
+from staticvideo.thumbnail import ThumbnailCache
+from staticvideo import cpubudget
+from staticvideo.metrics import collect, format_breakdown
 
 def ensure_ffmpeg():
     """
@@ -49,9 +54,15 @@ def ensure_ffmpeg():
 
 class VideoWorker(QThread):
     progress = Signal(str)
+    # Parsed ffmpeg progress: dict with stage, stage_fraction, overall, speed, eta (see staticvideo.progress)
+    stats = Signal(object)
     finished = Signal(bool, str)
 
-    def __init__(self, audio, image, out_dir, out_name, res, seed_len, bitrate, no_clobber, is_portrait):
+    # Output paths claimed by running workers, so concurrent no-clobber jobs don't pick the same name
+    reserved = set()
+    reserve_lock = threading.Lock()
+
+    def __init__(self, audio, image, out_dir, out_name, res, seed_len, bitrate, no_clobber, is_portrait, cache=None, audio_policy="auto", layout="plain", audio_jobs=1):
         super().__init__()
         self.audio = os.path.abspath(os.path.expanduser(audio))
         self.image = os.path.abspath(os.path.expanduser(image))
@@ -64,84 +75,68 @@ class VideoWorker(QThread):
         
         self.res_str = res
         self.seed_str = seed_len
+        self.audio_jobs = audio_jobs
         self.bitrate = bitrate
         self.no_clobber = no_clobber
         self.is_portrait = is_portrait
+        self.cache = cache
+        self.audio_policy = audio_policy
+        self.layout = layout
 
     def get_safe_path(self, directory, filename):
         base, ext = os.path.splitext(filename)
         path = os.path.join(directory, filename)
-        if not self.no_clobber or not os.path.exists(path): 
-            return path
-        counter = 0
-        while os.path.exists(path):
-            path = os.path.join(directory, f"{base}-{counter:03d}{ext}")
-            counter += 1
+        taken = lambda p: os.path.exists(p) or p in VideoWorker.reserved
+        with VideoWorker.reserve_lock:
+            if self.no_clobber:
+                counter = 0
+                while taken(path):
+                    path = os.path.join(directory, f"{base}-{counter:03d}{ext}")
+                    counter += 1
+            VideoWorker.reserved.add(path)
         return path
 
     def run(self):
+        final_output = None
         try:
             os.makedirs(self.out_dir, exist_ok=True)
             final_output = self.get_safe_path(self.out_dir, self.out_name)
 
-            self.progress.emit("Analyzing audio duration...")
-            duration_cmd = ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1', self.audio]
-            audio_duration = float(subprocess.check_output(duration_cmd))
-
-            with Image.open(self.image) as img:
-                if self.res_str == "From Image":
-                    w, h = img.size
-                else:
-                    match = re.match(r"(\d+)\s*[xX]\s*(\d+)", self.res_str)
-                    if not match: raise ValueError("Invalid resolution format.")
-                    w, h = int(match.group(1)), int(match.group(2))
-                
-                if self.is_portrait: w, h = h, w
-                w, h = (w // 2) * 2, (h // 2) * 2
-                
-                img.thumbnail((w, h), Image.Resampling.LANCZOS)
-                new_img = Image.new("RGB", (w, h), (0, 0, 0))
-                offset = ((w - img.size[0]) // 2, (h - img.size[1]) // 2)
-                new_img.paste(img, offset)
-                resized_img_filename = "temp_resized_image.png"
-                resized_img_path = os.path.join(self.out_dir,resized_img_filename)
-                new_img.save(resized_img_path)
-
-            s_len = 60
-            if self.seed_str == "Guess":
-                s_len = 10 if audio_duration < 60 else 60 if audio_duration < 600 else 240
+            if self.seed_str in ("Auto", "Guess"):
+                seed_len = "auto"
             else:
-                s_len = int(re.sub(r"[^\d]", "", self.seed_str))
-
-            br_match = re.search(r"(\d+)", self.bitrate)
-            final_bitrate = f"{br_match.group(1)}k"
-
-            self.progress.emit(f"Encoding seed segment...")
-            seed_clip_filename = "temp_seed.mp4"
-            seed_clip = os.path.join(self.out_dir,seed_clip_filename)
-            subprocess.run(['ffmpeg', '-y', '-loop', '1', '-i', resized_img_path, 
-                    '-c:v', 'libx264', '-t', str(s_len), '-pix_fmt', 'yuv420p', 
-                    '-vf', f'scale={w}:{h}', '-preset', 'veryfast', seed_clip], 
-                check=True)
-
-            self.progress.emit(f"Muxing final video ({final_bitrate})...")
-            num_loops = math.ceil(audio_duration / s_len)
-            concat_filename = "temp_list.txt"
-            concat_file = os.path.join(self.out_dir,concat_filename)
-            with open(concat_file, "w") as f:
-                for _ in range(num_loops):
-                    f.write(f"file '{os.path.abspath(seed_clip)}'\n")
-
-            subprocess.run(['ffmpeg', '-y', '-f', 'concat', '-safe', '0', '-i', concat_file, '-i', self.audio, 
-                    '-c:v', 'copy', '-c:a', 'aac', '-b:a', final_bitrate, '-shortest', '-t', 
-                    str(audio_duration), final_output], 
-                check=True)
-
-            for tmp in [resized_img_path, seed_clip, concat_file]:
-                if os.path.exists(tmp): os.remove(tmp)
+                seed_len = int(re.sub(r"[^\d]", "", self.seed_str))
+            with collect(audio=self.audio, image=self.image, output=final_output) as job_metrics:
+                render(self.audio, self.image, final_output, res=self.res_str, seed_len=seed_len,
+                       bitrate=self.bitrate, portrait=self.is_portrait, audio_policy=self.audio_policy,
+                       layout=self.layout, audio_jobs=self.audio_jobs, cache=self.cache, log=self.progress.emit,
+                       on_progress=self.stats.emit)
+            self.progress.emit("Stage breakdown:\n" + format_breakdown(job_metrics.record))
             self.finished.emit(True, final_output)
         except Exception as e:
             self.finished.emit(False, str(e))
+        finally:
+            with VideoWorker.reserve_lock:
+                VideoWorker.reserved.discard(final_output)
+
+def to_qimage(thumb):
+    data = thumb.tobytes("raw", "RGB")
+    return QImage(data, thumb.width, thumb.height, thumb.width * 3, QImage.Format_RGB888).copy()
+
+class PreviewWorker(QThread):
+    # Request number and the decoded preview (QImage, or None if it couldn't be read)
+    loaded = Signal(int, object)
+
+    def __init__(self, request, path, thumbnails):
+        super().__init__()
+        self.request, self.path, self.thumbnails = request, path, thumbnails
+
+    def run(self):
+        try:
+            image = to_qimage(self.thumbnails.get(self.path))
+        except Exception:
+            image = None
+        self.loaded.emit(self.request, image)
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -150,6 +145,11 @@ class MainWindow(QMainWindow):
         self.setMinimumWidth(1050)
         self.setAcceptDrops(True)
         self.status_icon = None
+        # One cache for every job in the queue, so running jobs see each other's pinned entries
+        try:
+            self.cache = MediaCache()
+        except OSError:
+            self.cache = None
 
         self.audio_exts = {'.wav', '.mp3', '.flac', '.m4a', '.ogg', '.aif', '.aiff' }
         self.image_exts = {'.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tiff'}
@@ -159,20 +159,34 @@ class MainWindow(QMainWindow):
         self.image_input = QLineEdit()
         self.dir_input = QLineEdit()
         self.filename_input = QLineEdit()
-        self.image_input.textChanged.connect(self.update_preview)
+        # Preview: decode off the GUI thread, 250ms after the path stops changing
+        self.thumbnails = ThumbnailCache()
+        self.preview_request = 0
+        self.preview_workers = set()
+        self.preview_timer = QTimer(self); self.preview_timer.setSingleShot(True); self.preview_timer.setInterval(250)
+        self.preview_timer.timeout.connect(self.update_preview)
+        self.image_input.textChanged.connect(self.preview_timer.start)
 
         self.res_dropdown = QComboBox(); self.res_dropdown.setEditable(True)
         self.res_dropdown.addItems(["1920x1080", "1280x720", "854x480", "1080x1080", "640x640", "480x480", "From Image"]) ## Resolutions
         
         self.portrait_cb = QCheckBox("Portrait")
         self.seed_dropdown = QComboBox(); self.seed_dropdown.setEditable(True)
-        self.seed_dropdown.addItems(["60s", "10s", "240s", "Guess"]) ## Seed Durations
+        self.seed_dropdown.addItems(["60s", "10s", "240s", "Auto"]) ## Seed Durations (Auto: calibrated, see wavimg2mp4 --calibrate)
 
         self.bitrate_dropdown = QComboBox(); self.bitrate_dropdown.setEditable(True)
         self.bitrate_dropdown.addItems(["128k", "192k", "256k", "320k"]) ## Bitrates
 
+        self.audio_mode_dropdown = QComboBox()
+        self.audio_mode_dropdown.addItems(["Auto", "Copy", "Encode"]) ## Audio: copy AAC/ALAC/MP3 as-is or encode to AAC
+
+        self.layout_dropdown = QComboBox()
+        self.layout_dropdown.addItems(["Plain", "Faststart", "Fragmented"]) ## MP4 layout: Faststart puts the index first for uploads
+
         self.no_clobber_cb = QCheckBox("No Clobber (don't overwrite existing files, append numbers like -003.mp4 as necessary)")
         self.no_clobber_cb.setChecked(True)
+        self.cache_cb = QCheckBox("Cache (reuse seed clips and encoded audio between runs)")
+        self.cache_cb.setChecked(True)
         
         self.preview_label = QLabel("No Image")
         self.preview_label.setFixedSize(300, 300)
@@ -182,7 +196,27 @@ class MainWindow(QMainWindow):
         self.log_area = QTextEdit(); self.log_area.setReadOnly(True)
         self.progress_bar = QProgressBar()
         
-        self.start_btn = QPushButton("Generate Video")
+        # Job queue: each "Add Job" snapshots the fields; up to jobs_spin jobs render at once
+        self.jobs = []
+        self.jobs_table = QTableWidget(0, 4)
+        self.jobs_table.setHorizontalHeaderLabels(["Output", "Status", "Progress", "Elapsed"])
+        self.jobs_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.jobs_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.jobs_table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.jobs_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.jobs_table.verticalHeader().setVisible(False)
+        self.jobs_spin = QSpinBox(); self.jobs_spin.setRange(1, os.cpu_count() or 1)
+        self.jobs_spin.setValue(max(1, (os.cpu_count() or 2) // 2))
+        # The running jobs share the cores, and ffmpeg runs niced so the window stays responsive
+        cpubudget.configure(jobs=self.jobs_spin.value(), nice=cpubudget.BACKGROUND_NICE)
+        self.job_up_btn = QPushButton("Move Up")
+        self.job_down_btn = QPushButton("Move Down")
+        self.job_cancel_btn = QPushButton("Cancel")
+        self.job_clear_btn = QPushButton("Clear Finished")
+        self.jobs_timer = QTimer(self); self.jobs_timer.setInterval(1000)
+        self.jobs_timer.timeout.connect(self.refresh_jobs)
+
+        self.start_btn = QPushButton("Add Job")
         self.open_folder_btn = QPushButton("Show in Folder")
         self.clear_all_btn = QPushButton("Clear All")
         self.open_folder_btn.setEnabled(False)
@@ -209,14 +243,19 @@ class MainWindow(QMainWindow):
         settings_row = QHBoxLayout()
         settings_row.addWidget(QLabel("Bitrate:"))
         settings_row.addWidget(self.bitrate_dropdown)
+        settings_row.addWidget(QLabel("Audio:"))
+        settings_row.addWidget(self.audio_mode_dropdown)
         settings_row.addWidget(QLabel("Res:"))
         settings_row.addWidget(self.res_dropdown)
         settings_row.addWidget(self.portrait_cb)
         settings_row.addWidget(QLabel("Seed:"))
         settings_row.addWidget(self.seed_dropdown)
+        settings_row.addWidget(QLabel("Layout:"))
+        settings_row.addWidget(self.layout_dropdown)
         right.addLayout(settings_row)
 
         right.addWidget(self.no_clobber_cb)
+        right.addWidget(self.cache_cb)
         
         # Buttons
         btns = QHBoxLayout()
@@ -226,6 +265,16 @@ class MainWindow(QMainWindow):
 
         right.addLayout(btns)
         right.addWidget(self.progress_bar)
+
+        # Job queue
+        jobs_row = QHBoxLayout()
+        jobs_row.addWidget(QLabel("<b>JOBS</b>"))
+        jobs_row.addStretch()
+        jobs_row.addWidget(QLabel("Parallel:"))
+        jobs_row.addWidget(self.jobs_spin)
+        for b in (self.job_up_btn, self.job_down_btn, self.job_cancel_btn, self.job_clear_btn): jobs_row.addWidget(b)
+        right.addLayout(jobs_row)
+        right.addWidget(self.jobs_table)
         right.addWidget(self.log_area)
 
         main_layout.addLayout(left)
@@ -236,6 +285,12 @@ class MainWindow(QMainWindow):
         self.start_btn.clicked.connect(self.start_processing)
         self.open_folder_btn.clicked.connect(self.open_file_manager)
         self.clear_all_btn.clicked.connect(self.reset_fields)
+        self.job_up_btn.clicked.connect(lambda: self.move_job(-1))
+        self.job_down_btn.clicked.connect(lambda: self.move_job(1))
+        self.job_cancel_btn.clicked.connect(self.cancel_job)
+        self.job_clear_btn.clicked.connect(self.clear_finished_jobs)
+        self.jobs_spin.valueChanged.connect(lambda value: cpubudget.configure(jobs=value))
+        self.jobs_spin.valueChanged.connect(self.schedule_jobs)
 
     def _create_row(self, t, le, f):
         row = QHBoxLayout()
@@ -248,13 +303,26 @@ class MainWindow(QMainWindow):
 
     def update_preview(self):
         self.status_icon = None
+        self.preview_request += 1
         path = self.image_input.text().strip()
-        if os.path.exists(path) and not os.path.isdir(path):
-            pixmap = QPixmap(path)
-            if not pixmap.isNull():
-                self.preview_label.setPixmap(pixmap.scaled(300, 300, Qt.KeepAspectRatio, Qt.SmoothTransformation))
-                self.preview_label.setStyleSheet("border: 1px solid #333; background: #000;")
-                return
+        if os.path.isfile(path):
+            thumb = self.thumbnails.cached(path)
+            if thumb is not None:
+                self.show_preview(self.preview_request, to_qimage(thumb)); return
+            self.preview_label.setText("Loading...")
+            worker = PreviewWorker(self.preview_request, path, self.thumbnails)
+            worker.loaded.connect(self.show_preview)
+            worker.finished.connect(lambda: self.preview_workers.discard(worker))
+            self.preview_workers.add(worker); worker.start()
+            return
+        self.show_preview(self.preview_request, None)
+
+    def show_preview(self, request, image):
+        if request != self.preview_request: return # A newer path was entered meanwhile
+        if image is not None:
+            self.preview_label.setPixmap(QPixmap.fromImage(image))
+            self.preview_label.setStyleSheet("border: 1px solid #333; background: #000;")
+            return
         self.preview_label.clear(); self.preview_label.setText("No Image")
         self.preview_label.setStyleSheet("border: 2px dashed #555; background: #111; color: #555;")
 
@@ -323,24 +391,97 @@ class MainWindow(QMainWindow):
         if not all([self.audio_input.text(), self.image_input.text(), self.dir_input.text(), self.filename_input.text()]):
             self.log_area.setText("Incomplete fields. Ensure Audio, Image, and Folder are set."); return
         
-        self.start_btn.setEnabled(False); self.progress_bar.setRange(0, 0)
-        self.worker = VideoWorker(
-            self.audio_input.text(), 
-            self.image_input.text(),
-            self.dir_input.text(),
-            self.filename_input.text(),
-            self.res_dropdown.currentText(),
-            self.seed_dropdown.currentText(),
-            self.bitrate_dropdown.currentText(),
-            self.no_clobber_cb.isChecked(),
-            self.portrait_cb.isChecked())
-        self.worker.progress.connect(self.log_area.append)
-        self.worker.finished.connect(self.on_finished)
-        self.worker.start()
-
-    def on_finished(self, success, msg):
-        self.progress_bar.setRange(0, 100); self.progress_bar.setValue(100 if success else 0)
-        self.start_btn.setEnabled(True); self.play_finish_sound()
+        self.jobs.append({
+            "name": self.filename_input.text(),
+            "args": (self.audio_input.text(),
+                     self.image_input.text(),
+                     self.dir_input.text(),
+                     self.filename_input.text(),
+                     self.res_dropdown.currentText(),
+                     self.seed_dropdown.currentText(),
+                     self.bitrate_dropdown.currentText(),
+                     self.no_clobber_cb.isChecked(),
+                     self.portrait_cb.isChecked(),
+                     self.cache if self.cache_cb.isChecked() else None,
+                     self.audio_mode_dropdown.currentText().lower(),
+                     self.layout_dropdown.currentText().lower()),
+            "status": "Pending", "progress": 0.0, "detail": "", "worker": None, "start": None, "end": None,
+        })
+        # Ready for the next track of the album: keep image, folder and settings
+        self.audio_input.clear(); self.filename_input.clear()
+        self.schedule_jobs()
+
+    def schedule_jobs(self):
+        """Start pending jobs, in queue order, until the parallel limit is reached."""
+        running = sum(1 for job in self.jobs if job["status"] == "Running")
+        for job in self.jobs:
+            if running >= self.jobs_spin.value(): break
+            if job["status"] != "Pending": continue
+            # Long audio is split across the cores the other running jobs leave over
+            worker = VideoWorker(*job["args"], audio_jobs=max(1, (os.cpu_count() or 1) // self.jobs_spin.value()))
+            worker.progress.connect(lambda msg, job=job: self.log_area.append(f"[{job['name']}] {msg}"))
+            worker.stats.connect(lambda info, job=job: self.on_stats(job, info))
+            worker.finished.connect(lambda success, msg, job=job: self.on_finished(job, success, msg))
+            job.update(status="Running", worker=worker, start=time.monotonic())
+            worker.start()
+            running += 1
+        if running: self.jobs_timer.start()
+        self.refresh_jobs()
+
+    def selected_job(self):
+        rows = self.jobs_table.selectionModel().selectedRows()
+        return rows[0].row() if rows else None
+
+    def move_job(self, step):
+        row = self.selected_job()
+        if row is None: return
+        other = row + step
+        if not 0 <= other < len(self.jobs): return
+        if "Pending" not in (self.jobs[row]["status"], self.jobs[other]["status"]): return # Only pending jobs move
+        self.jobs[row], self.jobs[other] = self.jobs[other], self.jobs[row]
+        self.refresh_jobs(); self.jobs_table.selectRow(other)
+
+    def cancel_job(self):
+        row = self.selected_job()
+        if row is not None and self.jobs[row]["status"] == "Pending":
+            self.jobs[row]["status"] = "Cancelled"
+            self.refresh_jobs()
+
+    def clear_finished_jobs(self):
+        for job in self.jobs:
+            if job["status"] in ("Done", "Failed") and job["worker"]:
+                job["worker"].wait()  # Past its finished signal, so this only lets run() unwind
+        self.jobs = [job for job in self.jobs if job["status"] in ("Pending", "Running")]
+        self.refresh_jobs()
+
+    def refresh_jobs(self):
+        self.jobs_table.setRowCount(len(self.jobs))
+        now = time.monotonic()
+        for row, job in enumerate(self.jobs):
+            elapsed = ((job["end"] or now) - job["start"]) if job["start"] else None
+            progress = f"{job['progress'] * 100:.0f}%" + (f" {job['detail']}" if job["detail"] else "")
+            for col, text in enumerate((job["name"], job["status"], progress,
+                                        format_eta(elapsed) if elapsed is not None else "")):
+                self.jobs_table.setItem(row, col, QTableWidgetItem(text))
+        if not any(job["status"] == "Running" for job in self.jobs): self.jobs_timer.stop()
+
+        # Main bar: overall progress of the jobs in the queue
+        active = [job for job in self.jobs if job["status"] != "Cancelled"]
+        if active:
+            self.progress_bar.setRange(0, 1000)
+            self.progress_bar.setValue(int(sum(job["progress"] for job in active) / len(active) * 1000))
+            done = sum(1 for job in active if job["status"] in ("Done", "Failed"))
+            self.progress_bar.setFormat(f"%p% ({done}/{len(active)} jobs)")
+
+    def on_stats(self, job, info):
+        job["progress"] = info["overall"]
+        job["detail"] = f"{STAGE_LABELS.get(info['stage'], info['stage'])}, ETA {format_eta(info.get('eta'))}"
+        self.refresh_jobs()
+
+    def on_finished(self, job, success, msg):
+        # Keep job["worker"]: the QThread may still be winding down after emitting finished
+        job.update(status="Done" if success else "Failed", end=time.monotonic(),
+                   progress=1.0 if success else job["progress"], detail="" if success else msg)
         self.status_icon = "Success" if success else "Error"
         self.update()
         if success: 
@@ -348,7 +489,9 @@ class MainWindow(QMainWindow):
             self.open_folder_btn.setEnabled(True)
             self.log_area.append(f"\n[DONE] {msg}")
         else: 
-            self.log_area.append(f"\n[ERROR] {msg}")
+            self.log_area.append(f"\n[ERROR] {job['name']}: {msg}")
+        self.schedule_jobs()
+        if not any(j["status"] in ("Pending", "Running") for j in self.jobs): self.play_finish_sound()
 
     def open_file_manager(self):
         p = self.last_output_path
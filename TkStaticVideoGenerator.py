@@ -11,6 +11,14 @@ from tkinter import ttk, messagebox
 from tkinterdnd2 import DND_FILES, TkinterDnD
 from PIL import Image, ImageTk
 import platform
+import time
+import queue
+from staticvideo.cache import MediaCache
+from staticvideo.render import render, full_encode, probe_audio
+from staticvideo.progress import format_progress, format_timings
+from staticvideo.thumbnail import ThumbnailCache
+from staticvideo import cpubudget
+from staticvideo.metrics import collect, format_breakdown
 
 class MediaProcessor:
     def __init__(self):
@@ -50,53 +58,78 @@ class MediaProcessor:
         return None
 
     def get_audio_duration(self, audio_path):
-        cmd = [self.ffprobe_path, '-v', 'error', '-show_entries', 'format=duration',
-               '-of', 'default=noprint_wrappers=1:nokey=1', audio_path]
-        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
-        return float(result.stdout.strip())
+        # Read from the file header for the usual formats, ffprobe only for the rest
+        return probe_audio(audio_path)["duration"]
 
-    def process_video_stream(self, audio_path, image_path, output_path, resolution, seed_setting, log_callback):
-        w, h = resolution
-        img = Image.open(image_path)
-        img.thumbnail((w, h), Image.Resampling.LANCZOS)
-        new_img = Image.new("RGB", (w, h), (0, 0, 0))
-        new_img.paste(img, ((w - img.size[0]) // 2, (h - img.size[1]) // 2))
-        
-        temp_img = "temp_resized.png"
-        new_img.save(temp_img)
+    # Seed menu entries -> seed length for render ("auto" uses the calibrated model)
+    SEED_LENGTHS = {"Auto": "auto", "10s": 10, "20s": 20, "1minute": 60}
 
-        audio_duration = self.get_audio_duration(audio_path)
-        
-        cmd = [
-            self.ffmpeg_path, '-y',
-            '-loop', '1', '-t', str(audio_duration), '-i', temp_img,
-            '-i', audio_path,
-            '-c:v', 'libx264', '-tune', 'stillimage', '-preset', 'veryfast',
-            '-c:a', 'aac', '-b:a', '192k', '-pix_fmt', 'yuv420p', '-shortest', output_path
-        ]
-
-        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, 
-                                   text=True, bufsize=1, universal_newlines=True)
+    def process_video_stream(self, audio_path, image_path, output_path, resolution, seed_setting, log_callback,
+                             audio_policy="auto", progress_callback=None, strategy="seed", layout="plain"):
+        """
+        strategy "seed" encodes a short seed clip and loops it with a stream copy
+        concat (like the CLI and Qt app); "full" encodes the whole duration with
+        libx264. Both check the rendered duration against the audio and write
+        the MP4 layout given (plain, faststart or fragmented). Returns
+        (description of the strategy, {stage: seconds}, metrics record).
+        """
+        w, h = resolution
+        timings = {}
+        def on_progress(info):
+            timings.update(info["timings"])
+            if progress_callback: progress_callback(info)
+        log = lambda msg: log_callback(msg + "\n")
 
-        for line in process.stdout:
-            log_callback(line)
-        
-        process.wait()
-        if os.path.exists(temp_img): os.remove(temp_img)
-        if process.returncode != 0: raise Exception("FFmpeg rendering failed.")
+        try:
+            with collect(audio=audio_path, image=image_path, output=output_path) as job_metrics:
+                if strategy == "full":
+                    used = "full encode"
+                    full_encode(audio_path, image_path, output_path, (w, h), audio_policy=audio_policy,
+                                verify=True, log=log, on_log=log_callback, on_progress=on_progress, layout=layout)
+                else:
+                    used = f"seed + concat ({seed_setting} seed)"
+                    seed_len = self.SEED_LENGTHS.get(seed_setting, 20)
+                    render(audio_path, image_path, output_path, f"{w}x{h}", seed_len, audio_policy=audio_policy,
+                           cache=MediaCache(), log=log, audio_jobs=os.cpu_count() or 1,
+                           verify=True, on_progress=on_progress, layout=layout)
+            return used, timings, job_metrics.record
+        except subprocess.CalledProcessError:
+            raise Exception("FFmpeg rendering failed.")
 
 class VideoMakerApp(TkinterDnD.Tk):
+    # The render thread never touches Tk: it queues ("log", text), ("status", text)
+    # and ("done"/"error", ...) events, which the main loop drains every LOG_POLL_MS
+    # in one batch. The log widget keeps the last LOG_LINES lines; "Save log" spools
+    # the whole log next to the output.
+    LOG_LINES = 2000
+    LOG_POLL_MS = 100
+
     def __init__(self):
         super().__init__()
         self.title("Static Video Generator")
         self.geometry("950x900")
         
         self.processor = MediaProcessor()
+        # ffmpeg runs niced, so the window keeps up while it encodes
+        cpubudget.configure(nice=cpubudget.BACKGROUND_NICE)
         self.entries = {}
         self.last_output_path = None
         self.res_var = tk.StringVar(value="1920x1080")
         self.transpose_var = tk.BooleanVar(value=False)
         self.seed_var = tk.StringVar(value="20s")
+        self.audio_mode_var = tk.StringVar(value="Auto")
+        self.strategy_var = tk.StringVar(value="Seed + Concat")
+        self.layout_var = tk.StringVar(value="Plain")
+        self.save_log_var = tk.BooleanVar(value=False)
+        # Preview: decoded on a worker thread, results handed back through a queue
+        self.thumbnails = ThumbnailCache((300, 150))
+        self.preview_job = None
+        self.preview_request = 0
+        self.preview_pending = 0
+        self.preview_results = queue.Queue()
+        self.render_events = queue.Queue()
+        self.render_running = False
+        self.log_spool = None
         self._setup_ui()
 
     def _setup_ui(self):
@@ -112,6 +145,7 @@ class VideoMakerApp(TkinterDnD.Tk):
             ent = ttk.Entry(self.main_frame)
             ent.grid(row=i, column=1, sticky="ew", padx=10, pady=2)
             self.entries[key] = ent
+            if key == "image": ent.bind("<KeyRelease>", lambda e: self.schedule_preview())
             ttk.Button(self.main_frame, text="Clear", width=8, 
                        command=lambda k=key: self.clear_field(k)).grid(row=i, column=2)
 
@@ -127,6 +161,20 @@ class VideoMakerApp(TkinterDnD.Tk):
         seed_opts = ["Auto", "10s", "20s", "1minute"]
         ttk.OptionMenu(settings_frame, self.seed_var, seed_opts[2], *seed_opts).pack(side="left", padx=5)
 
+        ttk.Label(settings_frame, text="Audio:").pack(side="left")
+        audio_opts = ["Auto", "Copy", "Encode"]
+        ttk.OptionMenu(settings_frame, self.audio_mode_var, audio_opts[0], *audio_opts).pack(side="left", padx=5)
+
+        ttk.Label(settings_frame, text="Mode:").pack(side="left")
+        strategy_opts = ["Seed + Concat", "Full Encode"]
+        ttk.OptionMenu(settings_frame, self.strategy_var, strategy_opts[0], *strategy_opts).pack(side="left", padx=5)
+
+        # Faststart: index at the front, so uploads and previews can start before the file has fully arrived
+        ttk.Label(settings_frame, text="Layout:").pack(side="left")
+        layout_opts = ["Plain", "Faststart", "Fragmented"]
+        ttk.OptionMenu(settings_frame, self.layout_var, layout_opts[0], *layout_opts).pack(side="left", padx=5)
+        ttk.Checkbutton(settings_frame, text="Save log", variable=self.save_log_var).pack(side="left", padx=10)
+
         self.preview_label = ttk.Label(self.main_frame, text="No Image Selected", relief="sunken", anchor="center")
         self.preview_label.grid(row=5, column=0, columnspan=3, pady=10, sticky="nsew")
         
@@ -170,7 +218,7 @@ class VideoMakerApp(TkinterDnD.Tk):
 
     def clear_field(self, key):
         self.entries[key].delete(0, "end")
-        if key == "image": self.preview_label.config(image="", text="No Image Selected")
+        if key == "image": self.update_preview("")
 
     def clear_all(self):
         for key in self.entries: self.clear_field(key)
@@ -188,13 +236,48 @@ class VideoMakerApp(TkinterDnD.Tk):
             else:
                 subprocess.run(['xdg-open', os.path.dirname(p)])
 
+    def schedule_preview(self):
+        """Preview the typed path once it has stopped changing for 250ms."""
+        if self.preview_job: self.after_cancel(self.preview_job)
+        self.preview_job = self.after(250, lambda: self.update_preview(self.entries["image"].get().strip()))
+
     def update_preview(self, path):
+        self.preview_job = None
+        self.preview_request += 1
+        if not os.path.isfile(path):
+            self._show_preview(None); return
+        thumb = self.thumbnails.cached(path)
+        if thumb is not None:
+            self._show_preview(thumb); return
+        self.preview_label.config(text="Loading...")
+        threading.Thread(target=self._load_preview, args=(self.preview_request, path), daemon=True).start()
+        self.preview_pending += 1
+        if self.preview_pending == 1: self.after(50, self._poll_preview)
+
+    def _load_preview(self, request, path):
         try:
-            img = Image.open(path)
-            img.thumbnail((300, 150))
-            self.photo = ImageTk.PhotoImage(img)
-            self.preview_label.config(image=self.photo, text="")
-        except: pass
+            thumb = self.thumbnails.get(path)
+        except Exception:
+            thumb = None
+        self.preview_results.put((request, thumb))
+
+    def _poll_preview(self):
+        while True:
+            try:
+                request, thumb = self.preview_results.get_nowait()
+            except queue.Empty:
+                break
+            self.preview_pending -= 1
+            if request == self.preview_request: self._show_preview(thumb)
+        if self.preview_pending: self.after(50, self._poll_preview)
+
+    def _show_preview(self, thumb):
+        if thumb is None:
+            self.photo = None
+            self.preview_label.config(image="", text="No Image Selected")
+            return
+        self.photo = ImageTk.PhotoImage(thumb)
+        self.preview_label.config(image=self.photo, text="")
 
     def start_generation(self):
         audio = self.entries["audio"].get()
@@ -218,22 +301,89 @@ class VideoMakerApp(TkinterDnD.Tk):
         self.last_output_path = os.path.join(out_dir, out_name)
         self.btn_gen.config(state="disabled")
         self.btn_reveal.config(state="disabled")
-        
-        thread = threading.Thread(target=self.run_ffmpeg_thread, args=(audio, image, self.last_output_path, (w, h), self.seed_var.get()))
+        self.status_var.set("Rendering...")
+        if self.save_log_var.get():
+            spool_path = os.path.splitext(self.last_output_path)[0] + ".log"
+            try:
+                self.log_spool = open(spool_path, "a", encoding="utf-8")
+            except OSError as e:
+                self._append_log(f"Can't save the log to {spool_path}: {e}\n")
+
+        thread = threading.Thread(target=self.run_ffmpeg_thread, args=(audio, image, self.last_output_path, (w, h), self.seed_var.get(),
+                                                                         self.audio_mode_var.get().lower(),
+                                                                         "full" if self.strategy_var.get() == "Full Encode" else "seed",
+                                                                         self.layout_var.get().lower()))
+        self.render_running = True
         thread.start()
+        self.after(self.LOG_POLL_MS, self._poll_render)
 
-    def run_ffmpeg_thread(self, audio, image, output, res, seed):
+    def run_ffmpeg_thread(self, audio, image, output, res, seed, audio_policy, strategy, layout):
+        """Runs on a worker thread: everything for the window goes through render_events."""
+        events = self.render_events
+        log = lambda m: events.put(("log", m))
         try:
-            self.status_var.set("Rendering...")
-            self.processor.process_video_stream(audio, image, output, res, seed, lambda m: (self.log_text.insert("end", m), self.log_text.see("end")))
-            self.status_var.set("Success!")
-            self.btn_reveal.config(state="normal")
-            messagebox.showinfo("Complete", f"Video saved to:\n{output}")
+            start = time.monotonic()
+            used, timings, record = self.processor.process_video_stream(audio, image, output, res, seed, log, audio_policy,
+                                                                lambda info: events.put(("status", format_progress(info))),
+                                                                strategy, layout)
+            total = time.monotonic() - start
+            log(f"Strategy: {used}\nStage times: {format_timings(timings)}, total {total:.1f}s\n")
+            log(f"Stage breakdown:\n{format_breakdown(record)}\n")
+            events.put(("done", (f"Success! {used} in {total:.1f}s ({format_timings(timings)})", output)))
         except Exception as e:
+            events.put(("error", str(e)))
+
+    def _poll_render(self):
+        """Main thread: apply the render thread's events since the last poll in one batch."""
+        text, status, result = [], None, None
+        while True:
+            try:
+                kind, value = self.render_events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "log":
+                text.append(value)
+            elif kind == "status":
+                status = value  # Only the latest progress line is worth drawing
+            else:
+                result = (kind, value)
+        if text:
+            self._append_log("".join(text))
+        if status and self.render_running:
+            self.status_var.set(status)
+        if result:
+            self._finish_render(*result)
+        elif self.render_running:
+            self.after(self.LOG_POLL_MS, self._poll_render)
+
+    def _append_log(self, text):
+        if self.log_spool:
+            self.log_spool.write(text)
+        # Only the tail can stay in the widget, so don't insert more than that
+        lines = text.splitlines(keepends=True)
+        if len(lines) > self.LOG_LINES:
+            text = "".join(lines[-self.LOG_LINES:])
+        self.log_text.insert("end", text)
+        excess = int(self.log_text.index("end-1c").split(".")[0]) - self.LOG_LINES
+        if excess > 0:
+            self.log_text.delete("1.0", f"{excess + 1}.0")
+        self.log_text.see("end")
+
+    def _finish_render(self, kind, value):
+        self.render_running = False
+        if kind == "error":
+            self._append_log(f"\nERROR: {value}\n")
             self.status_var.set("Error")
-            self.log_text.insert("end", f"\nERROR: {e}")
-        finally:
-            self.btn_gen.config(state="normal")
+        else:
+            status, output = value
+            self.status_var.set(status)
+            self.btn_reveal.config(state="normal")
+        if self.log_spool:
+            self.log_spool.close()
+            self.log_spool = None
+        self.btn_gen.config(state="normal")
+        if kind == "done":
+            messagebox.showinfo("Complete", f"Video saved to:\n{output}")
 
 if __name__ == "__main__":
     app = VideoMakerApp()
@@ -0,0 +1,7 @@
+"""
+Shared rendering pipeline used by wavimg2mp4 and the Qt/Tk generators.
+
+The scripts in the top level directory stay thin wrappers around this
+package: they gather options (from argparse or from the GUI widgets)
+and hand them to staticvideo.render.
+"""
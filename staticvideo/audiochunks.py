@@ -0,0 +1,197 @@
+import os
+import re
+import time
+import shutil
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from . import render as r
+from . import audioinfo, metrics
+from .cpubudget import budget as thread_budget
+
+# Parallel AAC encoding for long audio. Once the video is a stream copy, a
+# multi-hour track spends most of its time in ffmpeg's single-threaded AAC
+# encoder, so the audio is split into ranges on AAC frame boundaries (1024
+# samples), each range is encoded to ADTS by its own ffmpeg process, and the
+# frames are joined and put into an M4A by stream copy.
+#
+# Frame k of an encode decodes to input samples [(k-1)*1024, k*1024): the
+# encoder starts with one frame of priming, and each frame overlaps the one
+# before it. So every range after the first is encoded from PREROLL samples
+# earlier, and its frames up to and including the one ending at the range's
+# start are dropped. Every range before the last runs TAIL samples past its
+# end, so its last frame is shaped by the audio that really follows. Only
+# the first range keeps its priming frame, and the M4A records it in an
+# edit list, the same as a single-pass encode does. The joins differ from a
+# single-pass encode by encoder noise only, with no gap and no click.
+
+AAC_FRAME = 1024
+AAC_PRIMING = 1024  # ffmpeg's aac encoder
+PREROLL = 4 * AAC_FRAME
+TAIL = 2 * AAC_FRAME
+# Shorter ranges cost more in process startup and preroll than they save
+MIN_RANGE_SECONDS = 300
+
+
+def adts_frames(data):
+    """Split ADTS data into its frames (header included)."""
+    frames = []
+    pos = 0
+    while pos < len(data):
+        if len(data) - pos < 7 or data[pos] != 0xFF or data[pos + 1] & 0xF6 != 0xF0:
+            raise ValueError(f"Bad ADTS frame at byte {pos}")
+        length = ((data[pos + 3] & 3) << 11) | (data[pos + 4] << 3) | (data[pos + 5] >> 5)
+        if length < 7:
+            raise ValueError(f"Bad ADTS frame length at byte {pos}")
+        frames.append(data[pos:pos + length])
+        pos += length
+    return frames
+
+
+def plan_ranges(duration, sample_rate, jobs):
+    """
+    Start samples of the ranges (a multiple of AAC_FRAME each, the first 0)
+    for up to jobs ranges of at least MIN_RANGE_SECONDS; one range means
+    encode in a single pass.
+    """
+    total = int(duration * sample_rate)
+    count = max(1, min(jobs, int(duration // MIN_RANGE_SECONDS)))
+    return [round(total * i / count / AAC_FRAME) * AAC_FRAME for i in range(count)]
+
+
+def encode_range(audio, bitrate, sample_rate, start, end, output, progress=None):
+    """ADTS AAC of samples [start, end) of audio, end None meaning to the end."""
+    # Seek to a whole second before the range, which lands on an exact sample, then trim by sample
+    seek = max(0, start // sample_rate - 1)
+    trim = f"atrim=start_sample={start - seek * sample_rate}"
+    if end is not None:
+        trim += f":end_sample={end - seek * sample_rate}"
+    r.ffmpeg(*(['-ss', str(seek)] if seek else []), '-i', audio, '-vn', '-af', f'{trim},asetpts=PTS-STARTPTS',
+             '-c:a', 'aac', '-b:a', bitrate, '-f', 'adts', output, progress=progress)
+
+
+def join_ranges(range_files, starts, output):
+    """
+    Join the frames of encode_range outputs (see the top of this module)
+    into one ADTS file. Raises RuntimeError if a range came out short.
+    """
+    with open(output, "wb") as out:
+        for i, path in enumerate(range_files):
+            with open(path, "rb") as f:
+                frames = adts_frames(f.read())
+            first = 0 if i == 0 else min(PREROLL, starts[i]) // AAC_FRAME + 1
+            if i == len(range_files) - 1:
+                keep = frames[first:]
+            else:
+                count = (starts[i + 1] - starts[i]) // AAC_FRAME + (1 if i == 0 else 0)
+                keep = frames[first:first + count]
+                if len(keep) != count:
+                    raise RuntimeError(f"Audio range {i + 1} encoded to {len(frames)} AAC frames, "
+                                       f"expected at least {first + count}")
+            out.write(b"".join(keep))
+
+
+def encode_aac_chunked(audio, bitrate, output, audio_info, jobs, tracker=None, log=print):
+    """
+    Encode audio to an AAC M4A at output with up to jobs ffmpeg processes
+    (see plan_ranges; a single pass when the audio is too short to split).
+    A progress.ProgressTracker gets the "audio" stage. Checks the joined
+    frame counts and the result's duration against audio_info.
+    """
+    sample_rate, duration = audio_info["sample_rate"], audio_info["duration"]
+    starts = plan_ranges(duration, sample_rate, jobs) if sample_rate else [0]
+    if len(starts) == 1:
+        r.encode_audio(audio, bitrate, output, tracker.stage("audio") if tracker else None)
+        return
+    log(f"Splitting the audio into {len(starts)} ranges encoded at once")
+    work = tempfile.mkdtemp(prefix=".audio-ranges-", dir=os.path.dirname(os.path.abspath(output)))
+    try:
+        files = [os.path.join(work, f"range{i}.aac") for i in range(len(starts))]
+        progress, finished = tracker.parts("audio", files) if tracker else ({}, lambda path: None)
+
+        def encode(i):
+            start = max(0, starts[i] - PREROLL)
+            end = starts[i + 1] + TAIL if i + 1 < len(starts) else None
+            encode_range(audio, bitrate, sample_rate, start, end, files[i], progress.get(files[i]))
+            finished(files[i])
+
+        with thread_budget.parallel(len(starts)), ThreadPoolExecutor(max_workers=len(starts)) as pool:
+            list(pool.map(metrics.propagate(encode), range(len(starts))))
+        joined = os.path.join(work, "joined.aac")
+        join_ranges(files, starts, joined)
+        # The priming frame is in the stream; a negative start offset makes it an edit list
+        r.ffmpeg('-itsoffset', f'{-AAC_PRIMING / sample_rate:.6f}', '-f', 'aac', '-i', joined, '-c:a', 'copy',
+                 output)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    joined_duration = (audioinfo.read_header(output) or {}).get("duration", 0.0)
+    if abs(joined_duration - duration) > max(0.5, duration * 0.001):
+        raise RuntimeError(f"Joined audio is {joined_duration:.3f}s, expected {duration:.3f}s")
+
+
+def decoded_samples(path):
+    """Number of samples path decodes to (per channel)."""
+    process = subprocess.Popen(['ffmpeg', '-v', 'error', '-i', path, '-vn', '-ac', '1', '-f', 's16le', '-'],
+                               stdout=subprocess.PIPE)
+    count = 0
+    for block in iter(lambda: process.stdout.read(1 << 20), b""):
+        count += len(block)
+    if process.wait() != 0:
+        raise subprocess.CalledProcessError(process.returncode, 'ffmpeg')
+    return count // 2
+
+
+def sdr(reference, test):
+    """
+    Lowest per-channel signal-to-distortion ratio (dB) of test against
+    reference, from ffmpeg's asdr filter (None if this ffmpeg lacks it).
+    """
+    result = subprocess.run(['ffmpeg', '-hide_banner', '-i', reference, '-i', test, '-filter_complex', 'asdr',
+                             '-f', 'null', '-'], capture_output=True, text=True)
+    out = result.stderr if result.returncode == 0 else ""
+    values = [float(v) for v in re.findall(r"SDR ch\d+: (-?[\d.]+|inf)", out)]
+    return min(values) if values else None
+
+
+def compare_with_single_pass(audio, bitrate="192k", jobs=4, log=print):
+    """
+    Encode audio in a single pass and in ranges, and compare them: a dict
+    per encode with wall time, duration, decoded samples and SDR against
+    the source, plus the SDR of the ranges against the single pass.
+    """
+    bitrate = r.normalize_bitrate(bitrate)
+    info = r.probe_audio(audio)
+    rows = {}
+    with tempfile.TemporaryDirectory(prefix="staticvideo-audio-check-") as work:
+        for name in ("single pass", "ranges"):
+            output = os.path.join(work, name.replace(" ", "-") + ".m4a")
+            log(f"Encoding {name}...")
+            start = time.monotonic()
+            encode_aac_chunked(audio, bitrate, output, info, 1 if name == "single pass" else jobs,
+                               log=lambda msg: None)
+            rows[name] = {"seconds": time.monotonic() - start, "path": output,
+                          "duration": audioinfo.read_header(output)["duration"],
+                          "samples": decoded_samples(output), "sdr": sdr(audio, output)}
+        rows["ranges"]["sdr_vs_single"] = sdr(rows["single pass"]["path"], rows["ranges"]["path"])
+    rows["source"] = {"duration": info["duration"], "samples": decoded_samples(audio),
+                      "ranges": len(plan_ranges(info["duration"], info["sample_rate"], jobs))}
+    return rows
+
+
+def _db(value):
+    return "n/a" if value is None else f"{value:.1f} dB"
+
+
+def format_comparison(rows):
+    single, ranges, source = rows["single pass"], rows["ranges"], rows["source"]
+    lines = [f"{'':<12} {'time':>8} {'duration':>12} {'samples':>12} {'SDR vs source':>14}"]
+    for name, row in (("single pass", single), (f"{source['ranges']} ranges", ranges)):
+        lines.append(f"{name:<12} {row['seconds']:>7.1f}s {row['duration']:>11.3f}s {row['samples']:>12} "
+                     f"{_db(row['sdr']):>14}")
+    lines.append(f"{'source':<12} {'':>8} {source['duration']:>11.3f}s {source['samples']:>12}")
+    # Both AAC encodes pad the source to whole frames, so they are compared with each other
+    same = single["samples"] == ranges["samples"]
+    lines.append(f"\nSample counts {'match' if same else 'DIFFER'}; ranges vs single pass SDR "
+                 f"{_db(ranges['sdr_vs_single'])}; {single['seconds'] / ranges['seconds']:.1f}x faster")
+    return "\n".join(lines)
@@ -0,0 +1,336 @@
+import os
+import struct
+
+from .mp4mux import Mp4Error, iter_boxes, find_box, read_top_level
+
+# Audio stream details read straight from the file header, for the formats
+# people actually drop in (WAV, AIFF, FLAC, MP3, M4A), so a job doesn't have
+# to start ffprobe just to learn the duration. Returns the same dict as an
+# ffprobe probe (render.probe_audio), with ffprobe's codec names, or None
+# for anything not understood here so the caller can fall back to ffprobe.
+
+HEAD_BYTES = 1 << 16
+
+
+def _layout(channels):
+    return {1: "mono", 2: "stereo"}.get(channels)
+
+
+def _info(duration, codec, sample_rate, channels):
+    if not (duration and duration > 0 and codec and sample_rate and channels):
+        return None
+    return {"duration": float(duration), "codec": codec, "sample_rate": int(sample_rate),
+            "channels": int(channels), "channel_layout": _layout(channels)}
+
+
+def _skip_id3(head):
+    """Offset of the first byte after a leading ID3v2 tag (0 if there is none)."""
+    if head[:3] != b"ID3" or len(head) < 10:
+        return 0
+    size = 0
+    for b in head[6:10]:
+        size = (size << 7) | (b & 0x7F)
+    return 10 + size + (10 if head[5] & 0x10 else 0)
+
+
+# --- WAV (RIFF/RF64) ------------------------------------------------------
+
+_WAV_PCM = {(1, 8): "pcm_u8", (1, 16): "pcm_s16le", (1, 24): "pcm_s24le", (1, 32): "pcm_s32le",
+            (3, 32): "pcm_f32le", (3, 64): "pcm_f64le"}
+_WAV_OTHER = {6: "pcm_alaw", 7: "pcm_mulaw"}
+
+
+def read_wav(f, file_size):
+    f.seek(0)
+    riff, _, wave = struct.unpack("<4sI4s", f.read(12))
+    if riff not in (b"RIFF", b"RF64") or wave != b"WAVE":
+        return None
+    fmt = data_size = data_start = None
+    ds64_data = None
+    pos = 12
+    while pos + 8 <= file_size:
+        f.seek(pos)
+        cid, size = struct.unpack("<4sI", f.read(8))
+        if cid == b"ds64":
+            ds64_data = struct.unpack("<QQ", f.read(16))[1]
+        elif cid == b"fmt ":
+            body = f.read(min(size, 40))
+            tag, channels, rate, _, align, bits = struct.unpack_from("<HHIIHH", body)
+            if tag == 0xFFFE and len(body) >= 26:
+                tag = struct.unpack_from("<H", body, 24)[0]  # WAVE_FORMAT_EXTENSIBLE sub-format
+            fmt = (tag, channels, rate, align, bits)
+        elif cid == b"data":
+            data_start = pos + 8
+            data_size = ds64_data if size == 0xFFFFFFFF and ds64_data is not None else size
+            break
+        pos += 8 + size + (size & 1)
+    if not fmt or data_start is None:
+        return None
+    tag, channels, rate, align, bits = fmt
+    codec = _WAV_PCM.get((tag, bits)) or _WAV_OTHER.get(tag)
+    if not codec or not align or not rate:
+        return None
+    # Streamed or truncated files often have a wrong data size
+    data_size = min(data_size, file_size - data_start)
+    return _info(data_size / align / rate, codec, rate, channels)
+
+
+# --- AIFF / AIFF-C --------------------------------------------------------
+
+_AIFC_CODECS = {b"NONE": None, b"twos": None, b"sowt": "le", b"fl32": "pcm_f32be", b"FL32": "pcm_f32be",
+                b"fl64": "pcm_f64be", b"FL64": "pcm_f64be", b"ulaw": "pcm_mulaw", b"alaw": "pcm_alaw"}
+
+
+def _extended(data):
+    """The 80-bit IEEE extended float AIFF uses for the sample rate."""
+    exp, mantissa = struct.unpack(">HQ", data)
+    sign = -1 if exp & 0x8000 else 1
+    exp &= 0x7FFF
+    if exp == 0 and mantissa == 0:
+        return 0.0
+    return sign * mantissa * 2.0 ** (exp - 16383 - 63)
+
+
+def read_aiff(f, file_size):
+    f.seek(0)
+    form, _, kind = struct.unpack(">4sI4s", f.read(12))
+    if form != b"FORM" or kind not in (b"AIFF", b"AIFC"):
+        return None
+    pos = 12
+    while pos + 8 <= file_size:
+        f.seek(pos)
+        cid, size = struct.unpack(">4sI", f.read(8))
+        if cid == b"COMM":
+            body = f.read(min(size, 22))
+            channels, frames, bits = struct.unpack_from(">HIH", body)
+            rate = _extended(body[8:18])
+            compression = body[18:22] if kind == b"AIFC" and len(body) >= 22 else b"NONE"
+            if compression not in _AIFC_CODECS:
+                return None
+            codec = _AIFC_CODECS[compression]
+            width = (bits + 7) // 8 * 8
+            if codec is None:
+                codec = "pcm_s8" if width == 8 else f"pcm_s{width}be"
+            elif codec == "le":
+                codec = f"pcm_s{width}le"
+            return _info(frames / rate if rate else 0, codec, round(rate), channels)
+        pos += 8 + size + (size & 1)
+    return None
+
+
+# --- FLAC -----------------------------------------------------------------
+
+def read_flac(f, head):
+    start = _skip_id3(head)
+    f.seek(start)
+    block = f.read(4 + 4 + 34)
+    if block[:4] != b"fLaC" or len(block) < 42 or block[4] & 0x7F != 0:
+        return None  # STREAMINFO always comes first
+    bits, = struct.unpack(">Q", block[18:26])
+    rate = bits >> 44
+    channels = ((bits >> 41) & 0x7) + 1
+    total = bits & 0xFFFFFFFFF
+    return _info(total / rate if rate else 0, "flac", rate, channels)
+
+
+# --- MP3 (and the other MPEG audio layers) --------------------------------
+
+_MPEG_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_MPEG_BITRATES[(2, 3)] = _MPEG_BITRATES[(2, 2)]
+_MPEG_RATES = [44100, 48000, 32000]
+_MPEG_CODECS = {1: "mp1", 2: "mp2", 3: "mp3"}
+# Tags that may follow the last frame: ID3v1, APEv2, Lyrics3
+_TRAILING_TAGS = (b"TAG", b"APETAGEX", b"LYRICSBEGIN")
+
+
+def _mpeg_header(data, pos):
+    """Fields of the MPEG audio frame header at data[pos], or None if it isn't one."""
+    if pos + 4 > len(data) or data[pos] != 0xFF or data[pos + 1] & 0xE0 != 0xE0:
+        return None
+    b1, b2, b3 = data[pos + 1], data[pos + 2], data[pos + 3]
+    version_bits, layer_bits = (b1 >> 3) & 3, (b1 >> 1) & 3
+    bitrate_index, rate_index = b2 >> 4, (b2 >> 2) & 3
+    if version_bits == 1 or layer_bits == 0 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    version = {3: 1, 2: 2, 0: 2.5}[version_bits]
+    layer = 4 - layer_bits
+    bitrate = _MPEG_BITRATES[(1 if version == 1 else 2, layer)][bitrate_index] * 1000
+    rate = _MPEG_RATES[rate_index] // {1: 1, 2: 2, 2.5: 4}[version]
+    padding = (b2 >> 1) & 1
+    if layer == 1:
+        samples, length = 384, (12 * bitrate // rate + padding) * 4
+    else:
+        samples = 576 if layer == 3 and version != 1 else 1152
+        length = samples // 8 * bitrate // rate + padding
+    return {"version": version, "layer": layer, "bitrate": bitrate, "rate": rate, "samples": samples,
+            "length": length, "channels": 1 if b3 >> 6 == 3 else 2}
+
+
+def _count_samples(f, pos, end, rate):
+    """
+    Samples in the MPEG audio frames from pos to end, walking the frame
+    headers. None if the frames stop matching before end (other than at a
+    trailing tag), so the caller can leave the file to ffprobe.
+    """
+    samples = 0
+    buf, buf_start = b"", pos
+    while pos + 4 <= end:
+        if pos + 4 > buf_start + len(buf):
+            f.seek(pos)
+            buf, buf_start = f.read(min(1 << 20, end - pos)), pos
+        hdr = _mpeg_header(buf, pos - buf_start)
+        if hdr is None or hdr["rate"] != rate:
+            f.seek(pos)
+            return samples if f.read(11).startswith(_TRAILING_TAGS) else None
+        if pos + hdr["length"] > end:
+            break  # Truncated last frame
+        samples += hdr["samples"]
+        pos += hdr["length"]
+    return samples
+
+
+def read_mp3(f, head, file_size, scan=False):
+    """With scan, look past junk before the first frame (only done for .mp3 files)."""
+    start = _skip_id3(head)
+    f.seek(start)
+    data = f.read(HEAD_BYTES)
+    pos, limit = 0, (len(data) - 4 if scan else 1)
+    while pos < limit:
+        hdr = _mpeg_header(data, pos)
+        # A real frame is followed by another one
+        if hdr and (pos + hdr["length"] + 4 > len(data) or _mpeg_header(data, pos + hdr["length"])):
+            break
+        pos += 1
+    else:
+        return None
+    codec = _MPEG_CODECS[hdr["layer"]]
+
+    # Xing/Info (LAME and most VBR encoders) or VBRI (Fraunhofer) header with a frame count
+    side_info = (32 if hdr["channels"] == 2 else 17) if hdr["version"] == 1 else (17 if hdr["channels"] == 2 else 9)
+    xing = pos + 4 + side_info
+    frames = None
+    if data[xing:xing + 4] in (b"Xing", b"Info"):
+        flags, = struct.unpack_from(">I", data, xing + 4)
+        if flags & 1:
+            frames, = struct.unpack_from(">I", data, xing + 8)
+    elif data[pos + 36:pos + 40] == b"VBRI":
+        frames, = struct.unpack_from(">I", data, pos + 50)
+    if frames:
+        return _info(frames * hdr["samples"] / hdr["rate"], codec, hdr["rate"], hdr["channels"])
+
+    # No frame count: count the frames. The first frame's bitrate says nothing about the rest of a VBR file.
+    end = file_size
+    f.seek(max(file_size - 128, 0))
+    if f.read(3) == b"TAG":
+        end -= 128
+    samples = _count_samples(f, start + pos, end, hdr["rate"])
+    return _info(samples / hdr["rate"], codec, hdr["rate"], hdr["channels"]) if samples else None
+
+
+# --- M4A / MP4 ------------------------------------------------------------
+
+_MP4_CODECS = {"alac": "alac", "ac-3": "ac3", "ec-3": "eac3", "Opus": "opus", "fLaC": "flac"}
+# MPEG-4 objectTypeIndication values in esds
+_MP4A_OBJECT_TYPES = {0x40: "aac", 0x66: "aac", 0x67: "aac", 0x68: "aac", 0x69: "mp3", 0x6B: "mp3"}
+
+
+def _descriptor(data, pos):
+    """(tag, payload start, payload end) of the MPEG-4 descriptor at pos."""
+    tag, length = data[pos], 0
+    pos += 1
+    for _ in range(4):
+        b = data[pos]
+        pos += 1
+        length = (length << 7) | (b & 0x7F)
+        if not b & 0x80:
+            break
+    return tag, pos, pos + length
+
+
+def _esds_codec(data, start, end):
+    """Codec named by the esds box in data[start:end] (an mp4a sample entry's children)."""
+    found = find_box(data, "esds", start, end)
+    if not found:
+        return None
+    tag, pos, _ = _descriptor(data, found[0] + 4)
+    if tag != 0x03:
+        return None
+    flags = data[pos + 2]
+    pos += 3
+    if flags & 0x80:  # streamDependenceFlag
+        pos += 2
+    if flags & 0x40:  # URL_Flag
+        pos += 1 + data[pos]
+    if flags & 0x20:  # OCRstreamFlag
+        pos += 2
+    tag, pos, _ = _descriptor(data, pos)
+    return _MP4A_OBJECT_TYPES.get(data[pos]) if tag == 0x04 else None
+
+
+def read_mp4(f):
+    top = read_top_level(f)
+    if "moov" not in top:
+        return None
+    offset, size = top["moov"]
+    f.seek(offset)
+    moov = f.read(size)
+    mvhd = find_box(moov, "moov/mvhd")
+    if not mvhd:
+        return None
+    if moov[mvhd[0]] == 1:
+        timescale, duration = struct.unpack_from(">IQ", moov, mvhd[0] + 20)
+    else:
+        timescale, duration = struct.unpack_from(">II", moov, mvhd[0] + 12)
+    moov_payload = find_box(moov, "moov")
+    for typ, _, start, end in iter_boxes(moov, *moov_payload):
+        if typ != "trak":
+            continue
+        hdlr = find_box(moov, "mdia/hdlr", start, end)
+        if not hdlr or moov[hdlr[0] + 8:hdlr[0] + 12] != b"soun":
+            continue
+        stsd = find_box(moov, "mdia/minf/stbl/stsd", start, end)
+        if not stsd:
+            return None
+        entry = stsd[0] + 8
+        size_, kind = struct.unpack_from(">I4s", moov, entry)
+        kind = kind.decode("latin-1")
+        sound_version, channels = struct.unpack_from(">HxxxxxxH", moov, entry + 16)
+        rate = struct.unpack_from(">I", moov, entry + 32)[0] >> 16
+        if sound_version == 2:
+            return None  # Rate and channels live elsewhere; rare enough for ffprobe
+        children = entry + 36 + (16 if sound_version == 1 else 0)
+        codec = _esds_codec(moov, children, entry + size_) if kind == "mp4a" else _MP4_CODECS.get(kind)
+        return _info(duration / timescale if timescale else 0, codec, rate, channels)
+    return None
+
+
+def read_header(path):
+    """
+    Duration, codec, sample rate and channels of path's audio from its
+    header, in probe_audio's format, or None if this isn't a format (or a
+    variant) handled here.
+    """
+    with open(path, "rb") as f:
+        head = f.read(HEAD_BYTES)
+        file_size = os.fstat(f.fileno()).st_size
+        try:
+            if head[:4] in (b"RIFF", b"RF64"):
+                return read_wav(f, file_size)
+            if head[:4] == b"FORM":
+                return read_aiff(f, file_size)
+            if head[4:8] == b"ftyp":
+                return read_mp4(f)
+            if head[:4] == b"fLaC" or (head[:3] == b"ID3" and path.lower().endswith(".flac")):
+                return read_flac(f, head)
+            is_mp3 = path.lower().endswith(".mp3")
+            if head[:3] == b"ID3" or _mpeg_header(head, 0) or is_mp3:
+                return read_mp3(f, head, file_size, scan=is_mp3)
+        except (struct.error, ValueError, IndexError, KeyError, ZeroDivisionError, Mp4Error):
+            return None
+    return None
@@ -0,0 +1,185 @@
+import os
+import csv
+import glob
+import json
+import time
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from PIL import Image
+
+from . import render as r
+from . import tuner, codecs, cpubudget, metrics
+from .cache import pinning
+from .scratch import job_scratch, estimate_bytes, audio_bytes
+
+# Batch mode: many audio files sharing one (or a few) images. Each distinct
+# seed is encoded once up front, then the per-track work (probe, AAC encode,
+# concat mux) runs across a process pool.
+
+
+def load_manifest(path):
+    """
+    Read jobs from a CSV (header row with audio[,image][,output] columns)
+    or a JSON list of {"audio": ..., "image": ..., "output": ...} objects.
+    Relative paths are taken relative to the manifest.
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    if path.lower().endswith(".json"):
+        with open(path) as f:
+            rows = json.load(f)
+    else:
+        with open(path, newline="") as f:
+            rows = list(csv.DictReader(f))
+
+    jobs = []
+    for row in rows:
+        job = {k: os.path.join(base, os.path.expanduser(v.strip()))
+               for k, v in row.items() if k in ("audio", "image", "output") and v and v.strip()}
+        if "audio" not in job:
+            raise ValueError(f"Manifest row without audio: {row}")
+        jobs.append(job)
+    return jobs
+
+
+def jobs_from_glob(pattern):
+    return [{"audio": path} for path in sorted(glob.glob(os.path.expanduser(pattern)))]
+
+
+def collect_jobs(source, image=None, out_dir=None):
+    """Jobs from a manifest file or a glob, with the default image and output filled in."""
+    if os.path.isfile(source) and source.lower().endswith((".csv", ".json")):
+        jobs = load_manifest(source)
+    else:
+        jobs = jobs_from_glob(source)
+    for job in jobs:
+        job.setdefault("image", image)
+        if not job["image"]:
+            raise ValueError(f"No image for {job['audio']} (use --image or an image column)")
+        if "output" not in job:
+            base = os.path.splitext(os.path.basename(job["audio"]))[0] + ".mp4"
+            job["output"] = os.path.join(out_dir or os.path.dirname(job["audio"]), base)
+    return jobs
+
+
+def _init_worker(budget):
+    r.set_ffmpeg_loglevel("error")
+    cpubudget.init_worker(budget)
+
+
+def _probe(job):
+    if "audio_info" not in job:
+        job["audio_info"] = r.probe_audio(job["audio"])
+    return job["audio_info"]
+
+
+def _run_track(job, seed_clip, seed_len, bitrate, work_dir, cache, metrics_output, track_opts):
+    start = time.monotonic()
+    name = os.path.basename(job["audio"])
+    with metrics.collect(metrics_output, audio=job["audio"], image=job["image"], output=job["output"]):
+        info = r.render_track(job["audio"], seed_clip, seed_len, job["output"], bitrate,
+                              audio_info=job.get("audio_info"), work_dir=work_dir, cache=cache,
+                              log=lambda msg: print(f"[{name}] {msg}", flush=True), **track_opts)
+    return info["duration"], time.monotonic() - start
+
+
+def run_batch(jobs, res="1920x1080", seed_len=60, bitrate="192k", portrait=False,
+              frame_input=r.DEFAULT_FRAME_INPUT, seed_fps=None, cache=None, workers=None, log=print,
+              work_dir=None, ram_budget=0, profile=codecs.DEFAULT_PROFILE, metrics_output=None, **track_opts):
+    """
+    Render all jobs with seeds encoded with the given seed profile.
+    track_opts (audio_policy, muxer, verify) are passed to render_track.
+    Intermediates go in one scratch directory under work_dir, or in /dev/shm
+    when the seeds and the audio staged by the tracks running at once fit in
+    ram_budget (see render). Returns a list of (job, ok, wall_seconds,
+    detail) where detail is the audio duration on success or the error
+    message. metrics_output (see metrics.collect) gets a record per seed and
+    per track.
+    """
+    workers = workers or os.cpu_count() or 1
+    track_opts["profile"] = profile
+    results = []
+    # Rough: one seed per image at the output size ("From Image" at its 4K cap, auto seeds at their longest)
+    size = r.parse_resolution(res) if res != "From Image" else (3840, 2160)
+    need = estimate_bytes(size, tuner.MAX_SEED_LEN if seed_len == "auto" else seed_len or 240, seed_fps)
+    need *= len(set(job["image"] for job in jobs))
+    if track_opts.get("muxer") == "native" or track_opts.get("audio_jobs", 1) > 1:
+        # Each running track stages its audio in the scratch directory too: at most the longest `workers` at once
+        durations = []
+        for job in jobs:
+            try:
+                durations.append(_probe(job)["duration"])
+            except Exception:
+                pass  # The track fails on its own in the pool
+        staged = sum(sorted(durations, reverse=True)[:workers])
+        need += audio_bytes(staged, int(r.normalize_bitrate(bitrate)[:-1]))
+    with pinning(cache), job_scratch(work_dir, ram_budget, need, prefix="staticvideo-batch-", log=log) as scratch:
+        # 1. One seed per distinct image
+        seeds = {}
+        seed_lens = {}
+        for image in dict.fromkeys(job["image"] for job in jobs):
+            seed_dir = tempfile.mkdtemp(dir=scratch)
+            start = time.monotonic()
+            try:
+                with metrics.collect(metrics_output, seed=True, image=image):
+                    seed_lens[image] = seed_len
+                    if seed_len == "auto":
+                        # One seed serves every track that uses this image, so tune for all of them
+                        durations = []
+                        for job in jobs:
+                            if job["image"] == image:
+                                durations.append(_probe(job)["duration"])
+                        with Image.open(image) as img:
+                            size = r.parse_resolution(res, img.size, portrait)
+                        seed_lens[image] = tuner.auto_seed_len(durations, size, seed_fps, log)
+                    seed_clip, _, _ = r.prepare_seed(image, res, seed_lens[image], portrait,
+                                                     frame_input=frame_input, work_dir=seed_dir, cache=cache,
+                                                     log=log, seed_fps=seed_fps, profile=profile,
+                                                     bframes=track_opts.get("muxer") != "native")
+                seeds[image] = seed_clip
+                log(f"Seed for {os.path.basename(image)} ready in {time.monotonic() - start:.1f}s")
+            except Exception as e:
+                seeds[image] = e
+
+        # 2. Per-track probe, audio encode and concat mux across the pool
+        # Each worker process gets its share of the thread budget, and a cache that leaves eviction to
+        # this process: it can't see the pins on the seeds the other tracks are still reading
+        worker_cache = cache.worker_copy() if cache else None
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(cpubudget.budget.config(workers),)) as pool:
+            futures = {}
+            for job in jobs:
+                seed = seeds[job["image"]]
+                if isinstance(seed, Exception):
+                    results.append((job, False, 0.0, f"seed failed: {seed}"))
+                    continue
+                os.makedirs(os.path.dirname(os.path.abspath(job["output"])), exist_ok=True)
+                track_dir = tempfile.mkdtemp(dir=scratch)
+                futures[pool.submit(_run_track, job, seed, seed_lens[job["image"]], bitrate,
+                                     track_dir, worker_cache, metrics_output, track_opts)] = job
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    duration, wall = future.result()
+                    results.append((job, True, wall, duration))
+                    log(f"Finished {job['output']} ({wall:.1f}s)")
+                except Exception as e:
+                    results.append((job, False, 0.0, str(e)))
+                    log(f"Failed {job['audio']}: {e}")
+    if cache:
+        cache.evict()
+
+    order = {id(job): i for i, job in enumerate(jobs)}
+    results.sort(key=lambda res: order[id(res[0])])
+    return results
+
+
+def format_summary(results, total_wall):
+    lines = [f"{'status':<7} {'wall':>8} {'audio':>9}  output"]
+    for job, ok, wall, detail in results:
+        if ok:
+            lines.append(f"{'ok':<7} {wall:>7.1f}s {detail:>8.1f}s  {job['output']}")
+        else:
+            lines.append(f"{'FAILED':<7} {'':>8} {'':>9}  {job['audio']}: {detail}")
+    done = sum(1 for res in results if res[1])
+    lines.append(f"{done}/{len(results)} rendered in {total_wall:.1f}s")
+    return "\n".join(lines)
@@ -0,0 +1,475 @@
+import os
+import sys
+import csv
+import json
+import math
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+
+from PIL import Image
+
+from . import render as r
+from . import codecs, cpubudget
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Measurements for comparing encode strategies on the current machine.
+
+
+def compare_seed_modes(image, res="1920x1080", seed_len=60, fps=1, audio_duration=3600, log=print):
+    """
+    Encode the same seed the standard way (ffmpeg's default rate) and as a
+    minimal-frame seed at fps, and return one row per mode with encode
+    time, file size, frame count and the packets the final mux would copy
+    for audio_duration seconds of audio.
+    """
+    scratch = tempfile.mkdtemp(prefix="staticvideo-seedcmp-")
+    rows = []
+    try:
+        for name, seed_fps in (("standard", None), (f"{fps:g} fps", r.parse_fps(fps))):
+            out = os.path.join(scratch, f"seed-{len(rows)}.mp4")
+            start = time.monotonic()
+            clip, _, _ = r.prepare_seed(image, res, seed_len, work_dir=scratch, log=lambda msg: None,
+                                        seed_fps=seed_fps)
+            wall = time.monotonic() - start
+            os.replace(clip, out)
+            frames = math.ceil(seed_len * (seed_fps or r.DEFAULT_SEED_FPS))
+            loops = math.ceil(audio_duration / seed_len)
+            rows.append({
+                "mode": name,
+                "encode_s": wall,
+                "seed_bytes": os.path.getsize(out),
+                "seed_frames": frames,
+                "mux_packets": frames * loops,
+                "mux_bytes": os.path.getsize(out) * loops,
+            })
+            log(f"{name}: {wall:.2f}s, {os.path.getsize(out)} bytes")
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    return rows
+
+
+def format_seed_comparison(rows, audio_duration):
+    lines = [f"{'mode':<10} {'encode':>8} {'seed size':>11} {'frames':>7} "
+             f"{'mux packets':>12} {'video bytes':>13}   (for {audio_duration:g}s of audio)"]
+    for row in rows:
+        lines.append(f"{row['mode']:<10} {row['encode_s']:>7.2f}s {row['seed_bytes']:>11} {row['seed_frames']:>7} "
+                     f"{row['mux_packets']:>12} {row['mux_bytes']:>13}")
+    return "\n".join(lines)
+
+
+def compare_profiles(image, res="1920x1080", seed_len=60, profiles=None, audio_duration=3600, seed_fps=None,
+                     log=print):
+    """
+    Encode the same seed with each seed profile (default: every one this
+    ffmpeg can do) and return one row per profile with encode time, seed
+    size and the video bytes of a final file of audio_duration seconds.
+    HEVC, AV1 and VP9 spend more than H.264 on each unchanged frame, so how
+    they compare depends a lot on seed_fps.
+    """
+    profiles = profiles or codecs.available_profiles()
+    scratch = tempfile.mkdtemp(prefix="staticvideo-profilecmp-")
+    rows = []
+    try:
+        for name in profiles:
+            start = time.monotonic()
+            clip, _, _ = r.prepare_seed(image, res, seed_len, work_dir=scratch, log=lambda msg: None,
+                                        seed_fps=seed_fps, profile=name)
+            wall = time.monotonic() - start
+            seed_bytes = os.path.getsize(clip)
+            os.remove(clip)
+            rows.append({
+                "profile": name,
+                "encoder": codecs.SEED_PROFILES[name]["encoder"],
+                "encode_s": wall,
+                "seed_bytes": seed_bytes,
+                "video_bytes": seed_bytes * math.ceil(audio_duration / seed_len),
+            })
+            log(f"{name}: {wall:.2f}s, {seed_bytes} bytes")
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    return rows
+
+
+def format_profile_comparison(rows, audio_duration):
+    base = next((row for row in rows if row["profile"] == codecs.DEFAULT_PROFILE), rows[0] if rows else None)
+    lines = [f"{'profile':<11} {'encoder':<11} {'encode':>8} {'seed size':>11} {'video bytes':>13} "
+             f"{'vs ' + base['profile'] if base else '':>9}   (for {audio_duration:g}s of audio)"]
+    for row in rows:
+        lines.append(f"{row['profile']:<11} {row['encoder']:<11} {row['encode_s']:>7.2f}s {row['seed_bytes']:>11} "
+                     f"{row['video_bytes']:>13} {row['video_bytes'] / max(base['video_bytes'], 1):>8.2f}x")
+    return "\n".join(lines)
+
+
+# Pipeline benchmark. Inputs are synthesized locally (lavfi audio, Pillow
+# images) so every machine and commit benchmarks the same thing. Each case
+# runs in a fresh Python process, so its RUSAGE_CHILDREN totals and peak RSS
+# belong to that case alone.
+#
+#   cli     the wavimg2mp4 script (create_static_video), as a subprocess
+#   worker  render() called the way the Qt VideoWorker calls it
+#   full    full_encode(), the Tk MediaProcessor's single-pass encode
+
+PIPELINES = ("cli", "worker", "full")
+AUDIO_KINDS = ("sine", "noise")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLI_SCRIPT = os.path.join(ROOT, "wavimg2mp4")
+RESULT_FIELDS = ("pipeline", "image", "res", "audio", "duration", "seed_len", "repeat",
+                 "ok", "error", "wall_s", "cpu_s", "child_cpu_s", "peak_rss_mb", "child_peak_rss_mb",
+                 "output_bytes", "output_duration", "commit", "ffmpeg", "machine", "started")
+
+
+def parse_duration(text):
+    """Seconds from '90', '90s', '10m' or '10h'."""
+    text = str(text).strip().lower()
+    for suffix, scale in (("h", 3600), ("m", 60), ("s", 1)):
+        if text.endswith(suffix):
+            return float(text[:-1]) * scale
+    return float(text)
+
+
+def synth_audio(path, duration, kind="sine"):
+    """Stereo FLAC of a 440Hz tone or pink noise, duration seconds long."""
+    if kind == "noise":
+        source = f"anoisesrc=color=pink:amplitude=0.2:sample_rate=44100:duration={duration:g}"
+    else:
+        source = f"sine=frequency=440:sample_rate=44100:duration={duration:g}"
+    r.ffmpeg('-f', 'lavfi', '-i', source, '-ac', '2', '-c:a', 'flac', path)
+
+
+def synth_image(path, size):
+    """A detailed (Mandelbrot) JPEG of the given size."""
+    img = Image.effect_mandelbrot(size, (-2.0, -1.2, 1.0, 1.2), 64)
+    Image.merge("RGB", (img, img.transpose(Image.FLIP_LEFT_RIGHT), img.transpose(Image.FLIP_TOP_BOTTOM))) \
+        .save(path, quality=90)
+
+
+def ensure_inputs(input_dir, durations, image_sizes, audio_kind="sine", log=print):
+    """Synthesize whatever inputs aren't in input_dir yet. Returns ({duration: path}, {size: path})."""
+    input_dir = os.path.abspath(input_dir)
+    os.makedirs(input_dir, exist_ok=True)
+    audio = {}
+    for duration in durations:
+        audio[duration] = os.path.join(input_dir, f"{audio_kind}-{duration:g}s.flac")
+        if not os.path.exists(audio[duration]):
+            log(f"Synthesizing {duration:g}s of {audio_kind} audio...")
+            tmp = audio[duration] + ".tmp.flac"
+            synth_audio(tmp, duration, audio_kind)
+            os.replace(tmp, audio[duration])
+    images = {}
+    for size in image_sizes:
+        images[size] = os.path.join(input_dir, f"image-{size[0]}x{size[1]}.jpg")
+        if not os.path.exists(images[size]):
+            log(f"Generating a {size[0]}x{size[1]} image...")
+            tmp = images[size] + ".tmp.jpg"
+            synth_image(tmp, size)
+            os.replace(tmp, images[size])
+    return audio, images
+
+
+def build_matrix(pipelines, audio, images, resolutions, seed_lens, repeats=1):
+    """One case dict per combination. The full encode has no seed, so it ignores seed_lens."""
+    cases = []
+    for repeat in range(repeats):
+        for pipeline in pipelines:
+            for image_size, image in images.items():
+                for res in resolutions:
+                    for duration, audio_path in audio.items():
+                        for seed_len in ([None] if pipeline == "full" else seed_lens):
+                            cases.append({"pipeline": pipeline, "audio": audio_path, "image": image,
+                                          "image_size": f"{image_size[0]}x{image_size[1]}", "res": res,
+                                          "duration": duration, "seed_len": seed_len, "repeat": repeat})
+    return cases
+
+
+def _maxrss_mb(usage):
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    return usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def _run_pipeline(case, output, work_dir):
+    quiet = lambda *a: None
+    threads = case.get("threads")
+    cpubudget.configure(threads=threads or 0)
+    if case["pipeline"] == "cli":
+        subprocess.run([sys.executable, CLI_SCRIPT, case["audio"], case["image"], output,
+                        "-r", case["res"], "-s", str(case["seed_len"]), "--no-cache",
+                        *(["--threads", str(threads)] if threads else [])],
+                       check=True, cwd=work_dir, capture_output=True)
+    elif case["pipeline"] == "worker":
+        r.set_ffmpeg_loglevel("error")
+        r.render(case["audio"], case["image"], output, case["res"], case["seed_len"],
+                 work_dir=work_dir, log=quiet, on_progress=quiet)
+    elif case["pipeline"] == "full":
+        r.set_ffmpeg_loglevel("error")
+        with Image.open(case["image"]) as img:
+            size = r.parse_resolution(case["res"], img.size)
+        r.full_encode(case["audio"], case["image"], output, size, log=quiet, on_log=quiet, on_progress=quiet)
+    else:
+        raise ValueError(f"Unknown pipeline {case['pipeline']!r}")
+
+
+def measure_case(case):
+    """Run one case in this process and return its measurements. Meant to be called in a fresh process."""
+    work_dir = tempfile.mkdtemp(prefix="staticvideo-bench-")
+    output = os.path.join(work_dir, "output.mp4")
+    result = {"ok": True, "error": ""}
+    try:
+        start = time.perf_counter()
+        try:
+            _run_pipeline(case, output, work_dir)
+        except subprocess.CalledProcessError as e:
+            # wavimg2mp4 reports its errors on stdout
+            detail = (e.stderr or b"") + (e.stdout or b"")
+            result.update(ok=False, error=detail.decode(errors="replace").strip()[-300:] or str(e))
+        except Exception as e:
+            result.update(ok=False, error=str(e))
+        result["wall_s"] = time.perf_counter() - start
+        if resource:
+            own = resource.getrusage(resource.RUSAGE_SELF)
+            children = resource.getrusage(resource.RUSAGE_CHILDREN)
+            result["cpu_s"] = own.ru_utime + own.ru_stime
+            result["child_cpu_s"] = children.ru_utime + children.ru_stime
+            result["peak_rss_mb"] = _maxrss_mb(own)
+            result["child_peak_rss_mb"] = _maxrss_mb(children)
+        if result["ok"]:
+            result["output_bytes"] = os.path.getsize(output)
+            result["output_duration"] = r.probe_duration(output)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return result
+
+
+def start_case(case):
+    """Start measure_case in a child interpreter, so resource usage isn't shared between cases."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])))
+    return subprocess.Popen([sys.executable, "-m", "staticvideo.bench", "--case", json.dumps(case)],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, env=env)
+
+
+def case_result(proc):
+    """The measurements of a start_case process, once it finishes."""
+    stdout, stderr = proc.communicate()
+    try:
+        return json.loads(stdout.strip().splitlines()[-1])
+    except (IndexError, ValueError):
+        return {"ok": False, "error": (stderr.strip() or "benchmark process failed")[-300:]}
+
+
+def run_case(case):
+    return case_result(start_case(case))
+
+
+def environment():
+    """Commit, ffmpeg version and machine, recorded with every row so result files can be compared."""
+    try:
+        commit = subprocess.run(["git", "-C", ROOT, "rev-parse", "--short", "HEAD"],
+                                capture_output=True, text=True).stdout.strip()
+        if commit and subprocess.run(["git", "-C", ROOT, "diff", "--quiet", "HEAD", "--", "."]).returncode:
+            commit += "-dirty"
+    except OSError:
+        commit = ""
+    try:
+        version = subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True).stdout.split("\n")[0]
+        ffmpeg_version = version.split()[2] if version.startswith("ffmpeg version") else version
+    except (OSError, IndexError):
+        ffmpeg_version = ""
+    return {"commit": commit, "ffmpeg": ffmpeg_version,
+            "machine": f"{platform.system()} {platform.machine()} {os.cpu_count()} cores"}
+
+
+def write_results(rows, path):
+    """CSV, or JSON if path ends in .json."""
+    tmp = path + ".tmp"
+    with open(tmp, "w", newline="") as f:
+        if path.lower().endswith(".json"):
+            json.dump(rows, f, indent=2)
+        else:
+            writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(rows)
+    os.replace(tmp, path)
+
+
+def read_results(path):
+    if path.lower().endswith(".json"):
+        with open(path) as f:
+            return json.load(f)
+    with open(path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    for row in rows:
+        row["ok"] = row.get("ok") == "True"
+        for key in ("wall_s", "cpu_s", "child_cpu_s", "peak_rss_mb", "child_peak_rss_mb", "output_bytes"):
+            row[key] = float(row[key]) if row.get(key) else None
+    return rows
+
+
+def run_benchmark(cases, output, log=print):
+    """Run the cases one at a time, rewriting output after each so a long run keeps partial results."""
+    env = environment()
+    started = datetime.now().isoformat(timespec="seconds")
+    rows = []
+    for i, case in enumerate(cases, 1):
+        label = (f"{case['pipeline']} {case['image_size']} -> {case['res']}, {case['duration']:g}s audio"
+                 + (f", {case['seed_len']}s seed" if case["seed_len"] else ""))
+        log(f"[{i}/{len(cases)}] {label}")
+        result = run_case(case)
+        row = {**{k: "" for k in RESULT_FIELDS}, **case, "image": case["image_size"],
+               "audio": os.path.basename(case["audio"]), "seed_len": case["seed_len"] or "",
+               **env, "started": started, **result}
+        rows.append(row)
+        if row["ok"]:
+            log(f"    {row['wall_s']:.2f}s wall, {row.get('child_cpu_s') or 0:.2f}s ffmpeg CPU, "
+                f"{row.get('child_peak_rss_mb') or 0:.0f}MB peak, {row['output_bytes']} bytes")
+        else:
+            log(f"    FAILED: {row['error']}")
+        write_results(rows, output)
+    return rows
+
+
+# Throughput benchmark: the same case run 1, 2, 4, 8... times at once, once
+# with ffmpeg's own threading in every process and once with the cores
+# split between them by the thread budget (see cpubudget), which is what
+# batch and watch workers, the server and the Qt queue do. Aggregate
+# throughput is seconds of audio rendered per second of wall time.
+
+THROUGHPUT_MODES = ("ffmpeg", "budget")
+THROUGHPUT_FIELDS = ("pipeline", "image", "res", "audio", "duration", "seed_len", "jobs", "mode", "threads",
+                     "ok", "wall_s", "child_cpu_s", "throughput", "commit", "ffmpeg", "machine", "started")
+
+
+def run_throughput(case, levels, output, log=print):
+    """Run case at each concurrency level in levels, in both THROUGHPUT_MODES. Returns the rows."""
+    env = environment()
+    started = datetime.now().isoformat(timespec="seconds")
+    cpus = cpubudget.available_cpus()
+    rows = []
+    for jobs in levels:
+        for mode in THROUGHPUT_MODES:
+            threads = max(1, cpus // jobs) if mode == "budget" else None
+            start = time.perf_counter()
+            procs = [start_case({**case, "threads": threads}) for _ in range(jobs)]
+            results = [case_result(proc) for proc in procs]
+            wall = time.perf_counter() - start
+            ok = all(result["ok"] for result in results)
+            row = {**{k: "" for k in THROUGHPUT_FIELDS}, **case, "image": case["image_size"],
+                   "audio": os.path.basename(case["audio"]), "seed_len": case["seed_len"] or "",
+                   "jobs": jobs, "mode": mode, "threads": threads or "", "ok": ok, "wall_s": wall,
+                   "child_cpu_s": sum(result.get("child_cpu_s") or 0 for result in results),
+                   "throughput": jobs * case["duration"] / wall if ok else 0.0, **env, "started": started}
+            rows.append(row)
+            if ok:
+                log(f"{jobs} at once, {mode} threads: {wall:.2f}s, {row['throughput']:.0f}s of audio per second")
+            else:
+                log(f"{jobs} at once, {mode} threads: FAILED: "
+                    + next(result["error"] for result in results if not result["ok"]))
+            tmp = output + ".tmp"
+            with open(tmp, "w", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=THROUGHPUT_FIELDS, extrasaction="ignore")
+                writer.writeheader()
+                writer.writerows(rows)
+            os.replace(tmp, output)
+    return rows
+
+
+def format_throughput(rows):
+    by_key = {(row["jobs"], row["mode"]): row for row in rows}
+    lines = [f"{'jobs':>4} {'ffmpeg threads':>16} {'budget':>16} {'gain':>6}   (seconds of audio per second)"]
+    for jobs in sorted({row["jobs"] for row in rows}):
+        plain, budget = by_key.get((jobs, "ffmpeg")), by_key.get((jobs, "budget"))
+        cells = [f"{row['throughput']:>16.1f}" if row and row["ok"] else f"{'failed':>16}" for row in (plain, budget)]
+        gain = (f"{budget['throughput'] / plain['throughput']:>5.2f}x"
+                if plain and budget and plain["ok"] and budget["ok"] else "")
+        lines.append(f"{jobs:>4} {cells[0]} {cells[1]} {gain:>6}")
+    return "\n".join(lines)
+
+
+def _case_key(row):
+    return (row["pipeline"], row["image"], row["res"], float(row["duration"]), str(row["seed_len"]))
+
+
+def compare_results(old_rows, new_rows):
+    """Table of median wall time per case in both runs, with the new/old ratio."""
+    def medians(rows):
+        walls = {}
+        for row in rows:
+            if row["ok"] and row["wall_s"] is not None:
+                walls.setdefault(_case_key(row), []).append(row["wall_s"])
+        return {key: sorted(v)[len(v) // 2] for key, v in walls.items()}
+
+    old, new = medians(old_rows), medians(new_rows)
+    lines = [f"{'pipeline':<7} {'image':>10} {'res':>10} {'audio':>7} {'seed':>5} {'old':>9} {'new':>9} {'ratio':>6}"]
+    for key in sorted(old.keys() & new.keys()):
+        pipeline, image, res, duration, seed_len = key
+        lines.append(f"{pipeline:<7} {image:>10} {res:>10} {duration:>6g}s {seed_len or '-':>5} "
+                     f"{old[key]:>8.2f}s {new[key]:>8.2f}s {new[key] / old[key]:>6.2f}")
+    missing = len(old.keys() ^ new.keys())
+    if missing:
+        lines.append(f"({missing} cases only in one of the runs)")
+    return "\n".join(lines)
+
+
+def _list(text, convert=str):
+    return [convert(item) for item in text.split(",") if item.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m staticvideo.bench",
+                                     description="Benchmark the rendering pipelines on synthesized inputs.")
+    parser.add_argument("-o", "--output", default="bench-results.csv",
+                        help="Results file, CSV or .json (default: bench-results.csv)")
+    parser.add_argument("--pipelines", default=",".join(PIPELINES),
+                        help=f"Comma separated, from {', '.join(PIPELINES)} (default: all)")
+    parser.add_argument("--durations", default="1m,10m",
+                        help="Audio durations, e.g. 1m,10m,1h,10h (default: 1m,10m)")
+    parser.add_argument("--res", default="1280x720,1920x1080", help="Output resolutions (default: 1280x720,1920x1080)")
+    parser.add_argument("--seed-lens", default="10,60", help="Seed lengths in seconds (default: 10,60)")
+    parser.add_argument("--image-sizes", default="1600x1200,6000x4000",
+                        help="Sizes of the generated source images (default: 1600x1200,6000x4000)")
+    parser.add_argument("--audio-kind", choices=AUDIO_KINDS, default="sine",
+                        help="Synthesized audio; noise makes much larger FLAC inputs (default: sine)")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs of each case (default: 1)")
+    parser.add_argument("--input-dir", default="bench-inputs",
+                        help="Where synthesized inputs are kept between runs (default: bench-inputs)")
+    parser.add_argument("--concurrency", metavar="LEVELS",
+                        help="Throughput benchmark instead: run the first case this many times at once, e.g. "
+                             "1,2,4,8, with ffmpeg's own threads and with the thread budget")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two results files and exit")
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.case:
+        print(json.dumps(measure_case(json.loads(args.case))))
+        return 0
+    if args.compare:
+        print(compare_results(read_results(args.compare[0]), read_results(args.compare[1])))
+        return 0
+
+    r.set_ffmpeg_loglevel("error")
+    pipelines = _list(args.pipelines)
+    for pipeline in pipelines:
+        if pipeline not in PIPELINES:
+            parser.error(f"unknown pipeline {pipeline!r}")
+    durations = _list(args.durations, parse_duration)
+    image_sizes = [r.parse_resolution(size) for size in _list(args.image_sizes)]
+    audio, images = ensure_inputs(args.input_dir, durations, image_sizes, args.audio_kind)
+    cases = build_matrix(pipelines, audio, images, _list(args.res), _list(args.seed_lens, int), args.repeat)
+    if args.concurrency:
+        rows = run_throughput(cases[0], _list(args.concurrency, int), args.output)
+        print(format_throughput(rows))
+        return 0 if all(row["ok"] for row in rows) else 1
+    rows = run_benchmark(cases, args.output)
+    print(f"{sum(1 for row in rows if row['ok'])}/{len(rows)} cases ok, results in {args.output}")
+    return 0 if all(row["ok"] for row in rows) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
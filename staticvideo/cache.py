@@ -0,0 +1,167 @@
+import os
+import re
+import hashlib
+import uuid
+import contextvars
+from contextlib import contextmanager
+
+# Content addressed store for the expensive intermediates: the encoded
+# seed clip and the AAC encode of the audio. Entries are plain files named
+# after a sha256 of the inputs plus the encode parameters, so a warm run
+# only has to do the stream-copy concat. Recency is tracked with the file
+# mtime (touched on every hit) and the oldest entries are evicted once the
+# total size goes over the cap.
+#
+# Entries a job is using are pinned, so another job's store() can't evict
+# them halfway through the concat. Pins belong to the job: pinning() holds
+# them in a context variable, which thread pools working for the job carry
+# along (see metrics.propagate), and drops only that job's pins at the end.
+# Pins live in memory, so worker processes get a copy that doesn't evict
+# (see MediaCache.worker_copy) and the parent evicts once they are done.
+
+DEFAULT_MAX_BYTES = 4 * 1024 ** 3
+
+_digests = {}
+_job_pins = contextvars.ContextVar("staticvideo_cache_pins", default=None)
+
+
+def default_cache_dir():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "staticvideo")
+
+
+def parse_size(text):
+    """Parse sizes like '4G', '500M', '1024' into bytes."""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([kKmMgGtT]?)i?[bB]?\s*", str(text))
+    if not match:
+        raise ValueError(f"Invalid size: {text!r} (use e.g. 500M or 4G)")
+    scale = {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+    return int(float(match.group(1)) * scale[match.group(2).lower()])
+
+
+def file_digest(path):
+    """sha256 of a file's bytes, memoized by (path, size, mtime)."""
+    st = os.stat(path)
+    memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    if memo_key not in _digests:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        _digests[memo_key] = h.hexdigest()
+    return _digests[memo_key]
+
+
+class MediaCache:
+    def __init__(self, root=None, max_bytes=DEFAULT_MAX_BYTES, auto_evict=True):
+        self.root = os.path.abspath(os.path.expanduser(root or default_cache_dir()))
+        self.max_bytes = max_bytes
+        self.auto_evict = auto_evict
+        self._jobs = {}  # id -> pin set of each job in a pinning() block
+        os.makedirs(self.root, exist_ok=True)
+
+    def worker_copy(self):
+        """The same cache for a worker process: it stores entries but leaves eviction to this process."""
+        return MediaCache(self.root, self.max_bytes, auto_evict=False)
+
+    @staticmethod
+    def key(*parts):
+        """Hash the given parts (digests, numbers, strings) into a cache key."""
+        h = hashlib.sha256()
+        for part in parts:
+            h.update(repr(part).encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def path(self, key, ext):
+        return os.path.join(self.root, key + ext)
+
+    def lookup(self, key, ext):
+        """Return the cached file for key, or None. A hit refreshes its LRU position."""
+        path = self.path(key, ext)
+        if not os.path.exists(path):
+            return None
+        os.utime(path)
+        self._pin(path)
+        return path
+
+    def store(self, key, ext, produce):
+        """
+        Call produce(tmp_path) to create the entry, then move it into place.
+        The temp name is unique so concurrent jobs never see half written files.
+        """
+        path = self.path(key, ext)
+        tmp = os.path.join(self.root, f".{key}.{uuid.uuid4().hex}.tmp{ext}")
+        try:
+            produce(tmp)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        self._pin(path)
+        if self.auto_evict:
+            self.evict()
+        return path
+
+    def _pin(self, path):
+        pins = _job_pins.get()
+        if pins is not None:
+            pins.add(path)
+
+    def pinned(self):
+        return set().union(*list(self._jobs.values()))
+
+    def entries(self):
+        result = []
+        for name in os.listdir(self.root):
+            if name.startswith("."):
+                continue
+            path = os.path.join(self.root, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            result.append((st.st_mtime, st.st_size, path))
+        return result
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes."""
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        pinned = self.pinned()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path in pinned:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        for _, _, path in self.entries():
+            os.remove(path)
+
+
+@contextmanager
+def pinning(cache):
+    """
+    Keep the entries cache (a MediaCache or None) hands out in this block
+    pinned until it ends, then unpin them; other jobs' pins are untouched.
+    """
+    if cache is None:
+        yield
+        return
+    pins = set()
+    token = _job_pins.set(pins)
+    cache._jobs[id(pins)] = pins
+    try:
+        yield
+    finally:
+        del cache._jobs[id(pins)]
+        _job_pins.reset(token)
@@ -0,0 +1,184 @@
+import os
+import re
+import json
+import math
+import shutil
+import subprocess
+
+from .cache import default_cache_dir
+
+# Seed profiles. The seed is only a few seconds of video, so a slow preset
+# or a more efficient codec costs little to encode once, but the final file
+# repeats the seed's bytes for every loop, so whatever the seed saves is
+# saved (audio duration / seed length) times over. Which profiles can be
+# used depends on the encoders this ffmpeg was built with, found by parsing
+# `ffmpeg -encoders` once and remembering the answer per ffmpeg binary.
+#
+# Seeds are always MP4 (every codec here fits in it, and the native muxer
+# needs one); what the final file can hold depends on its extension, see
+# CONTAINERS.
+
+DEFAULT_PROFILE = "x264"
+
+# "long_gop": one keyframe for the whole seed. Each loop of the seed then
+# costs one keyframe plus near-empty inter frames, at the price of seeking
+# to the seed's start.
+SEED_PROFILES = {
+    "x264": {
+        "encoder": "libx264", "codec": "h264", "long_gop": False,
+        "args": [], "preset": True,  # render's preset argument
+        "label": "H.264, fast preset (the default)",
+    },
+    "x264-still": {
+        "encoder": "libx264", "codec": "h264", "long_gop": True,
+        "args": ['-preset', 'veryslow', '-tune', 'stillimage', '-crf', '26'],
+        "label": "H.264, veryslow preset tuned for still images",
+    },
+    "x265": {
+        "encoder": "libx265", "codec": "hevc", "long_gop": True,
+        "args": ['-preset', 'slow', '-x265-params', 'log-level=error', '-tag:v', 'hvc1'],
+        "label": "HEVC, slow preset",
+    },
+    "av1": {
+        "encoder": "libsvtav1", "codec": "av1", "long_gop": True,
+        "args": ['-preset', '6', '-crf', '30'],
+        "label": "AV1 with SVT-AV1",
+    },
+    "av1-aom": {
+        "encoder": "libaom-av1", "codec": "av1", "long_gop": True,
+        "args": ['-cpu-used', '4', '-row-mt', '1', '-crf', '30', '-b:v', '0'],
+        "label": "AV1 with libaom",
+    },
+    "vp9": {
+        "encoder": "libvpx-vp9", "codec": "vp9", "long_gop": True,
+        "args": ['-deadline', 'good', '-cpu-used', '2', '-row-mt', '1', '-crf', '31', '-b:v', '0'],
+        "label": "VP9 with libvpx, constant quality",
+    },
+}
+
+# What each output container can carry. "video" is None for any codec;
+# audio not in "audio" is encoded with audio_encoder into an audio_ext file.
+_MP4 = {"video": {"h264", "hevc", "av1", "vp9"}, "audio": {"aac", "alac", "mp3"},
+        "audio_encoder": "aac", "audio_ext": ".m4a", "mp4": True}
+CONTAINERS = {
+    ".mp4": _MP4, ".m4v": _MP4, ".mov": _MP4,
+    ".mkv": {"video": None, "audio": {"aac", "alac", "mp3", "opus", "vorbis", "flac"},
+             "audio_encoder": "aac", "audio_ext": ".m4a", "mp4": False},
+    ".webm": {"video": {"vp9", "av1"}, "audio": {"opus", "vorbis"},
+              "audio_encoder": "libopus", "audio_ext": ".webm", "mp4": False},
+}
+
+_encoders = {}
+
+
+def _encoders_file():
+    # Dot name: MediaCache ignores those, so the probe isn't counted, evicted or cleared with the cache entries
+    return os.path.join(default_cache_dir(), ".encoders.json")
+
+
+def parse_encoders(text):
+    """Names of the encoders in `ffmpeg -encoders` output."""
+    names = set()
+    for line in text.splitlines():
+        match = re.match(r"\s*[VAS][A-Z.]{5}\s+(\S+)", line)
+        if match and match.group(1) != "=":
+            names.add(match.group(1))
+    return names
+
+
+def available_encoders(ffmpeg="ffmpeg"):
+    """
+    Encoders ffmpeg was built with. Probed once per binary and kept on disk
+    keyed by its path, size and mtime, so it is redone only when ffmpeg is
+    replaced.
+    """
+    path = shutil.which(ffmpeg) or ffmpeg
+    try:
+        st = os.stat(path)
+        binary = f"{os.path.realpath(path)}|{st.st_size}|{st.st_mtime_ns}"
+    except OSError:
+        binary = path
+    if binary in _encoders:
+        return _encoders[binary]
+
+    stored = {}
+    try:
+        with open(_encoders_file()) as f:
+            stored = json.load(f)
+    except (OSError, ValueError):
+        pass
+    if binary in stored:
+        _encoders[binary] = set(stored[binary])
+        return _encoders[binary]
+
+    out = subprocess.run([path, '-hide_banner', '-encoders'], capture_output=True, text=True, check=True).stdout
+    _encoders[binary] = parse_encoders(out)
+    stored[binary] = sorted(_encoders[binary])
+    try:
+        os.makedirs(os.path.dirname(_encoders_file()), exist_ok=True)
+        tmp = _encoders_file() + f".{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(stored, f)
+        os.replace(tmp, _encoders_file())
+    except OSError:
+        pass  # Just probe again next time
+    return _encoders[binary]
+
+
+def available_profiles():
+    """Names of the seed profiles whose encoder this ffmpeg has, in SEED_PROFILES order."""
+    encoders = available_encoders()
+    return [name for name, p in SEED_PROFILES.items() if p["encoder"] in encoders]
+
+
+def get_profile(name):
+    """The profile called name; ValueError if it is unknown or its encoder is missing."""
+    name = name or DEFAULT_PROFILE
+    if name not in SEED_PROFILES:
+        raise ValueError(f"Unknown seed profile {name!r} (use one of {', '.join(SEED_PROFILES)})")
+    profile = SEED_PROFILES[name]
+    if name != DEFAULT_PROFILE and profile["encoder"] not in available_encoders():
+        raise ValueError(f"Seed profile {name!r} needs {profile['encoder']}, which this ffmpeg doesn't have "
+                         f"(available: {', '.join(available_profiles())})")
+    return profile
+
+
+def seed_video_args(name, preset, seed_len, fps=None, bframes=True):
+    """
+    Encoder arguments for a seed with profile name. preset only applies to
+    the default profile; bframes=False turns off frame reordering, for seeds
+    that are cut short (the concat demuxer cuts by decode time).
+    """
+    profile = get_profile(name)
+    args = ['-c:v', profile["encoder"], *profile["args"]]
+    if profile.get("preset"):
+        args += ['-preset', preset]
+    if not bframes:
+        args += ['-bf', '0']
+    if profile["long_gop"] and not fps:
+        # With an fps, seed_rate_args already asks for a single keyframe
+        frames = max(1, math.ceil(seed_len * 25))  # ffmpeg's default rate
+        args += ['-g', str(frames), '-keyint_min', str(frames)]
+    return args
+
+
+def container(output):
+    """The CONTAINERS entry for output's extension (MP4 rules for anything unknown)."""
+    return CONTAINERS.get(os.path.splitext(output)[1].lower(), _MP4)
+
+
+def check_output(name, output):
+    """Raise ValueError if output's container can't hold video from profile name."""
+    codec = get_profile(name)["codec"]
+    allowed = container(output)["video"]
+    if allowed is not None and codec not in allowed:
+        ext = os.path.splitext(output)[1] or "this container"
+        fits = [p for p in SEED_PROFILES if SEED_PROFILES[p]["codec"] in allowed]
+        raise ValueError(f"{ext} can't hold {codec} video (seed profiles for it: {', '.join(fits)})")
+
+
+def mux_video_args(name, output):
+    """Video arguments for the final stream-copy pass into output."""
+    if get_profile(name)["codec"] == "hevc" and container(output)["mp4"]:
+        return ['-c:v', 'copy', '-tag:v', 'hvc1']  # Apple players only take hvc1
+    return ['-c:v', 'copy']
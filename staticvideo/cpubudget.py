@@ -0,0 +1,146 @@
+import os
+import threading
+import subprocess
+from contextlib import contextmanager
+
+# CPU budget for the ffmpeg processes the package starts. ffmpeg sizes its
+# thread pools (libx264's frame threads, the filter graph) for the whole
+# machine, so several renders at once (batch and watch workers, server and
+# daemon jobs, the Qt queue, slideshow seeds, split audio) each start about
+# a thread per core and the machine spends the difference switching
+# between them. The budget splits `threads` between the ffmpeg processes
+# running at once, or the `jobs` expected to run at once if that is more,
+# and each gets its share as -threads and -filter_threads. One job with the
+# whole machine keeps ffmpeg's own threading.
+#
+# Background renders can also have their ffmpeg processes niced and pinned
+# to some CPUs, so the GUIs and everything else on the machine stay
+# responsive. Both are applied to each ffmpeg after it starts, which is
+# safe from threads (a preexec_fn isn't).
+
+# Niceness the GUIs give their ffmpeg processes
+BACKGROUND_NICE = 10
+
+
+def available_cpus():
+    """Number of CPUs this process may run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # macOS, Windows
+        return os.cpu_count() or 1
+
+
+def parse_cpus(text):
+    """Sorted CPU numbers from a list like '0-3,6'. Raises ValueError."""
+    cpus = set()
+    for part in str(text).split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        if not first.isdigit() or (last and not last.isdigit()):
+            raise ValueError(f"Bad CPU list {text!r} (use e.g. 0-3,6)")
+        cpus.update(range(int(first), int(last or first) + 1))
+    if not cpus:
+        raise ValueError(f"Bad CPU list {text!r} (use e.g. 0-3,6)")
+    return sorted(cpus)
+
+
+class ThreadBudget:
+    """
+    threads to share between ffmpeg processes, with at least jobs of them
+    expected at once; nice and cpus (a list of CPU numbers) apply to each.
+    """
+
+    def __init__(self, threads=None, jobs=1, nice=0, cpus=None):
+        self.lock = threading.Lock()
+        self.running = 0
+        self.extra = 0
+        self.cpus = list(cpus) if cpus else None
+        self.threads = threads or len(self.cpus or []) or available_cpus()
+        self.jobs = max(1, jobs)
+        self.nice = nice
+
+    def configure(self, threads=None, jobs=None, nice=None, cpus=None):
+        """Change the given settings; threads 0 means one per CPU allowed."""
+        with self.lock:
+            if cpus is not None:
+                self.cpus = list(cpus) or None
+            if threads is not None or cpus is not None:
+                self.threads = threads or len(self.cpus or []) or available_cpus()
+            if jobs is not None:
+                self.jobs = max(1, jobs)
+            if nice is not None:
+                self.nice = nice
+
+    def config(self, workers=1):
+        """Settings for a worker process that is one of workers, for init_worker."""
+        return {"threads": max(1, self.threads // max(1, workers)), "jobs": 1, "nice": self.nice,
+                "cpus": self.cpus}
+
+    @contextmanager
+    def parallel(self, count):
+        """Within this block, count more processes than usual run at once (as for split work)."""
+        with self.lock:
+            self.extra += count - 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.extra -= count - 1
+
+    @contextmanager
+    def slot(self):
+        """Count one running ffmpeg for the block; yields its thread share."""
+        with self.lock:
+            self.running += 1
+            share = max(1, self.threads // max(self.jobs + self.extra, self.running))
+        try:
+            yield share
+        finally:
+            with self.lock:
+                self.running -= 1
+
+    def ffmpeg_args(self, cmd, share):
+        """cmd with the thread options for share added, or as it is if share is the whole machine."""
+        if share >= available_cpus():
+            return cmd
+        # -filter_threads is global; -threads before the output file sets the encoder's
+        return [cmd[0], '-filter_threads', str(share), *cmd[1:-1], '-threads', str(share), cmd[-1]]
+
+    def popen_kwargs(self):
+        if os.name == "nt" and self.nice > 0:
+            return {"creationflags": subprocess.BELOW_NORMAL_PRIORITY_CLASS}
+        return {}
+
+    def apply(self, pid):
+        """Nice and pin a started process. Best effort: it may already have exited."""
+        try:
+            if self.nice and hasattr(os, "setpriority"):
+                current = os.getpriority(os.PRIO_PROCESS, pid)
+                os.setpriority(os.PRIO_PROCESS, pid, min(19, current + self.nice))
+            if self.cpus and hasattr(os, "sched_setaffinity"):
+                os.sched_setaffinity(pid, self.cpus)
+        except OSError:
+            pass
+
+    def describe(self):
+        parts = [f"{self.threads} threads" + (f" for {self.jobs} jobs" if self.jobs > 1 else "")]
+        if self.nice:
+            parts.append(f"nice {self.nice}")
+        if self.cpus:
+            parts.append(f"CPUs {','.join(str(cpu) for cpu in self.cpus)}")
+        return ", ".join(parts)
+
+
+budget = ThreadBudget()
+
+
+def configure(threads=None, jobs=None, nice=None, cpus=None):
+    """Configure this process's budget (see ThreadBudget)."""
+    budget.configure(threads, jobs, nice, cpus)
+
+
+def init_worker(config):
+    """ProcessPoolExecutor initializer part: take a budget.config() in a worker process."""
+    budget.configure(**config)
@@ -0,0 +1,216 @@
+import os
+import json
+import time
+import select
+import socket
+import argparse
+import tempfile
+import threading
+
+from .progress import format_progress
+
+# Warm render daemon. `wavimg2mp4 --daemon` stays running with the render
+# pipeline imported, the encoder probe done and the audio metadata memo
+# filling up, and `wavimg2mp4 --use-daemon ...` becomes a thin client that
+# hands its command line to it over a Unix socket, prints what comes back
+# and exits with the job's status. This module only imports the standard
+# library (and .progress), so the client starts without loading Pillow or
+# the rest of the package.
+#
+# One JSON object per line. The client sends {"argv": [...], "cwd": "..."}
+# and gets back {"print": line} (stdout), {"progress": line} (the updating
+# progress line on stderr) and finally {"exit": status}.
+
+PROGRESS_INTERVAL = 0.2
+
+
+class RequestError(ValueError):
+    """A command line the daemon won't run; reported to the client with exit status 2."""
+
+
+class Cancelled(Exception):
+    """The client went away or the daemon is stopping; raised out of the job's callbacks."""
+
+
+def default_socket_path():
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime and os.path.isdir(runtime):
+        return os.path.join(runtime, "staticvideo.sock")
+    return os.path.join(tempfile.gettempdir(), f"staticvideo-{os.getuid()}.sock")
+
+
+def client_request(argv):
+    """(socket path, argv) if argv asks for the daemon with --use-daemon, else None."""
+    if "--use-daemon" not in argv or "-h" in argv or "--help" in argv:
+        return None
+    pre = argparse.ArgumentParser(add_help=False)
+    pre.add_argument("--use-daemon", action="store_true")
+    pre.add_argument("--socket", default=default_socket_path())
+    known, rest = pre.parse_known_args(argv)
+    return known.socket, rest
+
+
+def run_client(path, argv):
+    """
+    Run argv on the daemon listening at path and show its output. Returns
+    the job's exit status, or None if no daemon is listening there.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+    progress_shown = False
+    tty = os.isatty(2)
+    with sock:
+        try:
+            sock.sendall(json.dumps({"argv": argv, "cwd": os.getcwd()}).encode() + b"\n")
+            for line in sock.makefile("rb"):
+                message = json.loads(line)
+                if "progress" in message:
+                    if tty:
+                        os.write(2, ("\r" + message["progress"].ljust(79)).encode())
+                        progress_shown = True
+                    continue
+                if progress_shown:
+                    os.write(2, b"\n")
+                    progress_shown = False
+                if "print" in message:
+                    print(message["print"], flush=True)
+                if "exit" in message:
+                    return message["exit"]
+        except KeyboardInterrupt:
+            # Closing the socket makes the daemon stop the job and clean up
+            print("\n[!] Interrupted")
+            return 1
+        except (OSError, ValueError) as e:
+            print(f"[!] Lost the render daemon: {e}")
+            return 1
+    print("[!] The render daemon closed the connection")
+    return 1
+
+
+def _peer_closed(conn):
+    readable, _, _ = select.select([conn], [], [], 0)
+    return bool(readable) and conn.recv(1, socket.MSG_PEEK) == b""
+
+
+class RenderDaemon:
+    """
+    Accepts clients on a Unix socket, one thread each. At most `concurrency`
+    jobs run at once; the others wait for a slot. run_job(argv, cwd, say,
+    on_progress) runs one command line and returns its exit status: say
+    prints a line on the client, on_progress takes ProgressTracker dicts.
+    Both raise Cancelled once the client is gone, which stops the render.
+    """
+
+    def __init__(self, path, run_job, concurrency=2, log=print):
+        self.path = path
+        self.run_job = run_job
+        self.concurrency = concurrency
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.stopping = threading.Event()
+        self.log = log
+        self.jobs = 0
+        self.lock = threading.Lock()
+        self.threads = []
+
+    def _listen(self):
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+            except OSError:
+                os.unlink(self.path)  # Left behind by a daemon that died
+            else:
+                raise OSError(f"a daemon is already listening on {self.path}")
+            finally:
+                probe.close()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Jobs run with our permissions on paths the client names, so only our user may connect
+        umask = os.umask(0o077)
+        try:
+            sock.bind(self.path)
+        finally:
+            os.umask(umask)
+        sock.listen(16)
+        return sock
+
+    def serve_forever(self):
+        """Accept clients until interrupted, then stop running jobs and remove the socket."""
+        listener = self._listen()
+        self.log(f"Render daemon on {self.path} ({self.concurrency} jobs at once)")
+        try:
+            while True:
+                conn, _ = listener.accept()
+                thread = threading.Thread(target=self._client, args=(conn,), daemon=True)
+                thread.start()
+                self.threads = [t for t in self.threads if t.is_alive()] + [thread]
+        finally:
+            listener.close()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+            self.stopping.set()
+            for thread in self.threads:
+                thread.join()
+
+    def _client(self, conn):
+        with self.lock:
+            self.jobs += 1
+            job = self.jobs
+        send_lock = threading.Lock()
+        last_progress = [0.0]
+
+        def send(message):
+            if self.stopping.is_set():
+                raise Cancelled("the daemon is stopping")
+            try:
+                with send_lock:
+                    conn.sendall(json.dumps(message).encode() + b"\n")
+            except OSError:
+                raise Cancelled("the client went away")
+
+        def on_progress(info):
+            now = time.monotonic()
+            if now - last_progress[0] < PROGRESS_INTERVAL and info["stage_fraction"] < 1:
+                return
+            last_progress[0] = now
+            send({"progress": format_progress(info)})
+
+        with conn:
+            try:
+                try:
+                    request = json.loads(conn.makefile("rb").readline() or b"null")
+                except ValueError:
+                    request = None
+                if not isinstance(request, dict) or not isinstance(request.get("argv"), list):
+                    send({"print": "[!] Bad request"})
+                    return send({"exit": 2})
+                if not self.slots.acquire(blocking=False):
+                    send({"print": "[*] Waiting for a free render slot"})
+                    while not self.slots.acquire(timeout=0.5):
+                        if self.stopping.is_set() or _peer_closed(conn):
+                            raise Cancelled("gave up waiting")
+                try:
+                    self.log(f"Job {job}: {' '.join(request['argv'])}")
+                    start = time.monotonic()
+                    try:
+                        status = self.run_job(request["argv"], request.get("cwd") or os.sep,
+                                              lambda line: send({"print": line}), on_progress)
+                    except RequestError as e:
+                        send({"print": f"[!] {e}"})
+                        status = 2
+                    self.log(f"Job {job} exited {status} after {time.monotonic() - start:.1f}s")
+                finally:
+                    self.slots.release()
+                send({"exit": status})
+            except Cancelled as e:
+                self.log(f"Job {job} stopped: {e}")
+
+
+def serve(path=None, run_job=None, concurrency=2, log=print):
+    """Run a RenderDaemon on path (default_socket_path()) until interrupted."""
+    RenderDaemon(path or default_socket_path(), run_job, concurrency, log).serve_forever()
@@ -0,0 +1,204 @@
+import os
+import sys
+import json
+import time
+import threading
+import contextvars
+from datetime import datetime
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Per-stage metrics of a render job, written as one JSON line per job.
+# A front end wraps the job in collect(); the pipeline marks its stages
+# with stage() (a no-op outside collect) and the job's ffmpeg processes
+# report their resource use when run_ffmpeg reaps them. The current job and
+# stage live in context variables, so concurrent jobs on other threads
+# (the Qt queue, server and daemon jobs) keep their own numbers; pools
+# working for a job wrap their tasks with propagate().
+#
+# For each stage: wall time, CPU time of the thread running it, CPU time
+# and peak RSS of the ffmpeg processes it ran, this process's peak RSS so
+# far, and the bytes of the files the stage read and wrote. Stages that run
+# more than once (cleanup, parallel seeds) are added together.
+
+STAGE_FIELDS = ("wall_s", "cpu_s", "child_cpu_s", "bytes_read", "bytes_written")
+
+_job = contextvars.ContextVar("staticvideo_metrics_job", default=None)
+_stage = contextvars.ContextVar("staticvideo_metrics_stage", default=None)
+_write_lock = threading.Lock()
+
+
+def _rss_mb(usage):
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    return usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def peak_rss_mb():
+    """This process's peak resident memory in MB, or None where that isn't available."""
+    return _rss_mb(resource.getrusage(resource.RUSAGE_SELF)) if resource else None
+
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except (OSError, TypeError):
+        return 0
+
+
+class Stage:
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.values = dict.fromkeys(STAGE_FIELDS, 0)
+        self.values.update(child_peak_rss_mb=0.0, peak_rss_mb=None)
+        self.start = time.monotonic()
+        self.cpu_start = time.thread_time()
+
+    def add(self, **values):
+        with self.lock:
+            for key, value in values.items():
+                if value is None:
+                    continue
+                if key.endswith("peak_rss_mb"):
+                    self.values[key] = max(self.values[key] or 0.0, value)
+                else:
+                    self.values[key] += value
+
+    def finish(self):
+        self.add(wall_s=time.monotonic() - self.start, cpu_s=time.thread_time() - self.cpu_start)
+        peak = peak_rss_mb()
+        if peak is not None:
+            self.add(peak_rss_mb=peak)
+
+
+class JobMetrics:
+    """The stages of one job, in the order they first ran, and the job's record once it ends."""
+
+    def __init__(self, info):
+        self.info = info
+        self.stages = {}
+        self.lock = threading.Lock()
+        self.started = datetime.now().isoformat(timespec="seconds")
+        self.start = time.monotonic()
+        self.record = None
+
+    def add_stage(self, stage):
+        with self.lock:
+            total = self.stages.setdefault(stage.name, Stage(stage.name))
+        total.add(**stage.values)
+
+    def finish(self, error=None):
+        stages = [{"stage": name, **{key: round(value, 3) if isinstance(value, float) else value
+                                     for key, value in stage.values.items()}}
+                  for name, stage in self.stages.items()]
+        totals = {key: sum(s[key] for s in stages) for key in STAGE_FIELDS}
+        self.record = {
+            **self.info, "started": self.started, "ok": error is None, "error": error,
+            "wall_s": round(time.monotonic() - self.start, 3),
+            **{key: round(value, 3) for key, value in totals.items() if key != "wall_s"},
+            "peak_rss_mb": peak_rss_mb(),
+            "child_peak_rss_mb": max((s["child_peak_rss_mb"] for s in stages), default=0.0),
+            "stages": stages,
+        }
+        return self.record
+
+
+@contextmanager
+def collect(destination=None, **info):
+    """
+    Collect the stages run in this block (in this thread) as one job, info
+    being fields for its record (audio, image, output...). Yields the
+    JobMetrics, whose record is set when the block ends, however it ends;
+    destination (a path to append to, "-" for stdout, or a callable taking
+    the record) gets it too.
+    """
+    job = JobMetrics(info)
+    token = _job.set(job)
+    error = None
+    try:
+        yield job
+    except BaseException as e:
+        error = str(e) or type(e).__name__
+        raise
+    finally:
+        _job.reset(token)
+        write_record(job.finish(error), destination)
+
+
+@contextmanager
+def stage(name):
+    """Time the block as stage name of the current job (if any). Yields the Stage, or None."""
+    job = _job.get()
+    if job is None:
+        yield None
+        return
+    current = Stage(name)
+    token = _stage.set(current)
+    try:
+        yield current
+    finally:
+        _stage.reset(token)
+        current.finish()
+        job.add_stage(current)
+
+
+def count_io(read=0, written=0):
+    """Add bytes read and written to the current stage."""
+    current = _stage.get()
+    if current:
+        current.add(bytes_read=read, bytes_written=written)
+
+
+def child_usage(usage):
+    """Add a reaped child process's rusage (from os.wait4) to the current stage."""
+    current = _stage.get()
+    if current:
+        current.add(child_cpu_s=usage.ru_utime + usage.ru_stime, child_peak_rss_mb=_rss_mb(usage))
+
+
+def propagate(fn):
+    """fn, run in the current job and stage wherever it is called (for thread pools)."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
+
+
+def write_record(record, destination):
+    if not destination:
+        return
+    if callable(destination):
+        destination(record)
+        return
+    line = json.dumps(record) + "\n"
+    with _write_lock:
+        if destination == "-":
+            sys.stdout.write(line)
+            sys.stdout.flush()
+        else:
+            # One append per line, so processes sharing the file don't interleave records
+            with open(destination, "a") as f:
+                f.write(line)
+
+
+def _size(count):
+    for unit in ("B", "kB", "MB", "GB"):
+        if count < 1000 or unit == "GB":
+            return f"{count:.0f} {unit}" if unit == "B" else f"{count:.1f} {unit}"
+        count /= 1000
+
+
+def format_breakdown(record):
+    """Table of a job record's stages, for logs and the GUIs."""
+    lines = [f"{'stage':<12} {'wall':>8} {'cpu':>7} {'ffmpeg cpu':>10} {'ffmpeg rss':>10} {'read':>9} "
+             f"{'written':>9}"]
+    for s in record["stages"]:
+        lines.append(f"{s['stage']:<12} {s['wall_s']:>7.2f}s {s['cpu_s']:>6.2f}s {s['child_cpu_s']:>9.2f}s "
+                     f"{s['child_peak_rss_mb']:>7.0f} MB {_size(s['bytes_read']):>9} "
+                     f"{_size(s['bytes_written']):>9}")
+    peak = f", peak memory {record['peak_rss_mb']:.0f} MB" if record.get("peak_rss_mb") else ""
+    lines.append(f"{'total':<12} {record['wall_s']:>7.2f}s {record['cpu_s']:>6.2f}s "
+                 f"{record['child_cpu_s']:>9.2f}s{peak}")
+    return "\n".join(lines)
@@ -0,0 +1,480 @@
+import io
+import json
+import struct
+import subprocess
+
+# A small ISO-BMFF (MP4) muxer for the one thing this project does: a
+# video track that is the same seed clip over and over, plus an audio track.
+#
+# Instead of asking the concat demuxer to copy the seed's bytes once per
+# loop, the seed's encoded samples are stored in mdat once and every loop
+# is a chunk whose stco offset points back at that same data. The sample
+# tables (stts/stsz/stsc/stco/stss/ctts) still describe every frame of the
+# whole video, so players see an ordinary MP4, but the file and the time
+# taken to write it are close to those of the audio alone.
+
+MOVIE_TIMESCALE = 1000
+UNITY_MATRIX = struct.pack(">9I", 0x10000, 0, 0, 0, 0x10000, 0, 0, 0, 0x40000000)
+COPY_BLOCK = 1 << 20
+
+
+class Mp4Error(Exception):
+    pass
+
+
+# --- Reading -------------------------------------------------------------
+# iter_boxes, find_box and read_top_level are also audioinfo's MP4 reader.
+
+def iter_boxes(data, start=0, end=None):
+    """Yield (type, box_start, payload_start, box_end) for the boxes in data[start:end]."""
+    end = len(data) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size, typ = struct.unpack_from(">I4s", data, pos)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", data, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            raise Mp4Error(f"Corrupt box {typ!r} at {pos}")
+        yield typ.decode("latin-1"), pos, pos + header, pos + size
+        pos += size
+
+
+def _locate(data, path, start=0, end=None):
+    """(box_start, payload_start, box_end) of the first box along path, e.g. 'mdia/minf/stbl', or None."""
+    head, _, rest = path.partition("/")
+    for typ, box_start, payload, box_end in iter_boxes(data, start, end):
+        if typ == head:
+            return _locate(data, rest, payload, box_end) if rest else (box_start, payload, box_end)
+    return None
+
+
+def find_box(data, path, start=0, end=None):
+    """Payload (start, end) of the first box along path, or None."""
+    found = _locate(data, path, start, end)
+    return found[1:] if found else None
+
+
+def _raw(data, path, start=0, end=None):
+    """The whole box along path (header included) as bytes, or None."""
+    found = _locate(data, path, start, end)
+    return bytes(data[found[0]:found[2]]) if found else None
+
+
+def read_top_level(f):
+    """Return {type: (offset, size)} for the top level boxes of a file."""
+    boxes = {}
+    f.seek(0, io.SEEK_END)
+    file_size = f.tell()
+    pos = 0
+    while pos + 8 <= file_size:
+        f.seek(pos)
+        size, typ = struct.unpack(">I4s", f.read(8))
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+        elif size == 0:
+            size = file_size - pos
+        if size < 8:
+            raise Mp4Error(f"Corrupt top level box {typ!r}")
+        boxes.setdefault(typ.decode("latin-1"), (pos, size))
+        pos += size
+    return boxes
+
+
+class Track:
+    """The sample tables of one track, expanded to per-sample lists."""
+
+    def __init__(self, moov, start, end):
+        mdhd = find_box(moov, "mdia/mdhd", start, end)
+        hdlr = find_box(moov, "mdia/hdlr", start, end)
+        stbl = find_box(moov, "mdia/minf/stbl", start, end)
+        if not (mdhd and hdlr and stbl):
+            raise Mp4Error("Track without mdhd/hdlr/stbl")
+
+        version = moov[mdhd[0]]
+        if version == 1:
+            self.timescale, = struct.unpack_from(">I", moov, mdhd[0] + 20)
+            self.language = moov[mdhd[0] + 32:mdhd[0] + 34]
+        else:
+            self.timescale, = struct.unpack_from(">I", moov, mdhd[0] + 12)
+            self.language = moov[mdhd[0] + 20:mdhd[0] + 22]
+        self.handler = moov[hdlr[0] + 8:hdlr[0] + 12].decode("latin-1")
+
+        tkhd = find_box(moov, "tkhd", start, end)
+        tail_at = tkhd[0] + (36 if moov[tkhd[0]] == 1 else 24)
+        self.tkhd_tail = moov[tail_at:tail_at + 60]
+
+        self.hdlr_box = _raw(moov, "mdia/hdlr", start, end)
+        self.media_header_box = (_raw(moov, "mdia/minf/vmhd", start, end)
+                                 or _raw(moov, "mdia/minf/smhd", start, end)
+                                 or _raw(moov, "mdia/minf/nmhd", start, end))
+        self.dinf_box = _raw(moov, "mdia/minf/dinf", start, end)
+        self.stsd_box = _raw(moov, "mdia/minf/stbl/stsd", start, end)
+
+        self.media_time = None
+        elst = find_box(moov, "edts/elst", start, end)
+        if elst:
+            version = moov[elst[0]]
+            count, = struct.unpack_from(">I", moov, elst[0] + 4)
+            pos = elst[0] + 8
+            for _ in range(count):
+                if version == 1:
+                    _, media_time = struct.unpack_from(">Qq", moov, pos)
+                    pos += 20
+                else:
+                    _, media_time = struct.unpack_from(">Ii", moov, pos)
+                    pos += 12
+                if media_time >= 0:     # skip empty edits
+                    self.media_time = media_time
+                    break
+
+        s, e = stbl
+        self.durations = []
+        payload = find_box(moov, "stts", s, e)[0]
+        count, = struct.unpack_from(">I", moov, payload + 4)
+        for i in range(count):
+            n, delta = struct.unpack_from(">II", moov, payload + 8 + 8 * i)
+            self.durations.extend([delta] * n)
+
+        payload = find_box(moov, "stsz", s, e)[0]
+        uniform, count = struct.unpack_from(">II", moov, payload + 4)
+        self.sizes = [uniform] * count if uniform else list(struct.unpack_from(f">{count}I", moov, payload + 12))
+
+        found = find_box(moov, "stco", s, e)
+        if found:
+            count, = struct.unpack_from(">I", moov, found[0] + 4)
+            chunk_offsets = struct.unpack_from(f">{count}I", moov, found[0] + 8)
+        else:
+            found = find_box(moov, "co64", s, e)
+            count, = struct.unpack_from(">I", moov, found[0] + 4)
+            chunk_offsets = struct.unpack_from(f">{count}Q", moov, found[0] + 8)
+
+        payload = find_box(moov, "stsc", s, e)[0]
+        count, = struct.unpack_from(">I", moov, payload + 4)
+        stsc = [struct.unpack_from(">III", moov, payload + 8 + 12 * i) for i in range(count)]
+        self.offsets = []
+        sample = 0
+        for i, (first_chunk, per_chunk, _) in enumerate(stsc):
+            last_chunk = stsc[i + 1][0] - 1 if i + 1 < len(stsc) else len(chunk_offsets)
+            for chunk in range(first_chunk - 1, last_chunk):
+                pos = chunk_offsets[chunk]
+                for _ in range(per_chunk):
+                    if sample >= len(self.sizes):
+                        break
+                    self.offsets.append(pos)
+                    pos += self.sizes[sample]
+                    sample += 1
+
+        self.ctts = None
+        self.ctts_version = 0
+        found = find_box(moov, "ctts", s, e)
+        if found:
+            self.ctts_version = moov[found[0]]
+            count, = struct.unpack_from(">I", moov, found[0] + 4)
+            fmt = ">Ii" if self.ctts_version == 1 else ">II"
+            self.ctts = []
+            for i in range(count):
+                n, offset = struct.unpack_from(fmt, moov, found[0] + 8 + 8 * i)
+                self.ctts.extend([offset] * n)
+
+        self.sync = None
+        found = find_box(moov, "stss", s, e)
+        if found:
+            count, = struct.unpack_from(">I", moov, found[0] + 4)
+            self.sync = list(struct.unpack_from(f">{count}I", moov, found[0] + 8))
+
+        if not (len(self.sizes) == len(self.durations) == len(self.offsets)):
+            raise Mp4Error(f"Inconsistent sample tables in {self.handler} track")
+
+
+def read_tracks(path):
+    with open(path, "rb") as f:
+        top = read_top_level(f)
+        if "moov" not in top:
+            raise Mp4Error(f"No moov box in {path}")
+        offset, size = top["moov"]
+        f.seek(offset)
+        moov = f.read(size)
+    _, payload, end = _locate(moov, "moov")
+    return [Track(moov, p, e) for t, _, p, e in iter_boxes(moov, payload, end) if t == "trak"]
+
+
+def _track(path, handler):
+    for track in read_tracks(path):
+        if track.handler == handler:
+            return track
+    raise Mp4Error(f"No {handler} track in {path}")
+
+
+# --- Writing -------------------------------------------------------------
+
+def _box(typ, *payloads):
+    body = b"".join(payloads)
+    return struct.pack(">I4s", 8 + len(body), typ.encode("latin-1")) + body
+
+
+def _full_box(typ, version, flags, *payloads):
+    return _box(typ, struct.pack(">I", (version << 24) | flags), *payloads)
+
+
+def _run_length(values):
+    runs = []
+    for v in values:
+        if runs and runs[-1][1] == v:
+            runs[-1][0] += 1
+        else:
+            runs.append([1, v])
+    return runs
+
+
+def _stbl(track, durations, sizes, chunks, ctts, sync):
+    """
+    chunks is a list of (offset, samples_in_chunk). ctts and sync (1-based
+    sample numbers) may be None.
+    """
+    boxes = [track.stsd_box]
+
+    runs = _run_length(durations)
+    boxes.append(_full_box("stts", 0, 0, struct.pack(">I", len(runs)),
+                           b"".join(struct.pack(">II", n, d) for n, d in runs)))
+
+    if ctts is not None:
+        runs = _run_length(ctts)
+        fmt = ">Ii" if track.ctts_version == 1 else ">II"
+        boxes.append(_full_box("ctts", track.ctts_version, 0, struct.pack(">I", len(runs)),
+                               b"".join(struct.pack(fmt, n, o) for n, o in runs)))
+
+    if sync is not None:
+        boxes.append(_full_box("stss", 0, 0, struct.pack(f">I{len(sync)}I", len(sync), *sync)))
+
+    stsc = []
+    for i, (_, per_chunk) in enumerate(chunks):
+        if not stsc or stsc[-1][1] != per_chunk:
+            stsc.append((i + 1, per_chunk))
+    boxes.append(_full_box("stsc", 0, 0, struct.pack(">I", len(stsc)),
+                           b"".join(struct.pack(">III", first, n, 1) for first, n in stsc)))
+
+    boxes.append(_full_box("stsz", 0, 0, struct.pack(f">II{len(sizes)}I", 0, len(sizes), *sizes)))
+
+    offsets = [offset for offset, _ in chunks]
+    if offsets and max(offsets) > 0xFFFFFFFF:
+        boxes.append(_full_box("co64", 0, 0, struct.pack(f">I{len(offsets)}Q", len(offsets), *offsets)))
+    else:
+        boxes.append(_full_box("stco", 0, 0, struct.pack(f">I{len(offsets)}I", len(offsets), *offsets)))
+    return _box("stbl", *boxes)
+
+
+def _presented(track, media_duration, durations, ctts):
+    """How much of the media timeline the track's edit list shows, in media units."""
+    end = media_duration
+    if ctts is not None:
+        # Reordered frames end where the last one in composition order does
+        dts = end = 0
+        for duration, offset in zip(durations, ctts):
+            end = max(end, dts + offset + duration)
+            dts += duration
+    return end - (track.media_time or 0)
+
+
+def _trak(track_id, track, media_duration, durations, sizes, chunks, ctts=None, sync=None):
+    movie_duration = _presented(track, media_duration, durations, ctts) * MOVIE_TIMESCALE // track.timescale
+    version = 1 if max(media_duration, movie_duration) > 0xFFFFFFFF else 0
+    if version:
+        tkhd_head = struct.pack(">QQIIQ", 0, 0, track_id, 0, movie_duration)
+        mdhd_body = struct.pack(">QQIQ", 0, 0, track.timescale, media_duration)
+    else:
+        tkhd_head = struct.pack(">IIIII", 0, 0, track_id, 0, movie_duration)
+        mdhd_body = struct.pack(">IIII", 0, 0, track.timescale, media_duration)
+
+    boxes = [_full_box("tkhd", version, 3, tkhd_head, track.tkhd_tail)]
+    if track.media_time is not None:
+        boxes.append(_box("edts", _full_box("elst", 1, 0, struct.pack(">IQqI", 1, movie_duration,
+                                                                      track.media_time, 0x10000))))
+    minf = _box("minf", track.media_header_box, track.dinf_box,
+                _stbl(track, durations, sizes, chunks, ctts, sync))
+    mdia = _box("mdia", _full_box("mdhd", version, 0, mdhd_body, track.language, b"\0\0"),
+                track.hdlr_box, minf)
+    boxes.append(mdia)
+    return _box("trak", *boxes), movie_duration
+
+
+def _copy_samples(src, out, offsets, sizes):
+    """Copy samples in order, coalescing runs that are contiguous in the source."""
+    i = 0
+    while i < len(offsets):
+        start = offsets[i]
+        length = sizes[i]
+        i += 1
+        while i < len(offsets) and offsets[i] == start + length:
+            length += sizes[i]
+            i += 1
+        src.seek(start)
+        while length:
+            block = src.read(min(length, COPY_BLOCK))
+            if not block:
+                raise Mp4Error("Sample data runs past the end of the file")
+            out.write(block)
+            length -= len(block)
+
+
+def samples_per_second(path, handler="vide"):
+    """Average sample (frame) rate of path's track with this handler."""
+    track = _track(path, handler)
+    return len(track.sizes) * track.timescale / max(sum(track.durations), 1)
+
+
+def _cut_points(track):
+    """
+    The sample counts after which a loop of track can end without leaving
+    a gap: with frame reordering (ctts), every frame shown before the cut
+    must also be decoded before it. Without ctts that is every count.
+    """
+    n = len(track.sizes)
+    if track.ctts is None:
+        return set(range(1, n + 1))
+    pts = []
+    dts = 0
+    for duration, offset in zip(track.durations, track.ctts):
+        pts.append(dts + offset)
+        dts += duration
+    # later[k] is the earliest frame still to come after k samples
+    later = pts[:]
+    for i in range(n - 2, -1, -1):
+        later[i] = min(later[i], later[i + 1])
+    cuts = {n}
+    shown = pts[0]
+    for k in range(1, n):
+        shown = max(shown, pts[k - 1])
+        if shown < later[k]:
+            cuts.add(k)
+    return cuts
+
+
+# ftyp compatible brand for each video sample entry
+_CODEC_BRANDS = {b"avc1": b"avc1", b"avc3": b"avc1", b"hvc1": b"hvc1", b"hev1": b"hvc1",
+                 b"av01": b"av01", b"vp09": b"vp09"}
+
+
+def mux_looped(seed_path, audio_path, output, duration, faststart=False):
+    """
+    Write output (a path or a binary file object) with the seed's video
+    looped for duration seconds, sharing one stored copy of the seed's
+    samples, and the whole audio track of audio_path (an MP4/M4A). With
+    faststart the moov goes before the mdat, which also means the file is
+    written strictly in order and can go to a pipe. Returns the number of
+    times the seed repeats.
+    """
+    video = _track(seed_path, "vide")
+    audio = _track(audio_path, "soun")
+
+    # Video sample tables for every loop, cut at the audio duration. A seed
+    # with B-frames can only be cut where its composition order is complete,
+    # so the last loop runs on to the next such point instead of being trimmed.
+    target = round(duration * video.timescale)
+    n = len(video.sizes)
+    cuts = _cut_points(video)
+    durations, sizes, ctts, sync = [], [], [] if video.ctts else None, [] if video.sync else None
+    total = 0
+    loops = 0
+    while total < target:
+        for i in range(n):
+            if total >= target and i in cuts:
+                break
+            d = video.durations[i] if ctts is not None else min(video.durations[i], target - total)
+            durations.append(d)
+            sizes.append(video.sizes[i])
+            if ctts is not None:
+                ctts.append(video.ctts[i])
+            total += d
+        if sync is not None:
+            sync.extend(loops * n + s for s in video.sync if loops * n + s <= len(sizes))
+        loops += 1
+    if not sizes:
+        raise Mp4Error("Nothing to write: duration is zero")
+
+    entry = video.stsd_box[20:24]
+    brands = [b"isom", b"iso2", *([_CODEC_BRANDS[entry]] if entry in _CODEC_BRANDS else []), b"mp41"]
+    ftyp = _box("ftyp", b"isom", struct.pack(">I", 512), *brands)
+    mdat_header = 16
+    video_bytes = sum(video.sizes)
+
+    def moov(data_start):
+        """The moov for sample data starting at file offset data_start."""
+        video_base = data_start
+        audio_base = video_base + video_bytes
+
+        # Every loop is one chunk pointing at the same stored samples
+        video_chunks = [(video_base, n)] * (len(sizes) // n)
+        if len(sizes) % n:
+            video_chunks.append((video_base, len(sizes) % n))
+
+        # Audio is laid out contiguously, so chunk it at about one per second
+        per_chunk = max(1, audio.timescale // max(1, audio.durations[0] if audio.durations else 1))
+        audio_chunks = []
+        pos = audio_base
+        for i in range(0, len(audio.sizes), per_chunk):
+            group = audio.sizes[i:i + per_chunk]
+            audio_chunks.append((pos, len(group)))
+            pos += sum(group)
+
+        video_trak, video_movie = _trak(1, video, total, durations, sizes, video_chunks, ctts, sync)
+        audio_trak, audio_movie = _trak(2, audio, sum(audio.durations), audio.durations, audio.sizes,
+                                        audio_chunks, audio.ctts, audio.sync)
+        mvhd = _full_box("mvhd", 1, 0,
+                         struct.pack(">QQIQ", 0, 0, MOVIE_TIMESCALE, max(video_movie, audio_movie)),
+                         struct.pack(">IH10x", 0x10000, 0x100), UNITY_MATRIX, bytes(24), struct.pack(">I", 3))
+        return _box("moov", mvhd, video_trak, audio_trak)
+
+    head = b""
+    if faststart:
+        # The offsets only change the moov's size by switching stco to co64, so this settles at once
+        size = -1
+        while len(head) != size:
+            size = len(head)
+            head = moov(len(ftyp) + size + mdat_header)
+
+    out = output if hasattr(output, "write") else open(output, "wb")
+    try:
+        out.write(ftyp)
+        out.write(head)
+        out.write(struct.pack(">I4sQ", 1, b"mdat", mdat_header + video_bytes + sum(audio.sizes)))
+        with open(seed_path, "rb") as src:
+            _copy_samples(src, out, video.offsets, video.sizes)
+        with open(audio_path, "rb") as src:
+            _copy_samples(src, out, audio.offsets, audio.sizes)
+        if not faststart:
+            out.write(moov(len(ftyp) + mdat_header))
+        out.flush()
+    finally:
+        if out is not output:
+            out.close()
+    return loops
+
+
+def verify(path, expected_duration, tolerance=0.5):
+    """
+    Check a muxed file with ffprobe: one video and one audio stream,
+    both about expected_duration long. Returns a list of problems (empty
+    when the file looks fine).
+    """
+    cmd = ['ffprobe', '-v', 'error', '-show_entries',
+           'stream=codec_type,codec_name,duration:format=duration', '-of', 'json', path]
+    try:
+        data = json.loads(subprocess.check_output(cmd, stderr=subprocess.STDOUT))
+    except subprocess.CalledProcessError as e:
+        return [f"ffprobe failed: {e.output.decode(errors='replace').strip()}"]
+
+    problems = []
+    streams = {s.get("codec_type"): s for s in data.get("streams", [])}
+    for kind in ("video", "audio"):
+        stream = streams.get(kind)
+        if not stream:
+            problems.append(f"no {kind} stream")
+            continue
+        stream_duration = float(stream.get("duration") or data["format"].get("duration") or 0)
+        if abs(stream_duration - expected_duration) > tolerance:
+            problems.append(f"{kind} is {stream_duration:.2f}s, expected {expected_duration:.2f}s")
+    return problems
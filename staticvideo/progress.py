@@ -0,0 +1,148 @@
+import time
+import threading
+
+# Progress reporting. ffmpeg is run with `-progress pipe:1`, which writes
+# key=value blocks ending in progress=continue/end. ProgressTracker turns the
+# out_time of each stage into a per-stage and overall fraction, using the
+# media duration each stage is known to cover, plus speed and ETA.
+
+# Rough media-seconds per wall-second for each stage, only used to weight
+# the stages against each other in the overall percentage.
+TYPICAL_SPEED = {"seed": 10.0, "audio": 60.0, "mux": 300.0, "encode": 10.0}
+STAGE_LABELS = {"seed": "Encoding seed", "audio": "Encoding audio", "mux": "Muxing", "encode": "Encoding"}
+
+
+def parse_progress(lines):
+    """Yield {'time': seconds, 'speed': float or None, 'done': bool} per -progress block."""
+    block = {}
+    for line in lines:
+        key, sep, value = line.strip().partition("=")
+        if not sep:
+            continue
+        block[key] = value.strip()
+        if key == "progress":
+            us = block.get("out_time_us") or block.get("out_time_ms")
+            try:
+                seconds = max(int(us) / 1e6, 0.0)
+            except (TypeError, ValueError):
+                seconds = 0.0
+            try:
+                speed = float(block.get("speed", "").rstrip("x"))
+            except ValueError:
+                speed = None
+            yield {"time": seconds, "speed": speed, "done": value.strip() == "end"}
+            block = {}
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "--:--"
+    seconds = int(seconds)
+    h, rem = divmod(seconds, 3600)
+    m, s = divmod(rem, 60)
+    return f"{h}:{m:02d}:{s:02d}" if h else f"{m}:{s:02d}"
+
+
+def format_timings(timings):
+    """'seed 1.2s, audio 0.0s, mux 3.4s' in the order the stages ran."""
+    return ", ".join(f"{name} {seconds:.1f}s" for name, seconds in timings.items())
+
+
+def format_progress(info):
+    text = f"{STAGE_LABELS.get(info['stage'], info['stage'])} {info['stage_fraction'] * 100:5.1f}%"
+    if info.get("speed"):
+        text += f" | {info['speed']:.1f}x realtime"
+    text += f" | overall {info['overall'] * 100:5.1f}% | ETA {format_eta(info.get('eta'))}"
+    return text
+
+
+class ProgressTracker:
+    """
+    Collects ffmpeg progress from the stages of one job and passes dicts with
+    stage, stage_fraction, overall (0..1), speed (x realtime), eta (seconds,
+    or None) and timings to callback. Stages run one after another, so a
+    stage's timing is the wall time from the previous stage finishing (or
+    the start) to it finishing or being skipped.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.stages = {}
+        self.speeds = {}
+        self.fractions = {}
+        self.timings = {}
+        self.start = self.mark = time.monotonic()
+
+    def plan(self, name, media_seconds, speed=None):
+        """
+        Announce a stage and how many seconds of media it will produce;
+        speed overrides its TYPICAL_SPEED for weighting.
+        """
+        self.stages[name] = max(float(media_seconds), 1e-3)
+        self.speeds[name] = speed or TYPICAL_SPEED.get(name, 60.0)
+
+    def _weight(self, name):
+        return self.stages[name] / self.speeds[name]
+
+    def overall(self):
+        total = sum(self._weight(n) for n in self.stages) or 1.0
+        done = sum(self._weight(n) * self.fractions.get(n, 0.0) for n in self.stages)
+        return min(done / total, 1.0)
+
+    def stage(self, name):
+        """Callback for run_ffmpeg's on_progress that reports updates for this stage."""
+        if name not in self.stages:
+            self.plan(name, 1)
+        media = self.stages[name]
+
+        def update(p):
+            fraction = 1.0 if p["done"] else min(p["time"] / media, 1.0)
+            self.fractions[name] = fraction
+            if p["done"]: self._finish(name)
+            self._emit(name, fraction, p["speed"])
+        return update
+
+    def parts(self, name, keys):
+        """
+        Callbacks for pieces of a stage that run at the same time (parallel
+        seeds or audio ranges): ({key: on_progress}, finished(key)). Their
+        times add up to the stage's, which is done once every key finished.
+        """
+        update = self.stage(name)
+        lock = threading.Lock()
+        times = dict.fromkeys(keys, 0.0)
+        done = set()
+
+        def report():
+            update({"time": sum(times.values()), "speed": None, "done": len(done) == len(times)})
+
+        def on_progress(key):
+            def progress(p):
+                with lock:
+                    times[key] = p["time"]
+                    report()
+            return progress
+
+        def finished(key):
+            with lock:
+                done.add(key)
+                report()
+        return {key: on_progress(key) for key in keys}, finished
+
+    def skip(self, name):
+        """A planned stage that turned out not to be needed (e.g. a cache hit)."""
+        self.fractions[name] = 1.0
+        self._finish(name)
+        self._emit(name, 1.0, None)
+
+    def _finish(self, name):
+        now = time.monotonic()
+        self.timings[name] = now - self.mark
+        self.mark = now
+
+    def _emit(self, name, fraction, speed):
+        overall = self.overall()
+        elapsed = time.monotonic() - self.start
+        eta = elapsed / overall * (1 - overall) if overall > 0.01 else None
+        self.callback({"stage": name, "stage_fraction": fraction, "overall": overall,
+                       "speed": speed, "eta": eta, "timings": dict(self.timings)})
@@ -0,0 +1,768 @@
+import os
+import re
+import sys
+import math
+import time
+import json
+import threading
+import subprocess
+from PIL import Image
+
+from .cache import file_digest, pinning
+from . import mp4mux, tuner, codecs, audioinfo, audiochunks, metrics
+from .cpubudget import budget as thread_budget
+from .progress import parse_progress, ProgressTracker, TYPICAL_SPEED
+from .scratch import job_scratch, atomic_output, estimate_bytes
+from .thumbnail import fit_size, decode_reduced
+from .metrics import peak_rss_mb
+
+DEFAULT_PRESET = "veryfast"
+DEFAULT_PIX_FMT = "yuv420p"
+
+# Audio codecs the MP4 container can carry as-is. With the "auto" policy
+# these are stream copied instead of re-encoded to AAC.
+MP4_AUDIO_CODECS = {"aac", "alac", "mp3"}
+AUDIO_ENCODER_NAMES = {"aac": "AAC", "libopus": "Opus"}
+AUDIO_POLICIES = ("auto", "copy", "encode")
+
+# Final pass: ffmpeg's concat demuxer (copies the seed's bytes once per loop)
+# or mp4mux, which stores the seed once and points every loop at it.
+MUXERS = ("concat", "native")
+MP4_AUDIO_EXTS = {".m4a", ".mp4", ".m4b", ".mov"}
+
+# How the letterboxed canvas reaches ffmpeg: as a raw frame on stdin
+# (yuv420p converted by Pillow, or rgb24 converted by ffmpeg), or the
+# old way via a temporary PNG that ffmpeg decodes and rescales.
+FRAME_INPUTS = ("yuv420p", "rgb24", "png")
+DEFAULT_FRAME_INPUT = "yuv420p"
+
+# ffmpeg's default frame rate, used for seeds unless a minimal-frame seed
+# (see seed_rate_args) is asked for.
+DEFAULT_SEED_FPS = 25
+
+# Layout of the final MP4. "plain" has the index (moov) at the end, as
+# ffmpeg writes it by default. "faststart" puts it first, so players and
+# upload processing can start before the whole file has arrived; it is
+# written in the same pass, into space reserved from the known duration.
+# "fragmented" is a run of moof/mdat fragments that never needs seeking
+# back, so it can go to a pipe. STREAM_OUTPUT as the output name means
+# stdout.
+LAYOUTS = ("plain", "faststart", "fragmented")
+STREAM_OUTPUT = "-"
+
+# "From Image" output is capped at 4K (landscape, or its portrait
+# equivalent), so a 100MP scan doesn't become a 100MP video frame.
+MAX_IMAGE_SIZE = (3840, 2160)
+
+# BT.601 studio range, which is what libx264 and players expect for yuv420p.
+_LUMA_LUT = [round(16 + v * 219 / 255) for v in range(256)]
+_CHROMA_LUT = [round(16 + v * 224 / 255) for v in range(256)]
+
+_audio_info = {}
+
+
+def probe_duration(path):
+    cmd = ['ffprobe', '-v', 'error', '-show_entries', 'format=duration',
+           '-of', 'default=noprint_wrappers=1:nokey=1', path]
+    return float(subprocess.check_output(cmd))
+
+
+def ffprobe_audio(path):
+    """probe_audio's answer from ffprobe, for files audioinfo can't read."""
+    cmd = ['ffprobe', '-v', 'error', '-select_streams', 'a:0',
+           '-show_entries', 'stream=codec_name,sample_rate,channels,channel_layout:format=duration',
+           '-of', 'json', path]
+    data = json.loads(subprocess.check_output(cmd))
+    streams = data.get("streams") or [{}]
+    stream = streams[0]
+    return {
+        "duration": float(data["format"]["duration"]),
+        "codec": stream.get("codec_name"),
+        "sample_rate": int(stream.get("sample_rate") or 0),
+        "channels": int(stream.get("channels") or 0),
+        "channel_layout": stream.get("channel_layout"),
+    }
+
+
+def probe_audio(path):
+    """
+    Duration, codec, sample rate and channel layout of the first audio
+    stream. Read from the header for WAV/AIFF/FLAC/MP3/M4A (see audioinfo),
+    with one ffprobe call for anything else; memoized by (path, size, mtime).
+    """
+    st = os.stat(path)
+    memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    if memo_key not in _audio_info:
+        _audio_info[memo_key] = audioinfo.read_header(path) or ffprobe_audio(path)
+    return dict(_audio_info[memo_key])
+
+
+def describe_audio(info):
+    layout = info.get("channel_layout") or f"{info.get('channels')}ch"
+    return f"{info.get('codec')} {info.get('sample_rate')} Hz {layout}"
+
+
+def choose_audio_mode(info, policy="auto", copyable=MP4_AUDIO_CODECS):
+    """Return 'copy' or 'encode' for the audio stream under the given policy."""
+    policy = policy.lower()
+    if policy not in AUDIO_POLICIES:
+        raise ValueError(f"Unknown audio policy {policy!r} (use one of {', '.join(AUDIO_POLICIES)})")
+    if policy != "auto":
+        return policy
+    if info.get("codec") in copyable and info.get("sample_rate") and info.get("channels"):
+        return "copy"
+    return "encode"
+
+
+def parse_resolution(res, image_size=None, portrait=False):
+    """Turn '1920x1080' (or 'From Image') into an even (width, height)."""
+    if res == "From Image":
+        w, h = image_size
+        if w * h > MAX_IMAGE_SIZE[0] * MAX_IMAGE_SIZE[1]:
+            w, h = fit_size((w, h), MAX_IMAGE_SIZE if w >= h else MAX_IMAGE_SIZE[::-1])
+    else:
+        match = re.match(r"(\d+)\s*[xX]\s*(\d+)", res)
+        if not match:
+            raise ValueError("Invalid resolution format. Use WIDTHxHEIGHT (e.g., 1920x1080).")
+        w, h = int(match.group(1)), int(match.group(2))
+    if portrait: w, h = h, w
+    return (w // 2) * 2, (h // 2) * 2
+
+
+def normalize_bitrate(bitrate):
+    match = re.search(r"(\d+)", str(bitrate))
+    if not match:
+        raise ValueError(f"Invalid bitrate: {bitrate!r}")
+    return f"{match.group(1)}k"
+
+
+def guess_seed_len(audio_duration):
+    return 10 if audio_duration < 60 else 60 if audio_duration < 600 else 240
+
+
+def letterbox(img, size):
+    """Fit img inside size and center it on a black canvas."""
+    img.thumbnail(size, Image.Resampling.LANCZOS)
+    canvas = Image.new("RGB", size, (0, 0, 0))
+    offset = ((size[0] - img.size[0]) // 2, (size[1] - img.size[1]) // 2)
+    canvas.paste(img, offset)
+    return canvas
+
+
+def _image_mb(size):
+    # Pillow keeps RGB and RGBA pixels in 4 bytes
+    return size[0] * size[1] * 4 / 1e6
+
+
+def letterbox_file(path, size, log=None):
+    """
+    letterbox for an image file, decoded at reduced size first (see
+    thumbnail.decode_reduced) and closed before the Lanczos pass, so the
+    memory it takes follows the output size rather than the source's.
+    log gets the decode size and the peak image memory.
+    """
+    img = small = Image.open(path)
+    try:
+        original = img.size
+        fit = fit_size(original, size)
+        small, decoded = decode_reduced(img, fit, reducing_gap=2)
+        small.load()
+        reduced = small.size
+    finally:
+        if small is not img:
+            img.close()  # Frees the full decode before the Lanczos pass
+    # At most two images are alive at once: decoded and reduced, reduced and fitted, or fitted and canvas
+    peak = max(_image_mb(decoded) + (_image_mb(reduced) if reduced != decoded else 0),
+               _image_mb(reduced) + _image_mb(fit), _image_mb(fit) + _image_mb(size))
+    canvas = letterbox(small, size)
+    if log:
+        how = "in full" if decoded == original else f"at {decoded[0]}x{decoded[1]}"
+        if reduced != decoded:
+            how += f", reduced to {reduced[0]}x{reduced[1]}"
+        log(f"Decoded the {original[0]}x{original[1]} image {how} for a {fit[0]}x{fit[1]} fit, "
+            f"about {peak:.0f} MB of image memory")
+    return canvas
+
+
+def yuv420p_bytes(canvas):
+    """Planar studio range YUV 4:2:0 bytes of an RGB canvas with even dimensions."""
+    w, h = canvas.size
+    y, cb, cr = canvas.convert("YCbCr").split()
+    planes = [y.point(_LUMA_LUT)]
+    for chroma in (cb, cr):
+        planes.append(chroma.resize((w // 2, h // 2), Image.Resampling.BOX).point(_CHROMA_LUT))
+    return b"".join(plane.tobytes() for plane in planes)
+
+
+def raw_frame_input(canvas, frame_input=DEFAULT_FRAME_INPUT, pix_fmt=DEFAULT_PIX_FMT, fps=DEFAULT_SEED_FPS):
+    """
+    (input args, output args, stdin bytes) for a single raw frame of the
+    canvas. The output args loop it forever with the loop filter, so the
+    caller has to stop it with -t.
+    """
+    w, h = canvas.size
+    if frame_input == "yuv420p" and pix_fmt == "yuv420p":
+        raw_fmt, data = "yuv420p", yuv420p_bytes(canvas)
+    else:
+        raw_fmt, data = "rgb24", canvas.tobytes()
+    args = ['-f', 'rawvideo', '-pix_fmt', raw_fmt, '-s', f'{w}x{h}', '-framerate', str(fps or DEFAULT_SEED_FPS),
+            '-i', 'pipe:0']
+    return args, ['-vf', 'loop=loop=-1:size=1'], data
+
+
+# Extra arguments for every ffmpeg call, e.g. ['-loglevel', 'error'] when
+# several jobs share one terminal.
+ffmpeg_log_args = []
+
+
+def set_ffmpeg_loglevel(level):
+    ffmpeg_log_args[:] = ['-hide_banner', '-loglevel', level] if level else []
+
+
+def _feed(stream, data):
+    try:
+        stream.write(data)
+        stream.close()
+    except (BrokenPipeError, OSError):
+        pass
+
+
+def run_ffmpeg(cmd, input=None, on_progress=None, on_log=None):
+    """
+    Run an ffmpeg command line, with its share of the thread budget (see
+    cpubudget). on_progress gets the updates parsed from `-progress pipe:1`
+    (see progress.parse_progress), on_log gets each line ffmpeg writes to
+    stderr; without either, output goes to the terminal. Raises
+    CalledProcessError on failure.
+    """
+    with thread_budget.slot() as share:
+        _run_ffmpeg(thread_budget.ffmpeg_args(cmd, share), input, on_progress, on_log)
+
+
+def _run_ffmpeg(cmd, input, on_progress, on_log):
+    if on_progress:
+        cmd = [*cmd[:1], '-progress', 'pipe:1', '-nostats', *cmd[1:]]
+    process = subprocess.Popen(cmd, stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+                               stdout=subprocess.PIPE if on_progress else None,
+                               stderr=subprocess.PIPE if on_log else None, **thread_budget.popen_kwargs())
+    thread_budget.apply(process.pid)
+    threads = []
+    if input is not None:
+        threads.append(threading.Thread(target=_feed, args=(process.stdin, input), daemon=True))
+    if on_log:
+        def pump_log():
+            for line in process.stderr:
+                on_log(line.decode("utf-8", errors="replace"))
+        threads.append(threading.Thread(target=pump_log, daemon=True))
+    for t in threads:
+        t.start()
+    try:
+        if on_progress:
+            for update in parse_progress(line.decode("utf-8", errors="replace") for line in process.stdout):
+                on_progress(update)
+        _wait(process)
+    except BaseException:
+        # Interrupted, or a callback raised: don't leave ffmpeg writing into a scratch dir being removed
+        process.kill()
+        process.wait()
+        raise
+    for t in threads:
+        t.join()
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmd)
+
+
+def _wait(process):
+    # Reaping it ourselves gets ffmpeg's own CPU time and peak RSS for the metrics
+    if not hasattr(os, "wait4"):
+        process.wait()
+        return
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    metrics.child_usage(usage)
+
+
+def ffmpeg(*args, input=None, progress=None):
+    run_ffmpeg(['ffmpeg', '-y', *ffmpeg_log_args, *args], input=input, on_progress=progress)
+
+
+def parse_fps(fps):
+    """None (ffmpeg's default rate) or a positive frame rate like 1, 0.5 or '1/2'."""
+    if fps in (None, ""):
+        return None
+    if isinstance(fps, str) and "/" in fps:
+        num, den = fps.split("/", 1)
+        value = float(num) / float(den)
+    else:
+        value = float(fps)
+    if value <= 0:
+        raise ValueError(f"Seed frame rate must be positive, got {fps!r}")
+    return value
+
+
+def seed_rate_args(seed_len, fps=None):
+    """
+    Output arguments for the seed's frame rate and GOP. With an fps this is
+    the minimal-frame seed: that rate, a single keyframe for the whole seed
+    and no scene-cut keyframes, so every other frame is an all-skip P-frame.
+    """
+    if not fps:
+        return []
+    frames = max(1, math.ceil(seed_len * fps))
+    return ['-r', f'{fps:g}', '-g', str(frames), '-keyint_min', str(frames), '-sc_threshold', '0']
+
+
+def encode_seed(image_file, size, seed_len, output, preset=DEFAULT_PRESET, pix_fmt=DEFAULT_PIX_FMT,
+                fps=None, progress=None, profile=codecs.DEFAULT_PROFILE, bframes=True):
+    w, h = size
+    ffmpeg(
+        '-loop', '1', *(['-framerate', f'{fps:g}'] if fps else []), '-i', image_file,
+        *codecs.seed_video_args(profile, preset, seed_len, fps, bframes), '-t', str(seed_len),
+        '-pix_fmt', pix_fmt, '-vf', f'scale={w}:{h}',
+        *seed_rate_args(seed_len, fps), output,
+        progress=progress)
+
+
+def encode_seed_raw(canvas, seed_len, output, preset=DEFAULT_PRESET, pix_fmt=DEFAULT_PIX_FMT,
+                    frame_input=DEFAULT_FRAME_INPUT, fps=None, progress=None, profile=codecs.DEFAULT_PROFILE,
+                    bframes=True):
+    """Like encode_seed, but the canvas is piped in raw: no PNG and no scale filter."""
+    input_args, loop_args, data = raw_frame_input(canvas, frame_input, pix_fmt, fps)
+    ffmpeg(
+        *input_args, *loop_args,
+        *codecs.seed_video_args(profile, preset, seed_len, fps, bframes), '-t', str(seed_len),
+        '-pix_fmt', pix_fmt, *seed_rate_args(seed_len, fps), output,
+        input=data, progress=progress)
+
+
+def encode_audio(audio, bitrate, output, progress=None, encoder="aac"):
+    ffmpeg('-i', audio, '-vn', '-c:a', encoder, '-b:a', bitrate, output, progress=progress)
+
+
+def write_concat_list(path, seed_clip, num_loops):
+    with open(path, "w") as f:
+        for _ in range(num_loops):
+            f.write(f"file '{os.path.abspath(seed_clip)}'\n")
+
+
+def write_playlist(path, pieces):
+    """
+    Concat list of (clip, seconds) pieces. Each piece is cut with outpoint
+    and given its duration, so the demuxer lays the pieces end to end
+    exactly without probing them; they all start at the clip's first
+    (key)frame, so no inpoint is needed.
+    """
+    with open(path, "w") as f:
+        f.write("ffconcat version 1.0\n")
+        for clip, seconds in pieces:
+            quoted = os.path.abspath(clip).replace("'", "'\\''")
+            f.write(f"file '{quoted}'\nduration {seconds:.6f}\noutpoint {seconds:.6f}\n")
+
+
+def moov_reserve(duration, video_fps=None, sample_rate=None):
+    """Generous size of the moov of a duration second file, for a faststart layout in one pass."""
+    video = math.ceil(duration * (video_fps or DEFAULT_SEED_FPS))
+    audio = math.ceil(duration * (sample_rate or 48000) / 1024)
+    return video * 24 + audio * 12 + 65536
+
+
+def layout_args(layout, reserve=None):
+    """
+    ffmpeg output arguments for layout. For faststart, reserve is the moov
+    space to leave at the start (see moov_reserve); without it ffmpeg moves
+    the moov in a second pass over the file.
+    """
+    if layout == "faststart":
+        return ['-moov_size', str(reserve)] if reserve else ['-movflags', '+faststart']
+    if layout == "fragmented":
+        return ['-movflags', '+frag_keyframe+empty_moov+default_base_moof', '-frag_duration', '2000000']
+    return []
+
+
+def resolve_layout(layout, output, muxer="concat"):
+    """Check layout against output and muxer; a stream gets the layout it needs."""
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown layout {layout!r} (use one of {', '.join(LAYOUTS)})")
+    if output == STREAM_OUTPUT:
+        # mp4mux writes everything in order when the moov goes first; ffmpeg needs fragments
+        needed = "faststart" if muxer == "native" else "fragmented"
+        if layout not in ("plain", needed):
+            raise ValueError(f"Streaming to stdout with the {muxer} muxer needs the {needed} layout")
+        return needed
+    if layout != "plain" and not codecs.container(output)["mp4"]:
+        raise ValueError(f"The {layout} layout is only for MP4 output")
+    if layout == "fragmented" and muxer == "native":
+        raise ValueError("The native muxer doesn't write fragmented MP4")
+    return layout
+
+
+def write_mp4(write, layout, reserve, log=print):
+    """
+    Call write(output_args) with the arguments for layout. If the space
+    reserved for a faststart moov turns out too small, write again with
+    ffmpeg's own faststart pass.
+    """
+    try:
+        write(layout_args(layout, reserve))
+    except subprocess.CalledProcessError:
+        if layout != "faststart" or not reserve:
+            raise
+        log("Reserved index space was too small, writing again with a faststart pass...")
+        write(layout_args(layout))
+
+
+def mux(concat_file, audio, audio_args, duration, output, progress=None, video_args=('-c:v', 'copy'),
+        output_args=(), chapters=None):
+    """Final pass; chapters is an optional FFMETADATA file whose chapters are copied in."""
+    if output == STREAM_OUTPUT:
+        output_args, output = [*output_args, '-f', 'mp4'], 'pipe:1'
+    chapter_args = ['-i', chapters, '-map_chapters', '2'] if chapters else []
+    ffmpeg(
+        '-f', 'concat', '-safe', '0', '-i', concat_file,
+        '-i', audio, *chapter_args, *video_args, *audio_args,
+        '-shortest', '-t', str(duration), *output_args, output,
+        progress=progress)
+
+
+def prepare_seed(image, res="1920x1080", seed_len=60, portrait=False,
+                 preset=DEFAULT_PRESET, pix_fmt=DEFAULT_PIX_FMT,
+                 frame_input=DEFAULT_FRAME_INPUT, work_dir=".", cache=None, log=print,
+                 seed_fps=None, tracker=None, profile=codecs.DEFAULT_PROFILE, progress=None, bframes=True):
+    """
+    Letterbox the image and encode the seed clip, or fetch it from the cache.
+    seed_fps selects the minimal-frame seed (see seed_rate_args) and profile
+    the encoder settings (see codecs.SEED_PROFILES); a
+    progress.ProgressTracker gets the encode's progress as the "seed" stage,
+    or else progress gets run_ffmpeg's updates. bframes=False is for seeds
+    that will be cut short (see codecs.seed_video_args).
+    Returns (seed_clip, size, temp_files); temp_files is what the caller
+    should delete once the seed is no longer needed.
+    """
+    temp_files = []
+    codecs.get_profile(profile)
+    with Image.open(image) as img:
+        size = parse_resolution(res, img.size, portrait)
+
+    seed_key = None
+    if cache:
+        with metrics.stage("cache"):
+            seed_key = cache.key("seed", file_digest(image), size, portrait, seed_len, preset, pix_fmt,
+                                 frame_input, seed_fps, profile, *([] if bframes else ["no-bframes"]))
+            metrics.count_io(read=metrics.file_size(image))
+            seed_clip = cache.lookup(seed_key, ".mp4")
+        if seed_clip:
+            log(f"Using cached {seed_len}s seed clip")
+            if tracker: tracker.skip("seed")
+            return seed_clip, size, temp_files
+
+    log(f"Resizing image to {size[0]}x{size[1]}...")
+    with metrics.stage("letterbox"):
+        canvas = letterbox_file(image, size, log)
+        metrics.count_io(read=metrics.file_size(image))
+
+    if tracker:
+        tracker.plan("seed", seed_len)
+        progress = tracker.stage("seed")
+    resized_img_path = None
+    if frame_input == "png":
+        resized_img_path = os.path.join(work_dir, "temp_resized_image.png")
+        with metrics.stage("image_write"):
+            canvas.save(resized_img_path)
+            metrics.count_io(written=metrics.file_size(resized_img_path))
+        encode = lambda out: encode_seed(resized_img_path, size, seed_len, out, preset, pix_fmt, seed_fps,
+                                         progress, profile, bframes)
+    else:
+        encode = lambda out: encode_seed_raw(canvas, seed_len, out, preset, pix_fmt, frame_input, seed_fps,
+                                             progress, profile, bframes)
+
+    try:
+        log(f"Encoding {seed_len}s seed clip" + (f" at {seed_fps:g} fps" if seed_fps else "")
+            + (f" with the {profile} profile..." if profile != codecs.DEFAULT_PROFILE else "..."))
+        start = time.monotonic()
+        with metrics.stage("seed"):
+            if cache:
+                seed_clip = cache.store(seed_key, ".mp4", encode)
+            else:
+                seed_clip = os.path.join(work_dir, "temp_seed.mp4")
+                temp_files.append(seed_clip)
+                encode(seed_clip)
+            metrics.count_io(read=metrics.file_size(resized_img_path), written=os.path.getsize(seed_clip))
+        log(f"Seed encoded in {time.monotonic() - start:.1f}s, {os.path.getsize(seed_clip) / 1000:.0f} kB "
+            f"({os.path.getsize(seed_clip) * 8 / seed_len / 1000:.0f} kb/s of video)")
+    finally:
+        if resized_img_path and os.path.exists(resized_img_path):
+            with metrics.stage("cleanup"):
+                os.remove(resized_img_path)
+    return seed_clip, size, temp_files
+
+
+def remux_audio(audio, output):
+    """Copy the audio stream into an M4A without re-encoding it."""
+    ffmpeg('-i', audio, '-vn', '-c:a', 'copy', output)
+
+
+def verify_output(output, duration, log=print):
+    """Raise RuntimeError unless output has video and audio both about duration seconds long."""
+    problems = mp4mux.verify(output, duration)
+    if problems:
+        raise RuntimeError(f"{output} failed verification: {'; '.join(problems)}")
+    log(f"Verified output with ffprobe ({duration:.2f}s)")
+
+
+def render_track(audio, seed_clip, seed_len, output, bitrate="192k",
+                 audio_info=None, audio_policy="auto", work_dir=".", cache=None, log=print,
+                 muxer="concat", verify=False, tracker=None, profile=codecs.DEFAULT_PROFILE, layout="plain",
+                 playlist=None, chapters=None, audio_jobs=1):
+    """
+    Loop an already encoded seed clip for the length of the audio and mux
+    the audio in, with muxer one of MUXERS and layout one of LAYOUTS
+    (output STREAM_OUTPUT writes to stdout). profile is the seed profile the
+    clip was encoded with. A playlist of (clip, seconds) pieces (see
+    write_playlist) replaces the plain loop, for the concat muxer only;
+    chapters is an FFMETADATA file of chapter markers to add. Audio the
+    output container can't carry (see codecs.CONTAINERS) is encoded to AAC,
+    or Opus for WebM; long audio is encoded to AAC by up to audio_jobs
+    processes at once (see audiochunks). With verify the result is checked
+    with ffprobe. A progress.ProgressTracker gets the
+    "audio" and "mux" stages. Returns the audio info from probe_audio.
+    """
+    bitrate = normalize_bitrate(bitrate)
+    codecs.check_output(profile, output)
+    out = codecs.container(output)
+    encoder = out["audio_encoder"]
+    if audio_info is None:
+        audio_info = probe_audio(audio)
+    audio_duration = audio_info["duration"]
+    audio_mode = choose_audio_mode(audio_info, audio_policy, out["audio"])
+    log(f"Audio is {describe_audio(audio_info)}: "
+        + ("stream copy" if audio_mode == "copy" else f"encoding to {AUDIO_ENCODER_NAMES[encoder]} {bitrate}"))
+
+    if muxer not in MUXERS:
+        raise ValueError(f"Unknown muxer {muxer!r} (use one of {', '.join(MUXERS)})")
+    if muxer == "native" and not out["mp4"]:
+        raise ValueError(f"The native muxer only writes MP4, not {os.path.splitext(output)[1]}")
+    if muxer == "native" and (playlist or chapters):
+        raise ValueError("The native muxer only loops a single seed; use the concat muxer")
+    layout = resolve_layout(layout, output, muxer)
+    stream = output == STREAM_OUTPUT
+
+    audio_progress = mux_progress = None
+    if tracker:
+        tracker.plan("audio", audio_duration)
+        tracker.plan("mux", audio_duration)
+        audio_progress = tracker.stage("audio")
+        mux_progress = tracker.stage("mux")
+
+    concat_file = os.path.join(work_dir, "temp_list.txt")
+    temp_audio = os.path.join(work_dir, "temp_audio" + out["audio_ext"])
+    try:
+        # Audio: copy it, encode once into the cache, or encode in the final pass
+        with metrics.stage("audio"):
+            audio_in, audio_args = audio, ['-c:a', encoder, '-b:a', bitrate]
+            cached_audio = False
+            encode = lambda path: encode_audio(audio, bitrate, path, audio_progress, encoder)
+            chunked = (audio_mode == "encode" and encoder == "aac" and audio_jobs > 1
+                       and len(audiochunks.plan_ranges(audio_duration, audio_info["sample_rate"], audio_jobs)) > 1)
+            if chunked:
+                encode = lambda path: audiochunks.encode_aac_chunked(audio, bitrate, path, audio_info, audio_jobs,
+                                                                     tracker, log)
+            if audio_mode == "copy":
+                audio_args = ['-c:a', 'copy']
+            elif cache:
+                audio_key = cache.key(encoder, file_digest(audio), bitrate)
+                audio_in = cache.lookup(audio_key, out["audio_ext"])
+                cached_audio = bool(audio_in)
+                if audio_in:
+                    log(f"Using cached {AUDIO_ENCODER_NAMES[encoder]} audio")
+                    if tracker: tracker.skip("audio")
+                else:
+                    log(f"Encoding audio ({bitrate})...")
+                    audio_in = cache.store(audio_key, out["audio_ext"], encode)
+                audio_args = ['-c:a', 'copy']
+            elif chunked:
+                # Too slow for the final pass's single encoder
+                log(f"Encoding audio ({bitrate})...")
+                encode(temp_audio)
+                audio_in, audio_args = temp_audio, ['-c:a', 'copy']
+
+            if muxer == "native":
+                # mp4mux needs the audio as an MP4 track
+                if audio_args != ['-c:a', 'copy']:
+                    log(f"Encoding audio ({bitrate})...")
+                    encode_audio(audio_in, bitrate, temp_audio, audio_progress)
+                    audio_in = temp_audio
+                elif os.path.splitext(audio_in)[1].lower() not in MP4_AUDIO_EXTS:
+                    remux_audio(audio_in, temp_audio)
+                    audio_in = temp_audio
+            if tracker and "audio" not in tracker.fractions:
+                # Copied, or encoded as part of the final pass (which is then as slow as an audio encode)
+                tracker.skip("audio")
+                if audio_args != ['-c:a', 'copy']:
+                    tracker.plan("mux", audio_duration, TYPICAL_SPEED["audio"])
+            if audio_in != audio:
+                # Hashed for the cache or encoded; written unless the cache had it
+                metrics.count_io(read=metrics.file_size(audio),
+                                 written=0 if cached_audio else metrics.file_size(audio_in))
+
+        # Written under a temporary name and renamed when complete (and verified)
+        with atomic_output(output) as partial:
+            if muxer == "native":
+                log("Writing MP4 with shared seed samples" + (", index first..." if layout == "faststart" else "..."))
+                with metrics.stage("mux"):
+                    mp4mux.mux_looped(seed_clip, audio_in, sys.stdout.buffer if stream else partial, audio_duration,
+                                      faststart=layout == "faststart")
+                    metrics.count_io(read=metrics.file_size(seed_clip) + metrics.file_size(audio_in),
+                                     written=metrics.file_size(partial))
+                if tracker: tracker.skip("mux")
+            else:
+                with metrics.stage("playlist"):
+                    if playlist:
+                        write_playlist(concat_file, playlist)
+                    else:
+                        write_concat_list(concat_file, seed_clip, math.ceil(audio_duration / seed_len))
+                    metrics.count_io(written=metrics.file_size(concat_file))
+
+                # Final pass: concat (stream copy) + audio mux. -progress uses stdout, so not when streaming.
+                log("Muxing final video" + ("" if layout == "plain" else f" ({layout})") + "...")
+                reserve = None
+                if layout == "faststart":
+                    reserve = moov_reserve(audio_duration, mp4mux.samples_per_second(seed_clip),
+                                           audio_info["sample_rate"])
+                with metrics.stage("mux"):
+                    write_mp4(lambda layout_args: mux(concat_file, audio_in, audio_args, audio_duration, partial,
+                                                      None if stream else mux_progress,
+                                                      codecs.mux_video_args(profile, output), layout_args,
+                                                      chapters),
+                              layout, reserve, log)
+                    # The concat demuxer reads the seed once per loop
+                    clips = playlist or [(seed_clip, seed_len)] * math.ceil(audio_duration / seed_len)
+                    metrics.count_io(read=sum(metrics.file_size(clip) for clip, _ in clips)
+                                     + metrics.file_size(audio_in), written=metrics.file_size(partial))
+                if tracker and stream: tracker.skip("mux")
+
+            if verify and stream:
+                log("Not verifying: the output is a stream")
+            elif verify:
+                with metrics.stage("verify"):
+                    verify_output(partial, audio_duration, log)
+    finally:
+        with metrics.stage("cleanup"):
+            for tmp in (concat_file, temp_audio):
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+    return audio_info
+
+
+def full_encode(audio, image, output, size, bitrate="192k", audio_policy="auto", preset=DEFAULT_PRESET,
+                verify=False, log=print, on_log=None, on_progress=None, layout="plain"):
+    """
+    The Tk app's original strategy: encode the still for the whole audio
+    duration with libx264 in a single pass, no seed and no concat. With
+    verify the result gets the same ffprobe check as render, layout is one
+    of LAYOUTS (a file, not a stream). on_log gets ffmpeg's stderr lines,
+    on_progress the ProgressTracker updates. Returns the audio info from
+    probe_audio.
+    """
+    bitrate = normalize_bitrate(bitrate)
+    if output == STREAM_OUTPUT:
+        raise ValueError("full_encode writes files only")
+    layout = resolve_layout(layout, output)
+    with metrics.stage("letterbox"):
+        canvas = letterbox_file(image, size, log)
+        metrics.count_io(read=metrics.file_size(image))
+
+    with metrics.stage("probe"):
+        audio_info = probe_audio(audio)
+    audio_duration = audio_info["duration"]
+    audio_mode = choose_audio_mode(audio_info, audio_policy)
+    log(f"Audio is {describe_audio(audio_info)}: "
+        + ("stream copy" if audio_mode == "copy" else f"encoding to AAC {bitrate}"))
+    audio_args = ['-c:a', 'copy'] if audio_mode == 'copy' else ['-c:a', 'aac', '-b:a', bitrate]
+
+    # The letterboxed frame goes to ffmpeg raw over stdin, no temp PNG
+    input_args, loop_args, frame_data = raw_frame_input(canvas)
+    cmd = [
+        'ffmpeg', '-y', *ffmpeg_log_args,
+        *input_args,
+        '-i', audio, *loop_args,
+        '-c:v', 'libx264', '-tune', 'stillimage', '-preset', preset,
+        *audio_args, '-pix_fmt', 'yuv420p', '-t', str(audio_duration), '-shortest'
+    ]
+
+    tracker = ProgressTracker(on_progress) if on_progress else None
+    if tracker: tracker.plan("encode", audio_duration)
+    reserve = None
+    if layout == "faststart":
+        reserve = moov_reserve(audio_duration, DEFAULT_SEED_FPS, audio_info["sample_rate"])
+    with atomic_output(output) as partial:
+        with metrics.stage("encode"):
+            write_mp4(lambda layout_args: run_ffmpeg([*cmd, *layout_args, partial], input=frame_data,
+                                                     on_log=on_log,
+                                                     on_progress=tracker.stage("encode") if tracker else None),
+                      layout, reserve, log)
+            metrics.count_io(read=metrics.file_size(audio), written=metrics.file_size(partial))
+        if verify:
+            with metrics.stage("verify"):
+                verify_output(partial, audio_duration, log)
+    return audio_info
+
+
+def render(audio, image, output, res="1920x1080", seed_len=60, bitrate="192k",
+           portrait=False, preset=DEFAULT_PRESET, pix_fmt=DEFAULT_PIX_FMT,
+           audio_policy="auto", frame_input=DEFAULT_FRAME_INPUT, work_dir=None, cache=None, log=print,
+           seed_fps=None, muxer="concat", verify=False, on_progress=None, ram_budget=0,
+           profile=codecs.DEFAULT_PROFILE, layout="plain", audio_jobs=1):
+    """
+    Render a static image video: encode a short seed clip of the image, then
+    loop it with the concat demuxer (stream copy) and mux in the audio.
+
+    Intermediates go in a scratch directory of this job's own, made under
+    work_dir (default: the system temp directory), or in /dev/shm if they
+    are estimated to fit in ram_budget bytes; it is removed however the
+    render ends. output appears only once it is complete.
+
+    seed_len=None picks a length from the audio duration with a fixed rule,
+    seed_len="auto" uses the calibrated cost model in tuner. With a MediaCache
+    the seed clip and the AAC audio are reused across runs. audio_policy
+    is one of AUDIO_POLICIES and frame_input one of FRAME_INPUTS; seed_fps
+    selects the minimal-frame seed, profile the seed's encoder (see
+    codecs.SEED_PROFILES) and muxer/verify/layout/audio_jobs are as for
+    render_track; output STREAM_OUTPUT streams the video to stdout.
+    on_progress receives the ProgressTracker updates (stage, percentage,
+    speed, ETA). Returns the audio info from probe_audio.
+    """
+    codecs.check_output(profile, output)
+    resolve_layout(layout, output, muxer)
+    log("Analyzing audio...")
+    with metrics.stage("probe"):
+        audio_info = probe_audio(audio)
+        audio_duration = audio_info["duration"]
+        log(f"Detected audio duration: {audio_duration:.2f}s")
+
+        with Image.open(image) as img:
+            size = parse_resolution(res, img.size, portrait)
+        if seed_len is None:
+            seed_len = guess_seed_len(audio_duration)
+        elif seed_len == "auto":
+            seed_len = tuner.auto_seed_len(audio_duration, size, seed_fps, log)
+
+    tracker = None
+    if on_progress:
+        tracker = ProgressTracker(on_progress)
+        tracker.plan("seed", seed_len)
+        tracker.plan("audio", audio_duration)
+        tracker.plan("mux", audio_duration)
+
+    # Only the native muxer and a split encode stage the audio in the scratch directory
+    staged_audio = audio_duration if muxer == "native" or audio_jobs > 1 else 0
+    need = estimate_bytes(size, seed_len, seed_fps, staged_audio, int(normalize_bitrate(bitrate)[:-1]))
+    with pinning(cache), job_scratch(work_dir, ram_budget, need, log=log) as scratch:
+        # The native muxer cuts the last loop short, which is only exact without frame reordering
+        seed_clip, _, _ = prepare_seed(image, res, seed_len, portrait, preset, pix_fmt,
+                                       frame_input, scratch, cache, log, seed_fps, tracker, profile,
+                                       bframes=muxer != "native")
+        render_track(audio, seed_clip, seed_len, output, bitrate, audio_info,
+                     audio_policy, scratch, cache, log, muxer, verify, tracker, profile, layout,
+                     audio_jobs=audio_jobs)
+
+    return audio_info
@@ -0,0 +1,100 @@
+import os
+import uuid
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from .cache import parse_size
+from . import metrics
+
+# Scratch space for one job's intermediates (seed clip, resized image,
+# concat list, temporary audio). Every job gets its own directory, so jobs
+# writing to the same output folder can't clobber each other, and it is
+# removed however the job ends. Small enough jobs can be staged in RAM
+# (/dev/shm or another tmpfs) instead of on the output disk.
+
+RAM_DIRS = ("/dev/shm", "/run/shm")
+
+
+def ram_dir():
+    """A writable tmpfs directory, or None (e.g. on macOS and Windows)."""
+    for path in RAM_DIRS:
+        if os.path.isdir(path) and os.access(path, os.W_OK):
+            return path
+    return None
+
+
+def estimate_bytes(size, seed_len, seed_fps=None, audio_duration=0, audio_bitrate_k=0):
+    """
+    Generous estimate of a job's intermediates: a couple of raw frames of
+    size, about 2KB per seed frame (a still compresses to almost nothing
+    after the keyframe), plus temporary audio at audio_bitrate_k for
+    audio_duration when the audio is staged.
+    """
+    frames = seed_len * (seed_fps or 25)
+    return int(size[0] * size[1] * 6 + frames * 2048) + audio_bytes(audio_duration, audio_bitrate_k)
+
+
+def audio_bytes(duration, bitrate_k):
+    """Size of duration seconds of staged audio at bitrate_k kbit/s."""
+    return int(duration * bitrate_k * 1000 / 8)
+
+
+def parse_budget(text):
+    """'512M'-style budget; 0 or '' means no RAM staging."""
+    return parse_size(text) if text and str(text) != "0" else 0
+
+
+@contextmanager
+def job_scratch(parent=None, ram_budget=0, need_bytes=0, prefix="staticvideo-", log=None):
+    """
+    Yield a fresh directory for one job and remove it afterwards, also on
+    errors and interrupts. It is made in a tmpfs when need_bytes fits both
+    ram_budget and the free space there, else under parent (default: the
+    system temp directory).
+    """
+    base = parent
+    shm = ram_dir() if ram_budget else None
+    if shm and need_bytes <= ram_budget:
+        try:
+            if shutil.disk_usage(shm).free > need_bytes * 2:
+                base = shm
+        except OSError:
+            pass
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    path = tempfile.mkdtemp(prefix=prefix, dir=base)
+    if log and shm and base == shm:
+        log(f"Staging intermediates in {shm} (~{need_bytes / 1e6:.0f} MB)")
+    try:
+        yield path
+    finally:
+        with metrics.stage("cleanup"):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def partial_path(output):
+    """Hidden temporary name next to output, keeping its extension for ffmpeg."""
+    folder, name = os.path.split(os.path.abspath(output))
+    base, ext = os.path.splitext(name)
+    return os.path.join(folder, f".{base}.{uuid.uuid4().hex[:8]}.partial{ext}")
+
+
+@contextmanager
+def atomic_output(output):
+    """
+    Yield a temporary path to write instead of output; on success it is
+    renamed over output in one step, so anything watching the folder never
+    sees a half-written file. On failure it is removed. A stream ("-") is
+    passed through as it is.
+    """
+    if output == "-":
+        yield output
+        return
+    tmp = partial_path(output)
+    try:
+        yield tmp
+        os.replace(tmp, output)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
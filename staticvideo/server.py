@@ -0,0 +1,354 @@
+import os
+import re
+import json
+import time
+import uuid
+import queue
+import shutil
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+from . import render as r
+from . import codecs
+
+# Local HTTP job API (stdlib only). Clients upload inputs or name files on
+# this machine, submit a job, poll its status and download the MP4:
+#
+#   POST   /uploads?name=track.wav     raw file body -> {"upload": id}
+#   POST   /jobs                       JSON job spec -> 202 {"id": ...}, or 503 when the queue is full
+#   GET    /jobs                       all jobs
+#   GET    /jobs/<id>                  status and progress
+#   GET    /jobs/<id>/output           the finished MP4, streamed
+#   DELETE /jobs/<id>                  cancel a queued job, or forget a finished one and its files
+#   GET    /health                     queue and worker counts
+#
+# A job spec has "audio" and "image" (paths on the server) or "audio_upload"
+# and "image_upload" (ids from /uploads), plus the CLI options: res,
+# seed_len (seconds or "auto"), bitrate, audio_mode, seed_fps, seed_profile,
+# muxer, layout, verify.
+
+CHUNK = 1 << 20
+
+
+class JobError(ValueError):
+    """A bad job spec or upload; reported to the client as 400."""
+
+
+class QueueFull(Exception):
+    pass
+
+
+def parse_job_options(spec, defaults):
+    """Validated render() keyword arguments from a job spec, falling back to defaults."""
+    opts = dict(defaults)
+    try:
+        if "res" in spec:
+            r.parse_resolution(spec["res"])
+            opts["res"] = spec["res"]
+        if "seed_len" in spec:
+            value = spec["seed_len"]
+            opts["seed_len"] = "auto" if str(value).lower() == "auto" else int(value)
+            if opts["seed_len"] != "auto" and opts["seed_len"] <= 0:
+                raise JobError("seed_len must be positive")
+        if "bitrate" in spec:
+            opts["bitrate"] = r.normalize_bitrate(spec["bitrate"])
+        if "audio_mode" in spec:
+            if spec["audio_mode"] not in r.AUDIO_POLICIES:
+                raise JobError(f"audio_mode must be one of {', '.join(r.AUDIO_POLICIES)}")
+            opts["audio_policy"] = spec["audio_mode"]
+        if "muxer" in spec:
+            if spec["muxer"] not in r.MUXERS:
+                raise JobError(f"muxer must be one of {', '.join(r.MUXERS)}")
+            opts["muxer"] = spec["muxer"]
+        if "layout" in spec:
+            if spec["layout"] not in r.LAYOUTS:
+                raise JobError(f"layout must be one of {', '.join(r.LAYOUTS)}")
+            opts["layout"] = spec["layout"]
+        if "seed_fps" in spec:
+            opts["seed_fps"] = r.parse_fps(spec["seed_fps"]) if spec["seed_fps"] else None
+        if "seed_profile" in spec:
+            codecs.get_profile(spec["seed_profile"])
+            opts["profile"] = spec["seed_profile"]
+        if "verify" in spec:
+            opts["verify"] = bool(spec["verify"])
+    except JobError:
+        raise
+    except (TypeError, ValueError) as e:
+        raise JobError(str(e))
+    return opts
+
+
+class RenderService:
+    """
+    In-process job queue: `concurrency` worker threads take jobs from a
+    queue of at most `queue_size`; submit raises QueueFull beyond that.
+    Each job renders into its own directory under work_root. All jobs share
+    cache, so each sees the entries the others have pinned.
+    """
+
+    def __init__(self, work_root=None, concurrency=2, queue_size=16, render_defaults=None, cache=None,
+                 log=print):
+        self.work_root = work_root or tempfile.mkdtemp(prefix="staticvideo-serve-")
+        self.owns_root = work_root is None
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.concurrency = concurrency
+        self.render_defaults = render_defaults or {}
+        self.cache = cache
+        self.log = log
+        self.jobs = {}
+        self.uploads = {}
+        self.lock = threading.Lock()
+        self.threads = []
+        os.makedirs(os.path.join(self.work_root, "uploads"), exist_ok=True)
+
+    def start(self):
+        for i in range(self.concurrency):
+            thread = threading.Thread(target=self._worker, name=f"render-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        """Drop queued jobs, wait for running ones and remove the work directory if it was ours."""
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        if self.owns_root:
+            shutil.rmtree(self.work_root, ignore_errors=True)
+
+    def save_upload(self, name, stream, length):
+        """Copy length bytes from stream into a new upload; returns its id."""
+        upload_id = uuid.uuid4().hex
+        name = re.sub(r"[^\w.-]", "_", os.path.basename(name or "upload")) or "upload"
+        folder = os.path.join(self.work_root, "uploads", upload_id)
+        os.makedirs(folder)
+        path = os.path.join(folder, name)
+        remaining = length
+        with open(path, "wb") as f:
+            while remaining > 0:
+                data = stream.read(min(CHUNK, remaining))
+                if not data:
+                    shutil.rmtree(folder, ignore_errors=True)
+                    raise JobError("upload ended early")
+                f.write(data)
+                remaining -= len(data)
+        with self.lock:
+            self.uploads[upload_id] = path
+        return upload_id
+
+    def _input(self, spec, kind):
+        if spec.get(f"{kind}_upload"):
+            with self.lock:
+                path = self.uploads.get(spec[f"{kind}_upload"])
+            if not path:
+                raise JobError(f"unknown {kind}_upload {spec[f'{kind}_upload']!r}")
+            return path
+        path = spec.get(kind)
+        if not path:
+            raise JobError(f"{kind} or {kind}_upload is required")
+        path = os.path.abspath(os.path.expanduser(path))
+        if not os.path.isfile(path):
+            raise JobError(f"{kind} {path} not found")
+        return path
+
+    def submit(self, spec):
+        """Queue a job from a spec dict; returns its public status. Raises JobError or QueueFull."""
+        opts = parse_job_options(spec, self.render_defaults)
+        audio, image = self._input(spec, "audio"), self._input(spec, "image")
+        job_id = uuid.uuid4().hex[:12]
+        folder = os.path.join(self.work_root, "jobs", job_id)
+        job = {"id": job_id, "status": "queued", "audio": audio, "image": image,
+               "output": os.path.join(folder, "output.mp4"), "folder": folder, "options": opts,
+               "progress": None, "error": None, "created": time.time(), "started": None, "finished": None}
+        os.makedirs(folder)
+        with self.lock:
+            self.jobs[job_id] = job
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            with self.lock:
+                del self.jobs[job_id]
+            shutil.rmtree(folder, ignore_errors=True)
+            raise QueueFull()
+        with self.lock:
+            # Uploads belong to the job from now on and go when it is deleted
+            for kind in ("audio", "image"):
+                self.uploads.pop(spec.get(f"{kind}_upload"), None)
+        self.log(f"Queued job {job_id}: {os.path.basename(audio)} + {os.path.basename(image)}")
+        return self.status(job_id)
+
+    def status(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if not job:
+                return None
+            info = {k: job[k] for k in ("id", "status", "error", "created", "started", "finished")}
+            info["options"] = {k: v for k, v in job["options"].items() if k != "cache"}
+            if job["progress"]:
+                info["progress"] = {k: job["progress"][k] for k in ("stage", "overall", "speed", "eta")}
+            if job["status"] == "done":
+                info["output_bytes"] = os.path.getsize(job["output"])
+                info["download"] = f"/jobs/{job_id}/output"
+            return info
+
+    def list(self):
+        with self.lock:
+            ids = list(self.jobs)
+        return [self.status(job_id) for job_id in ids]
+
+    def output(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return job["output"] if job and job["status"] == "done" else None
+
+    def delete(self, job_id):
+        """Cancel a queued job or drop a finished one. False if unknown or still running."""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if not job or job["status"] == "running":
+                return False
+            if job["status"] == "queued":
+                job["status"] = "cancelled"  # The worker skips it
+            del self.jobs[job_id]
+        shutil.rmtree(job["folder"], ignore_errors=True)
+        for path in (job["audio"], job["image"]):
+            if path.startswith(os.path.join(self.work_root, "uploads") + os.sep):
+                shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+        return True
+
+    def counts(self):
+        with self.lock:
+            statuses = [job["status"] for job in self.jobs.values()]
+        return {"queued": statuses.count("queued"), "running": statuses.count("running"),
+                "done": statuses.count("done"), "failed": statuses.count("failed"),
+                "workers": self.concurrency, "queue_size": self.queue.maxsize}
+
+    def _worker(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            with self.lock:
+                if job["status"] != "queued":
+                    continue
+                job.update(status="running", started=time.time())
+            try:
+                r.render(job["audio"], job["image"], job["output"],
+                         cache=self.cache, log=lambda msg: None,
+                         on_progress=lambda info: job.update(progress=info), **job["options"])
+                status, error = "done", None
+            except Exception as e:
+                status, error = "failed", str(e)
+            with self.lock:
+                job.update(status=status, error=error, finished=time.time())
+            self.log(f"Job {job['id']} {status}" + (f": {error}" if error else
+                                                       f" in {job['finished'] - job['started']:.1f}s"))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "staticvideo"
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def log_message(self, format, *args):
+        pass
+
+    def _json(self, code, data, headers=None):
+        body = json.dumps(data).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _route(self):
+        url = urlsplit(self.path)
+        return [part for part in url.path.split("/") if part], parse_qs(url.query)
+
+    def _length(self):
+        try:
+            return int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            return None
+
+    def do_GET(self):
+        parts, _ = self._route()
+        if parts == ["health"]:
+            return self._json(200, self.service.counts())
+        if parts == ["jobs"]:
+            return self._json(200, self.service.list())
+        if len(parts) == 2 and parts[0] == "jobs":
+            info = self.service.status(parts[1])
+            return self._json(200, info) if info else self._json(404, {"error": "no such job"})
+        if len(parts) == 3 and parts[0] == "jobs" and parts[2] == "output":
+            path = self.service.output(parts[1])
+            if not path:
+                return self._json(404, {"error": "no finished output for this job"})
+            self.send_response(200)
+            self.send_header("Content-Type", "video/mp4")
+            self.send_header("Content-Length", str(os.path.getsize(path)))
+            self.send_header("Content-Disposition", f'attachment; filename="{parts[1]}.mp4"')
+            self.end_headers()
+            with open(path, "rb") as f:
+                shutil.copyfileobj(f, self.wfile, CHUNK)
+            return
+        self._json(404, {"error": "not found"})
+
+    def do_POST(self):
+        parts, query = self._route()
+        length = self._length()
+        if length is None:
+            return self._json(411, {"error": "Content-Length required"})
+        try:
+            if parts == ["uploads"]:
+                upload_id = self.service.save_upload(query.get("name", ["upload"])[0], self.rfile, length)
+                return self._json(201, {"upload": upload_id})
+            if parts == ["jobs"]:
+                try:
+                    spec = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    raise JobError("body must be a JSON object")
+                if not isinstance(spec, dict):
+                    raise JobError("body must be a JSON object")
+                return self._json(202, self.service.submit(spec))
+        except JobError as e:
+            return self._json(400, {"error": str(e)})
+        except QueueFull:
+            return self._json(503, {"error": "queue full, try again later"}, {"Retry-After": "30"})
+        self._json(404, {"error": "not found"})
+
+    def do_DELETE(self):
+        parts, _ = self._route()
+        if len(parts) == 2 and parts[0] == "jobs":
+            if self.service.delete(parts[1]):
+                return self._json(200, {"deleted": parts[1]})
+            return self._json(409 if self.service.status(parts[1]) else 404,
+                              {"error": "job is running" if self.service.status(parts[1]) else "no such job"})
+        self._json(404, {"error": "not found"})
+
+
+def serve(host="127.0.0.1", port=8765, log=print, **service_opts):
+    """Run the API until interrupted. service_opts go to RenderService."""
+    service = RenderService(log=log, **service_opts)
+    httpd = ThreadingHTTPServer((host, port), _Handler)
+    httpd.daemon_threads = True
+    httpd.service = service
+    service.start()
+    log(f"Listening on http://{host}:{httpd.server_address[1]}/ "
+        f"({service.concurrency} workers, queue of {service.queue.maxsize})")
+    try:
+        httpd.serve_forever()
+    finally:
+        httpd.server_close()
+        service.stop()
@@ -0,0 +1,267 @@
+import os
+import re
+import csv
+import json
+import math
+import time
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+from . import render as r
+from . import tuner, codecs, metrics
+from .cpubudget import budget as thread_budget
+from .progress import ProgressTracker
+from .cache import pinning
+from .scratch import job_scratch, estimate_bytes
+
+# Timed slideshow: a different image for each section of the audio (the
+# chapters of a podcast, the tracks of a DJ mix). Every distinct image gets
+# its own seed, encoded in parallel, and the concat list plays each seed for
+# exactly its sections (see render.write_playlist), so the final pass is
+# still a stream copy. Sections come from a cue file:
+#
+#   .cue   CUE sheet: each TRACK's INDEX 01 is a start and its TITLE the
+#          chapter name; `REM IMAGE "photo.jpg"` in a track sets its image
+#   .csv   header row with start,image[,title] columns
+#   .json  a list of {"start": ..., "image": ..., "title": ...}
+#   .txt   a `TIME IMAGE [| TITLE]` or `TIME TITLE` line per section:
+#            0:00 intro.jpg | Intro
+#            12:34.5 Second half
+#
+# Times are seconds or [H:]MM:SS[.fff] (MM:SS:FF in CUE sheets, 75 frames
+# a second). A section without an image keeps the previous one; anything
+# before the first start gets the default image. Image paths are relative
+# to the cue file.
+
+CUE_EXTS = (".cue", ".csv", ".json", ".txt")
+
+
+def is_cue_file(path):
+    return bool(path) and os.path.splitext(path)[1].lower() in CUE_EXTS
+
+
+def parse_time(value):
+    """Seconds from a number or [H:]MM:SS[.fff]."""
+    parts = str(value).strip().split(":")
+    if len(parts) > 3 or not all(re.fullmatch(r"\d+(\.\d*)?", part) for part in parts):
+        raise ValueError(f"Bad time {value!r} (use seconds or [H:]MM:SS)")
+    seconds = 0.0
+    for part in parts:
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def _is_image(name):
+    return os.path.splitext(name)[1].lower() in Image.registered_extensions()
+
+
+def _unquote(text):
+    text = text.strip()
+    return text[1:-1] if len(text) >= 2 and text[0] == text[-1] == '"' else text
+
+
+def read_cue_sheet(path):
+    tracks = []
+    with open(path, encoding="utf-8-sig", errors="replace") as f:
+        for line in f:
+            words = line.split(None, 2)
+            if not words:
+                continue
+            key = words[0].upper()
+            if key == "TRACK":
+                tracks.append({"start": None, "image": None, "title": None})
+            elif not tracks:
+                continue  # Disc-level FILE, TITLE, PERFORMER...
+            elif key == "TITLE" and len(words) > 1:
+                tracks[-1]["title"] = _unquote(line.strip()[5:])
+            elif key == "REM" and len(words) == 3 and words[1].upper() == "IMAGE":
+                tracks[-1]["image"] = _unquote(words[2])
+            elif key == "INDEX" and len(words) == 3 and words[1] == "01":
+                mm, ss, ff = (int(x) for x in words[2].strip().split(":"))
+                tracks[-1]["start"] = mm * 60 + ss + ff / 75
+    return [track for track in tracks if track["start"] is not None]
+
+
+def read_timestamps(path):
+    cues = []
+    with open(path, encoding="utf-8-sig") as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            when, rest = (line.split(None, 1) + [""])[:2]
+            try:
+                start = parse_time(when)
+            except ValueError as e:
+                raise ValueError(f"{path}:{number}: {e}")
+            target, _, title = rest.partition(" | ")
+            if _is_image(target.strip()):
+                cues.append({"start": start, "image": target.strip(), "title": title.strip() or None})
+            else:
+                cues.append({"start": start, "image": None, "title": rest.strip() or None})
+    return cues
+
+
+def read_table(path):
+    if path.lower().endswith(".json"):
+        with open(path) as f:
+            rows = json.load(f)
+    else:
+        with open(path, newline="") as f:
+            rows = list(csv.DictReader(f))
+    cues = []
+    for row in rows:
+        if row.get("start") in (None, ""):
+            raise ValueError(f"Cue without a start: {row}")
+        cues.append({"start": parse_time(row["start"]), "image": (row.get("image") or "").strip() or None,
+                     "title": (row.get("title") or "").strip() or None})
+    return cues
+
+
+def load_cues(path, default_image=None):
+    """
+    The sections of a cue file as a list of {"start", "image", "title"},
+    sorted, starting at 0 and each with an (absolute) image path. Raises
+    ValueError for an unreadable file or a section without an image.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".cue":
+        cues = read_cue_sheet(path)
+    elif ext in (".csv", ".json"):
+        cues = read_table(path)
+    else:
+        cues = read_timestamps(path)
+    if not cues:
+        raise ValueError(f"No sections in {path}")
+
+    base = os.path.dirname(os.path.abspath(path))
+    cues.sort(key=lambda cue: cue["start"])
+    if cues[0]["start"] > 0:
+        cues.insert(0, {"start": 0.0, "image": None, "title": None})
+    image = default_image and os.path.abspath(default_image)
+    for cue in cues:
+        if cue["image"]:
+            image = os.path.join(base, os.path.expanduser(cue["image"]))
+        if not image:
+            raise ValueError(f"No image for the section at {cue['start']:g}s (give a default image with --image)")
+        if not os.path.isfile(image):
+            raise ValueError(f"Image {image} not found")
+        cue["image"] = image
+    return cues
+
+
+def plan_sections(cues, duration, fps):
+    """
+    Cues as whole frames at fps, up to the end of the audio: a list of
+    {"image", "title", "start", "frames"} (start in frames). Sections
+    starting at the same frame or after the audio are dropped.
+    """
+    end = math.ceil(duration * fps)
+    bounds = [min(round(cue["start"] * fps), end) for cue in cues] + [end]
+    sections = []
+    for cue, start, stop in zip(cues, bounds, bounds[1:]):
+        if stop > start:
+            sections.append({"image": cue["image"], "title": cue["title"], "start": start, "frames": stop - start})
+    return sections
+
+
+def write_chapters(path, sections, fps, duration):
+    """FFMETADATA file with a chapter per section, named by its title or image."""
+    def escape(text):
+        return re.sub(r"([=;#\\\n])", r"\\\1", text)
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(";FFMETADATA1\n")
+        for section in sections:
+            start = round(section["start"] / fps * 1000)
+            end = min(round((section["start"] + section["frames"]) / fps * 1000), round(duration * 1000))
+            title = section["title"] or os.path.splitext(os.path.basename(section["image"]))[0]
+            f.write(f"[CHAPTER]\nTIMEBASE=1/1000\nSTART={start}\nEND={end}\ntitle={escape(title)}\n")
+
+
+def render_slideshow(audio, cue_file, output, image=None, res="1920x1080", seed_len=60, bitrate="192k",
+                     portrait=False, preset=r.DEFAULT_PRESET, pix_fmt=r.DEFAULT_PIX_FMT, audio_policy="auto",
+                     frame_input=r.DEFAULT_FRAME_INPUT, work_dir=None, cache=None, log=print, seed_fps=None,
+                     muxer="concat", verify=False, on_progress=None, ram_budget=0,
+                     profile=codecs.DEFAULT_PROFILE, layout="plain", chapters=False, workers=None, audio_jobs=1):
+    """
+    Render audio with the images of cue_file (see load_cues), image being
+    the default for the start. One seed per image, encoded by up to
+    workers threads (default: one per core), no longer than seed_len and
+    than that image's longest section; the concat muxer then plays each
+    for its sections. With chapters, the titles become MP4 chapter
+    markers. "From Image" takes its size from the first image. The other
+    options are as for render. Returns the audio info from probe_audio.
+    """
+    if muxer != "concat":
+        raise ValueError("Slideshows need the concat muxer")
+    codecs.check_output(profile, output)
+    r.resolve_layout(layout, output, muxer)
+    log("Analyzing audio...")
+    with metrics.stage("probe"):
+        audio_info = r.probe_audio(audio)
+        duration = audio_info["duration"]
+        log(f"Detected audio duration: {duration:.2f}s")
+
+        cues = load_cues(cue_file, image)
+        with Image.open(cues[0]["image"]) as img:
+            size = r.parse_resolution(res, img.size, portrait)
+    res = f"{size[0]}x{size[1]}"  # Every seed the same size, or they can't be concatenated
+    fps = seed_fps or r.DEFAULT_SEED_FPS
+    sections = plan_sections(cues, duration, fps)
+    images = list(dict.fromkeys(section["image"] for section in sections))
+    log(f"{len(sections)} sections with {len(images)} images")
+
+    # Each image's seed: the usual length for its sections, but no longer than the longest of them
+    seed_frames = {}
+    for img_path in images:
+        lengths = [s["frames"] / fps for s in sections if s["image"] == img_path]
+        if seed_len is None:
+            wanted = r.guess_seed_len(max(lengths))
+        elif seed_len == "auto":
+            wanted = tuner.auto_seed_len(lengths, size, seed_fps, lambda msg: None)
+        else:
+            wanted = seed_len
+        seed_frames[img_path] = max(1, min(round(wanted * fps), max(s["frames"] for s in sections
+                                                                     if s["image"] == img_path)))
+
+    tracker = None
+    if on_progress:
+        tracker = ProgressTracker(on_progress)
+        tracker.plan("seed", sum(seed_frames.values()) / fps)
+        tracker.plan("audio", duration)
+        tracker.plan("mux", duration)
+    progress, seed_finished = tracker.parts("seed", images) if tracker else ({}, lambda image: None)
+
+    need = sum(estimate_bytes(size, frames / fps, seed_fps) for frames in seed_frames.values())
+    with pinning(cache), job_scratch(work_dir, ram_budget, need, log=log) as scratch:
+        def encode(img_path):
+            name = os.path.basename(img_path)
+            seconds = seed_frames[img_path] / fps
+            seed_clip, _, _ = r.prepare_seed(
+                img_path, res, int(seconds) if seconds.is_integer() else seconds, False, preset, pix_fmt,
+                frame_input, tempfile.mkdtemp(dir=scratch), cache, lambda msg: log(f"{name}: {msg}"),
+                seed_fps, profile=profile, progress=progress.get(img_path), bframes=False)
+            seed_finished(img_path)
+            return seed_clip
+
+        start = time.monotonic()
+        workers = min(workers or os.cpu_count() or 1, len(images))
+        with thread_budget.parallel(workers), ThreadPoolExecutor(max_workers=workers) as pool:
+            seeds = dict(zip(images, pool.map(metrics.propagate(encode), images)))
+        log(f"{len(images)} seeds ready in {time.monotonic() - start:.1f}s ({workers} at once)")
+
+        playlist = []
+        for section in sections:
+            clip, frames = seeds[section["image"]], seed_frames[section["image"]]
+            loops, rest = divmod(section["frames"], frames)
+            playlist += [(clip, frames / fps)] * loops + ([(clip, rest / fps)] if rest else [])
+        chapter_file = None
+        if chapters:
+            chapter_file = os.path.join(scratch, "chapters.txt")
+            write_chapters(chapter_file, sections, fps, duration)
+            log(f"Adding {len(sections)} chapter markers")
+        r.render_track(audio, seeds[images[0]], None, output, bitrate, audio_info, audio_policy, scratch,
+                       cache, log, muxer, verify, tracker, profile, layout, playlist, chapter_file, audio_jobs)
+    return audio_info
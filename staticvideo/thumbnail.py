@@ -0,0 +1,89 @@
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+# Preview thumbnails for the GUIs. Large artwork is decoded at reduced size
+# (JPEG draft mode scales in the DCT, Image.reduce bins other formats) so a
+# 100MP image never has to be held at full resolution just to show 300px.
+# render.letterbox_file decodes seed frames the same way.
+
+PREVIEW_SIZE = (300, 300)
+
+
+def fit_size(image_size, size):
+    """image_size scaled down (never up) to fit inside size, keeping its aspect ratio."""
+    w, h = image_size
+    scale = min(1, size[0] / w, size[1] / h)
+    return max(1, round(w * scale)), max(1, round(h * scale))
+
+
+def decode_reduced(img, size, reducing_gap=1):
+    """
+    Decode an opened, not yet loaded img at the smallest size that still
+    covers size, as RGB, RGBA or L. Formats without draft mode are binned
+    down to no less than reducing_gap times size, since binning right down
+    to the target aliases fine detail (Pillow's thumbnail uses 2). Returns
+    (image, size it was decoded at); the image is img itself when nothing
+    could be saved.
+    """
+    img.draft("RGB", size)
+    decoded = img.size
+    if img.mode not in ("RGB", "RGBA", "L"):
+        img = img.convert("RGBA")
+    factor = min(img.width // round(size[0] * reducing_gap), img.height // round(size[1] * reducing_gap))
+    return (img.reduce(factor) if factor >= 2 else img), decoded
+
+
+def load_thumbnail(path, size=PREVIEW_SIZE):
+    """Decode path at the smallest size that still covers size, then fit it with Lanczos. Returns RGB."""
+    with Image.open(path) as img:
+        thumb, _ = decode_reduced(img, fit_size(img.size, size))
+        if thumb is img:
+            thumb = img.copy()
+    thumb.thumbnail(size, Image.LANCZOS)
+    return thumb.convert("RGB")
+
+
+class ThumbnailCache:
+    """
+    Small LRU of thumbnails keyed by (path, mtime), so switching back to a
+    recent image is instant and an edited file is decoded again. Safe to
+    use from a worker thread while the GUI thread checks cached().
+    """
+
+    def __init__(self, size=PREVIEW_SIZE, max_entries=16):
+        self.size = size
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, path):
+        return os.path.abspath(path), os.stat(path).st_mtime_ns
+
+    def cached(self, path):
+        """The thumbnail if it is already cached, else None."""
+        try:
+            key = self._key(path)
+        except OSError:
+            return None
+        with self._lock:
+            thumb = self._entries.get(key)
+            if thumb is not None:
+                self._entries.move_to_end(key)
+            return thumb
+
+    def get(self, path):
+        """The cached thumbnail, decoding it first if needed. Raises OSError for unreadable files."""
+        thumb = self.cached(path)
+        if thumb is not None:
+            return thumb
+        key = self._key(path)
+        thumb = load_thumbnail(path, self.size)
+        with self._lock:
+            self._entries[key] = thumb
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return thumb
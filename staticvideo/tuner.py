@@ -0,0 +1,144 @@
+import os
+import json
+import math
+import time
+import shutil
+import tempfile
+from datetime import datetime
+
+from PIL import Image
+
+# Seed length auto-tuning. A longer seed costs more to encode, a shorter one
+# means more loops for the concat demuxer to walk. Both costs depend on the
+# machine, so they are measured once (calibrate) and kept as a small linear
+# model:
+#
+#   seed encode  = seed_fixed_s + seed_s_per_mpix_s * megapixels * seed_len
+#   final mux    = loop_s * number_of_loops   (+ a part that doesn't depend on seed_len)
+#
+# choose_seed_len then picks the length with the lowest predicted total.
+#
+# render imports this module, so render is imported inside the functions
+# that use it rather than at the top: importing tuner first works too.
+
+MAX_SEED_LEN = 600
+
+
+def model_path():
+    base = os.environ.get("XDG_CONFIG_HOME") or os.path.expanduser("~/.config")
+    return os.path.join(base, "staticvideo", "cost_model.json")
+
+
+def _model_key(seed_fps):
+    from . import render as r
+    return f"{seed_fps or r.DEFAULT_SEED_FPS:g}fps"
+
+
+def load_model(seed_fps=None, path=None):
+    """The calibrated model for this seed frame rate, or None if there isn't one."""
+    try:
+        with open(path or model_path()) as f:
+            return json.load(f).get(_model_key(seed_fps))
+    except (OSError, ValueError):
+        return None
+
+
+def save_model(model, seed_fps=None, path=None):
+    path = path or model_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        with open(path) as f:
+            models = json.load(f)
+    except (OSError, ValueError):
+        models = {}
+    models[_model_key(seed_fps)] = model
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(models, f, indent=2)
+    os.replace(tmp, path)
+
+
+def _timed(fn):
+    start = time.monotonic()
+    fn()
+    return time.monotonic() - start
+
+
+def calibrate(res="1920x1080", seed_fps=None, short=2, long=10, mux_duration=400, log=print):
+    """
+    Measure seed encode cost and per-loop concat overhead on this machine and
+    return the model (see the module comment). Takes about as long as
+    encoding a `long` second seed plus two short muxes.
+    """
+    from . import render as r
+    size = r.parse_resolution(res)
+    megapixels = size[0] * size[1] / 1e6
+    # Something with detail, so the encoder has real work to do
+    canvas = Image.effect_mandelbrot(size, (-2.0, -1.2, 1.0, 1.2), 64).convert("RGB")
+
+    scratch = tempfile.mkdtemp(prefix="staticvideo-calibrate-")
+    try:
+        seeds = {}
+        times = {}
+        for seed_len in (short, long):
+            seeds[seed_len] = os.path.join(scratch, f"seed{seed_len}.mp4")
+            log(f"Encoding a {seed_len}s {size[0]}x{size[1]} seed...")
+            times[seed_len] = _timed(lambda: r.encode_seed_raw(canvas, seed_len, seeds[seed_len], fps=seed_fps))
+
+        per_mpix_s = max((times[long] - times[short]) / ((long - short) * megapixels), 1e-6)
+        fixed = max(times[short] - per_mpix_s * megapixels * short, 0.0)
+
+        # Same output duration with two seed lengths: the difference is the loop count
+        mux_times = {}
+        for seed_len in (short, long):
+            loops = math.ceil(mux_duration / seed_len)
+            log(f"Concatenating {loops} loops of the {seed_len}s seed...")
+            concat_file = os.path.join(scratch, "list.txt")
+            r.write_concat_list(concat_file, seeds[seed_len], loops)
+            out = os.path.join(scratch, "mux.mp4")
+            mux_times[seed_len] = _timed(lambda: r.ffmpeg(
+                '-f', 'concat', '-safe', '0', '-i', concat_file, '-c', 'copy', out))
+        extra_loops = math.ceil(mux_duration / short) - math.ceil(mux_duration / long)
+        loop_s = max((mux_times[short] - mux_times[long]) / extra_loops, 1e-6)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    return {
+        "res": f"{size[0]}x{size[1]}",
+        "seed_fixed_s": fixed,
+        "seed_s_per_mpix_s": per_mpix_s,
+        "loop_s": loop_s,
+        "calibrated": datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def predict(model, seed_len, durations, size):
+    """Predicted seconds for one seed of seed_len shared by tracks of the given durations."""
+    megapixels = size[0] * size[1] / 1e6
+    seed = model["seed_fixed_s"] + model["seed_s_per_mpix_s"] * megapixels * seed_len
+    loops = sum(math.ceil(d / seed_len) for d in durations)
+    return seed + model["loop_s"] * loops
+
+
+def choose_seed_len(model, durations, size):
+    """Seed length (whole seconds) with the lowest predicted total time."""
+    if isinstance(durations, (int, float)):
+        durations = [durations]
+    longest = max(1, math.ceil(max(durations)))
+    candidates = range(1, min(longest, MAX_SEED_LEN) + 1)
+    return min(candidates, key=lambda seed_len: (predict(model, seed_len, durations, size), seed_len))
+
+
+def auto_seed_len(durations, size, seed_fps=None, log=print):
+    """choose_seed_len with the saved model, or the old step function if not calibrated."""
+    from . import render as r
+    model = load_model(seed_fps)
+    if isinstance(durations, (int, float)):
+        durations = [durations]
+    if not model:
+        seed_len = r.guess_seed_len(max(durations))
+        log(f"No seed calibration for this machine (run wavimg2mp4 --calibrate), guessing {seed_len}s")
+        return seed_len
+    seed_len = choose_seed_len(model, durations, size)
+    log(f"Auto seed length {seed_len}s (predicted seed + loop cost {predict(model, seed_len, durations, size):.1f}s)")
+    return seed_len
@@ -0,0 +1,271 @@
+import os
+import sys
+import json
+import time
+import select
+import ctypes
+import ctypes.util
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+from . import render as r
+from . import cpubudget, metrics
+
+# Watch-folder mode: audio (and artwork) dropped into the watched
+# directories turns into an MP4 next to the audio. Directories are rescanned
+# whenever inotify reports a change (Linux), and on a timer otherwise or as
+# a safety net, since inotify doesn't see writes made by other machines to a
+# network share. A file is only used once its size and mtime have stayed
+# the same for `settle` seconds. Finished inputs go into a JSON lines journal
+# so a restart doesn't render them again.
+
+AUDIO_EXTS = ('.wav', '.flac', '.mp3', '.m4a', '.aif', '.aiff', '.ogg', '.opus')
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tif', '.tiff')
+# Folder-level artwork, used for audio without a same-named image
+COVER_NAMES = ('cover', 'folder', 'front', 'artwork', 'album')
+
+
+def default_journal():
+    base = os.environ.get("XDG_STATE_HOME") or os.path.expanduser("~/.local/state")
+    return os.path.join(base, "staticvideo", "watch-journal.jsonl")
+
+
+class Inotify:
+    """Minimal inotify through libc: only says *that* something changed, scan() finds out what."""
+
+    MASK = 0x8 | 0x80 | 0x100 | 0x200  # IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watched = set()
+
+    def add(self, path):
+        if path in self.watched:
+            return
+        if self.libc.inotify_add_watch(self.fd, os.fsencode(path), self.MASK) < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+        self.watched.add(path)
+
+    def wait(self, timeout):
+        """Block until an event or timeout; True if something changed."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+        try:
+            while os.read(self.fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+def open_inotify(log=print):
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        return Inotify()
+    except (OSError, AttributeError) as e:
+        log(f"inotify unavailable ({e}), polling")
+        return None
+
+
+def load_journal(path):
+    """{key: entry} of every input recorded in the journal, later lines winning."""
+    entries = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    entries[entry["key"]] = entry
+                except (ValueError, KeyError):
+                    continue  # A line cut short by a crash
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def append_journal(path, entry):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a") as f:
+        f.write(json.dumps(entry) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def find_image(audio, images):
+    """The image for audio: same file name, else a folder cover, else the folder's only image."""
+    stem = os.path.splitext(os.path.basename(audio))[0].lower()
+    by_stem = {}
+    for image in images:
+        by_stem.setdefault(os.path.splitext(os.path.basename(image))[0].lower(), image)
+    if stem in by_stem:
+        return by_stem[stem]
+    for name in COVER_NAMES:
+        if name in by_stem:
+            return by_stem[name]
+    return images[0] if len(images) == 1 else None
+
+
+def _init_worker(budget):
+    r.set_ffmpeg_loglevel("error")
+    cpubudget.init_worker(budget)
+
+
+def _render_job(job, opts, metrics_output):
+    # render writes the output under a hidden partial name (skipped by scan) and renames it when done
+    start = time.monotonic()
+    with metrics.collect(metrics_output, audio=job["audio"], image=job["image"], output=job["output"]):
+        r.render(job["audio"], job["image"], job["output"], log=lambda msg: None, **opts)
+    return time.monotonic() - start
+
+
+class Watcher:
+    """
+    Watch dirs (recursively) and render each settled audio file with its
+    image through a pool of `workers` processes. render_opts are passed to
+    render (res, seed_len, bitrate, audio_policy, cache, ...); metrics_output
+    gets each job's metrics record (see metrics.collect).
+    """
+
+    def __init__(self, dirs, render_opts=None, workers=None, journal=None, settle=5.0, poll=5.0,
+                 use_inotify=True, log=print, metrics_output=None):
+        self.dirs = [os.path.abspath(os.path.expanduser(d)) for d in dirs]
+        render_opts = dict(render_opts or {})
+        # Workers can't see each other's cache pins, so they get a cache that leaves eviction to this process
+        self.cache = render_opts.get("cache")
+        if self.cache:
+            render_opts["cache"] = self.cache.worker_copy()
+        self.render_opts = render_opts
+        self.metrics_output = metrics_output
+        self.workers = workers or max(1, (os.cpu_count() or 2) // 2)
+        self.journal_path = journal or default_journal()
+        self.journal = load_journal(self.journal_path)
+        self.settle = settle
+        self.poll = poll
+        self.log = log
+        self.inotify = open_inotify(log) if use_inotify else None
+        self.sizes = {}      # path -> (size, mtime_ns, monotonic time it was first seen like that)
+        self.running = {}    # future -> job
+        self.active = set()  # journal keys of submitted jobs
+        self.waiting = set() # audio already reported as having no image
+
+    def _stable(self, path, st, now):
+        """True once path has kept its size and mtime for settle seconds."""
+        sig = (st.st_size, st.st_mtime_ns)
+        seen = self.sizes.get(path)
+        if not seen or seen[:2] != sig:
+            self.sizes[path] = (*sig, now)
+            return False
+        return st.st_size > 0 and now - seen[2] >= self.settle
+
+    def scan(self):
+        """Walk the watched dirs; returns (jobs ready to render, whether anything is still settling)."""
+        now = time.monotonic()
+        ready, settling = [], False
+        present = set()
+        for root in self.dirs:
+            for folder, subdirs, files in os.walk(root):
+                subdirs[:] = [d for d in subdirs if not d.startswith(".")]
+                if self.inotify:
+                    try:
+                        self.inotify.add(folder)
+                    except OSError as e:
+                        self.log(f"Not watching {folder}: {e}")
+                audio, images = [], []
+                for name in sorted(files):
+                    if name.startswith("."):
+                        continue
+                    path = os.path.join(folder, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    present.add(path)
+                    ext = os.path.splitext(name)[1].lower()
+                    if ext not in AUDIO_EXTS + IMAGE_EXTS:
+                        continue
+                    if not self._stable(path, st, now):
+                        settling = True
+                        continue
+                    (audio if ext in AUDIO_EXTS else images).append((path, st))
+
+                image_paths = [path for path, _ in images]
+                image_stats = dict(images)
+                for path, st in audio:
+                    image = find_image(path, image_paths)
+                    if not image:
+                        if path not in self.waiting:
+                            self.log(f"Waiting for an image for {path}")
+                            self.waiting.add(path)
+                        continue
+                    self.waiting.discard(path)
+                    key = f"{path}|{st.st_size}|{st.st_mtime_ns}|{image}|{image_stats[image].st_mtime_ns}"
+                    if key in self.journal or key in self.active:
+                        continue
+                    ready.append({"key": key, "audio": path, "image": image,
+                                  "output": os.path.splitext(path)[0] + ".mp4"})
+        # Forget deleted files
+        for path in list(self.sizes):
+            if path not in present:
+                del self.sizes[path]
+        return ready, settling
+
+    def _collect(self):
+        finished = [f for f in self.running if f.done()]
+        for future in finished:
+            job = self.running.pop(future)
+            self.active.discard(job["key"])
+            if future.cancelled():
+                continue  # Shut down before it started: not journaled, picked up on restart
+            try:
+                wall = future.result()
+                entry = {**job, "status": "done", "wall_s": round(wall, 2)}
+                self.log(f"Rendered {job['output']} ({wall:.1f}s)")
+            except Exception as e:
+                entry = {**job, "status": "failed", "error": str(e)}
+                self.log(f"Failed {job['audio']}: {e}")
+            entry["time"] = datetime.now().isoformat(timespec="seconds")
+            # Failures are journaled too: the input is retried only once it changes
+            self.journal[job["key"]] = entry
+            append_journal(self.journal_path, entry)
+        # Evict once no job is still reading from the cache; a busy queue catches up when it drains
+        if finished and self.cache and not self.running:
+            self.cache.evict()
+
+    def run(self, once=False):
+        """Watch until interrupted. With once, render what is there now and return."""
+        self.log(f"Watching {', '.join(self.dirs)} with {self.workers} workers "
+                 f"({'inotify' if self.inotify else f'polling every {self.poll:g}s'}), journal {self.journal_path}")
+        pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                   initargs=(cpubudget.budget.config(self.workers),))
+        try:
+            while True:
+                self._collect()
+                ready, settling = self.scan()
+                for job in ready:
+                    self.log(f"Queued {os.path.basename(job['audio'])} with {os.path.basename(job['image'])}")
+                    self.active.add(job["key"])
+                    self.running[pool.submit(_render_job, job, self.render_opts, self.metrics_output)] = job
+                if once and not ready and not settling and not self.running:
+                    return
+                if settling or self.running:
+                    # Check back soon: files to settle or jobs to collect
+                    timeout = min(self.poll, max(self.settle / 2, 0.5))
+                else:
+                    timeout = 60.0 if self.inotify else self.poll
+                if self.inotify:
+                    self.inotify.wait(timeout)
+                else:
+                    time.sleep(timeout)
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+            self._collect()
+            if self.inotify:
+                self.inotify.close()
@@ -0,0 +1,68 @@
+import struct
+
+import pytest
+
+from staticvideo.audiochunks import AAC_FRAME, MIN_RANGE_SECONDS, PREROLL, TAIL, adts_frames, join_ranges, plan_ranges
+
+
+def _adts(payload):
+    length = 7 + len(payload)
+    header = bytes([0xFF, 0xF1, 0x50, 0x80 | (length >> 11) & 3, (length >> 3) & 0xFF,
+                    (length & 7) << 5 | 0x1F, 0xFC])
+    return header + payload
+
+
+def _fake_encode(path, start, end):
+    """
+    What encode_range's ffmpeg writes for samples [start, end), with each
+    frame tagged by its number in a single-pass encode: a priming frame,
+    then one frame per 1024 samples begun, then the flush frame.
+    """
+    first = start // AAC_FRAME
+    count = -(-(end - start) // AAC_FRAME) + 1
+    path.write_bytes(b"".join(_adts(struct.pack(">I", first + k)) for k in range(count)))
+
+
+def test_plan_ranges():
+    assert plan_ranges(MIN_RANGE_SECONDS - 1, 44100, 8) == [0]
+    starts = plan_ranges(1000, 48000, 4)
+    assert len(starts) == 3 and starts[0] == 0
+    assert all(s % AAC_FRAME == 0 for s in starts)
+    assert starts == sorted(starts)
+    assert plan_ranges(10 * MIN_RANGE_SECONDS, 44100, 1) == [0]
+
+
+def test_adts_frames_rejects_garbage():
+    frames = [_adts(b"a"), _adts(b"bcd")]
+    assert adts_frames(b"".join(frames)) == frames
+    with pytest.raises(ValueError):
+        adts_frames(frames[0] + b"\0" * 8)
+
+
+@pytest.mark.parametrize("sample_rate, duration, jobs", [(44100, 1234.5, 4), (48000, 610, 2), (8000, 900, 3)])
+def test_join_ranges_matches_single_pass_frames(tmp_path, sample_rate, duration, jobs):
+    total = int(duration * sample_rate)
+    starts = plan_ranges(duration, sample_rate, jobs)
+    assert len(starts) > 1
+    files = []
+    for i, start in enumerate(starts):
+        # The same preroll and tail encode_aac_chunked asks encode_range for
+        end = starts[i + 1] + TAIL if i + 1 < len(starts) else total
+        path = tmp_path / f"range{i}.aac"
+        _fake_encode(path, max(0, start - PREROLL), end)
+        files.append(str(path))
+    joined = tmp_path / "joined.aac"
+    join_ranges(files, starts, str(joined))
+
+    numbers = [struct.unpack(">I", frame[7:])[0] for frame in adts_frames(joined.read_bytes())]
+    single_pass = -(-total // AAC_FRAME) + 1
+    assert numbers == list(range(single_pass))
+
+
+def test_join_ranges_reports_short_range(tmp_path):
+    starts = [0, 100 * AAC_FRAME]
+    first, second = tmp_path / "a.aac", tmp_path / "b.aac"
+    _fake_encode(first, 0, 50 * AAC_FRAME)
+    _fake_encode(second, starts[1] - PREROLL, 200 * AAC_FRAME)
+    with pytest.raises(RuntimeError):
+        join_ranges([str(first), str(second)], starts, str(tmp_path / "joined.aac"))
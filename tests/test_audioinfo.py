@@ -0,0 +1,40 @@
+import shutil
+import subprocess
+
+import pytest
+
+from staticvideo import audioinfo
+from staticvideo.audiochunks import decoded_samples
+
+pytestmark = pytest.mark.skipif(not shutil.which("ffmpeg"), reason="needs ffmpeg")
+
+
+@pytest.fixture
+def vbr_mp3(tmp_path):
+    """VBR MP3 without a Xing/VBRI header: 10s of silence (tiny frames), then 23s of noise (large ones)."""
+    path = tmp_path / "vbr.mp3"
+    result = subprocess.run(
+        ['ffmpeg', '-v', 'error', '-y', '-f', 'lavfi', '-i', 'anullsrc=r=44100:cl=stereo:d=10',
+         '-f', 'lavfi', '-i', 'anoisesrc=r=44100:d=23.04:a=0.5',
+         '-filter_complex', '[1]aformat=channel_layouts=stereo[n];[0][n]concat=n=2:v=0:a=1',
+         '-c:a', 'libmp3lame', '-q:a', '2', '-write_xing', '0', str(path)], capture_output=True)
+    if result.returncode != 0:
+        pytest.skip("ffmpeg without libmp3lame")
+    return path
+
+
+def test_vbr_mp3_without_xing_header(vbr_mp3):
+    data = vbr_mp3.read_bytes()
+    assert b"Xing" not in data[:4096] and b"Info" not in data[:4096] and b"VBRI" not in data[:4096]
+    info = audioinfo.read_header(str(vbr_mp3))
+    assert info["codec"] == "mp3" and info["sample_rate"] == 44100 and info["channels"] == 2
+    assert info["duration"] == pytest.approx(decoded_samples(str(vbr_mp3)) / 44100, abs=0.001)
+
+
+def test_mp3_that_loses_sync_is_left_to_ffprobe(vbr_mp3, tmp_path):
+    data = bytearray(vbr_mp3.read_bytes())
+    middle = len(data) // 2
+    data[middle:middle + 600] = bytes(600)
+    broken = tmp_path / "broken.mp3"
+    broken.write_bytes(data)
+    assert audioinfo.read_header(str(broken)) is None
@@ -0,0 +1,95 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from staticvideo.cache import MediaCache, parse_size, pinning
+
+
+def _store(cache, name, size, age):
+    """Store a size-byte entry, back-dated so that a larger age is less recently used."""
+    path = cache.store(cache.key(name), ".bin", lambda tmp: Path(tmp).write_bytes(bytes(size)))
+    when = 1_000_000 - age
+    os.utime(path, (when, when))
+    return path
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("1024", 1024), ("500M", 500 * 1024 ** 2), ("4G", 4 * 1024 ** 3), ("1.5k", 1536),
+    ("2 GiB", 2 * 1024 ** 3), ("10mb", 10 * 1024 ** 2), (" 3T ", 3 * 1024 ** 4),
+])
+def test_parse_size(text, expected):
+    assert parse_size(text) == expected
+
+
+@pytest.mark.parametrize("text", ["", "G", "-1M", "4X", "1,5G"])
+def test_parse_size_rejects(text):
+    with pytest.raises(ValueError):
+        parse_size(text)
+
+
+def test_evict_removes_least_recently_used(tmp_path):
+    cache = MediaCache(str(tmp_path), max_bytes=250, auto_evict=False)
+    old = _store(cache, "old", 100, age=30)
+    mid = _store(cache, "mid", 100, age=20)
+    new = _store(cache, "new", 100, age=10)
+    cache.evict()
+    assert not os.path.exists(old)
+    assert os.path.exists(mid) and os.path.exists(new)
+    assert cache.size() == 200
+
+
+def test_lookup_refreshes_lru_position(tmp_path):
+    cache = MediaCache(str(tmp_path), max_bytes=250, auto_evict=False)
+    old = _store(cache, "old", 100, age=30)
+    mid = _store(cache, "mid", 100, age=20)
+    _store(cache, "new", 100, age=10)
+    assert cache.lookup(cache.key("old"), ".bin") == old
+    cache.evict()
+    assert os.path.exists(old) and not os.path.exists(mid)
+
+
+def test_pinned_entries_survive_eviction(tmp_path):
+    cache = MediaCache(str(tmp_path), max_bytes=150, auto_evict=False)
+    with pinning(cache):
+        old = _store(cache, "old", 100, age=30)
+        assert cache.pinned() == {old}
+        new = _store(cache, "new", 100, age=10)
+        cache.evict()
+        # Both are pinned by this job, so the cache is left over its limit
+        assert os.path.exists(old) and os.path.exists(new)
+    assert cache.pinned() == set()
+    cache.evict()
+    assert not os.path.exists(old) and os.path.exists(new)
+
+
+def test_other_jobs_pins_are_kept(tmp_path):
+    cache = MediaCache(str(tmp_path), max_bytes=150, auto_evict=False)
+    with pinning(cache):
+        old = _store(cache, "old", 100, age=30)
+        with pinning(cache):
+            _store(cache, "new", 100, age=10)
+        # The inner job is done; the outer one still holds its entry
+        assert cache.pinned() == {old}
+        cache.evict()
+        assert os.path.exists(old)
+
+
+def test_store_evicts_unless_worker_copy(tmp_path):
+    cache = MediaCache(str(tmp_path), max_bytes=150)
+    worker = cache.worker_copy()
+    assert worker.root == cache.root and not worker.auto_evict
+    _store(worker, "a", 100, age=30)
+    _store(worker, "b", 100, age=20)
+    assert cache.size() == 200
+    _store(cache, "c", 100, age=0)
+    assert cache.size() == 100
+
+
+def test_temp_and_hidden_files_are_not_entries(tmp_path):
+    cache = MediaCache(str(tmp_path), auto_evict=False)
+    (tmp_path / ".encoders.json").write_text("{}")
+    (tmp_path / ".abc.tmp.mp4").write_bytes(bytes(10))
+    assert cache.entries() == []
+    cache.clear()
+    assert (tmp_path / ".encoders.json").exists()
@@ -0,0 +1,68 @@
+import pytest
+
+from staticvideo import cpubudget
+from staticvideo.cpubudget import ThreadBudget, parse_cpus
+
+
+@pytest.fixture(autouse=True)
+def eight_cpus(monkeypatch):
+    monkeypatch.setattr(cpubudget, "available_cpus", lambda: 8)
+
+
+def test_parse_cpus():
+    assert parse_cpus("0-3,6") == [0, 1, 2, 3, 6]
+    assert parse_cpus(" 5, 1 ,1-2,") == [1, 2, 5]
+    for text in ("", ",", "a-3", "-2", "1-2-3", "3-x"):
+        with pytest.raises(ValueError):
+            parse_cpus(text)
+
+
+def test_one_job_keeps_the_whole_machine():
+    budget = ThreadBudget()
+    with budget.slot() as share:
+        assert share == 8
+        cmd = ["ffmpeg", "-i", "in.wav", "out.m4a"]
+        assert budget.ffmpeg_args(cmd, share) == cmd
+
+
+def test_running_processes_split_the_threads():
+    budget = ThreadBudget()
+    with budget.slot() as first:
+        with budget.slot() as second:
+            with budget.slot() as third:
+                assert (first, second, third) == (8, 4, 2)
+    assert budget.running == 0
+
+
+def test_expected_jobs_and_parallel_work_reserve_threads():
+    budget = ThreadBudget(jobs=2)
+    with budget.slot() as share:
+        assert share == 4
+    with budget.parallel(4):
+        # 2 jobs plus 3 more processes for the split work
+        with budget.slot() as share:
+            assert share == 1
+    with budget.slot() as share:
+        assert share == 4
+
+
+def test_share_never_drops_below_one_thread():
+    budget = ThreadBudget(threads=2, jobs=5)
+    with budget.slot() as share:
+        assert share == 1
+
+
+def test_ffmpeg_args_place_thread_options():
+    budget = ThreadBudget()
+    cmd = ["ffmpeg", "-y", "-i", "in.wav", "-c:a", "aac", "out.m4a"]
+    assert budget.ffmpeg_args(cmd, 2) == ["ffmpeg", "-filter_threads", "2", "-y", "-i", "in.wav", "-c:a", "aac",
+                                          "-threads", "2", "out.m4a"]
+
+
+def test_worker_config_and_cpu_list():
+    budget = ThreadBudget(cpus=[0, 1, 2, 3], nice=5)
+    assert budget.threads == 4
+    assert budget.config(workers=3) == {"threads": 1, "jobs": 1, "nice": 5, "cpus": [0, 1, 2, 3]}
+    budget.configure(cpus=[])
+    assert budget.cpus is None and budget.threads == 8
+    assert budget.describe() == "8 threads, nice 5"
@@ -0,0 +1,122 @@
+import math
+import shutil
+import struct
+import subprocess
+from types import SimpleNamespace
+
+import pytest
+
+from staticvideo import mp4mux
+
+
+def _ffmpeg(*args):
+    subprocess.run(['ffmpeg', '-v', 'error', '-y', *args], check=True, capture_output=True)
+
+
+@pytest.fixture(scope="module")
+def media(tmp_path_factory):
+    if not shutil.which("ffmpeg"):
+        pytest.skip("needs ffmpeg")
+    work = tmp_path_factory.mktemp("mp4mux")
+    files = {name: str(work / f"{name}.mp4") for name in ("seed", "bframes", "audio")}
+    try:
+        for name, bframes in (("seed", "0"), ("bframes", "3")):
+            _ffmpeg('-f', 'lavfi', '-i', 'testsrc=size=160x120:rate=25:duration=2', '-c:v', 'libx264',
+                    '-bf', bframes, '-g', '50', '-pix_fmt', 'yuv420p', files[name])
+        _ffmpeg('-f', 'lavfi', '-i', 'sine=frequency=440:sample_rate=44100:duration=5.3', '-c:a', 'aac',
+                files["audio"])
+    except subprocess.CalledProcessError:
+        pytest.skip("ffmpeg without libx264 or aac")
+    return files
+
+
+def _samples(path, track):
+    with open(path, "rb") as f:
+        result = []
+        for offset, size in zip(track.offsets, track.sizes):
+            f.seek(offset)
+            result.append(f.read(size))
+        return result
+
+
+def _top_level(path):
+    with open(path, "rb") as f:
+        boxes = mp4mux.read_top_level(f)
+    return sorted(boxes, key=lambda typ: boxes[typ][0]), boxes
+
+
+@pytest.mark.parametrize("faststart", [False, True])
+def test_loops_share_the_stored_seed_samples(media, tmp_path, faststart):
+    out = str(tmp_path / "out.mp4")
+    loops = mp4mux.mux_looped(media["seed"], media["audio"], out, 5.3, faststart=faststart)
+    assert loops == 3
+
+    order, boxes = _top_level(out)
+    assert order == (["ftyp", "moov", "mdat"] if faststart else ["ftyp", "mdat", "moov"])
+    mdat_payload = boxes["mdat"][0] + 16
+
+    seed = mp4mux._track(media["seed"], "vide")
+    video = mp4mux._track(out, "vide")
+    n = len(seed.sizes)
+    assert len(video.sizes) == math.ceil(5.3 * 25)     # the last frame is cut short
+    # Every loop's chunk points back at the one stored copy, which is the start of mdat
+    for start in range(0, len(video.sizes), n):
+        loop = video.offsets[start:start + n]
+        assert loop == video.offsets[:len(loop)]
+    assert video.offsets[0] == mdat_payload
+    assert _samples(out, video)[:n] == _samples(media["seed"], seed)
+    assert sorted(video.sync) == [1, n + 1, 2 * n + 1]
+    # The last loop is cut at the audio duration
+    assert sum(video.durations) == round(5.3 * video.timescale)
+
+    source = mp4mux._track(media["audio"], "soun")
+    audio = mp4mux._track(out, "soun")
+    assert audio.offsets[0] == mdat_payload + sum(seed.sizes)
+    assert audio.offsets == sorted(audio.offsets)
+    assert _samples(out, audio) == _samples(media["audio"], source)
+    with open(out, "rb") as f:
+        f.seek(0, 2)
+        assert f.tell() == mdat_payload + sum(seed.sizes) + sum(source.sizes) + (0 if faststart else
+                                                                                    boxes["moov"][1])
+
+
+def test_ftyp_brand_and_audio_edit_list(media, tmp_path):
+    out = str(tmp_path / "out.mp4")
+    mp4mux.mux_looped(media["seed"], media["audio"], out, 5.3)
+    with open(out, "rb") as f:
+        data = f.read()
+    assert data[4:8] == b"ftyp"
+    assert data[16:32] == b"isomiso2avc1mp41"
+
+    moov = data[_top_level(out)[1]["moov"][0]:]
+    traks = [(p, e) for typ, _, p, e in mp4mux.iter_boxes(moov, 8) if typ == "trak"]
+    audio = mp4mux.Track(moov, *traks[1])
+    assert audio.handler == "soun" and audio.media_time > 0
+    elst = mp4mux.find_box(moov, "edts/elst", *traks[1])[0]
+    segment, media_time = struct.unpack_from(">Qq", moov, elst + 8)
+    # The edit covers the audio after its priming, not the priming on top of it
+    assert media_time == audio.media_time
+    assert segment == (sum(audio.durations) - media_time) * mp4mux.MOVIE_TIMESCALE // audio.timescale
+    assert abs(segment - 5300) <= 1
+
+
+def test_b_frame_seed_is_cut_after_complete_frames(media, tmp_path):
+    out = str(tmp_path / "out.mp4")
+    seed = mp4mux._track(media["bframes"], "vide")
+    assert seed.ctts
+    mp4mux.mux_looped(media["bframes"], media["audio"], out, 5.3)
+    video = mp4mux._track(out, "vide")
+    n = len(seed.sizes)
+    cut = len(video.sizes) % n
+    assert cut == 0 or cut in mp4mux._cut_points(seed)
+    assert len(video.sizes) >= round(5.3 * 25)
+    assert video.durations == seed.durations * (len(video.sizes) // n) + seed.durations[:cut]
+    assert video.ctts == seed.ctts * (len(video.sizes) // n) + seed.ctts[:cut]
+
+
+def test_cut_points():
+    # Decoded as I P B B P B, shown as I B B P B P
+    track = SimpleNamespace(sizes=[1] * 6, durations=[1] * 6, ctts=[1, 3, 0, 0, 2, 0])
+    assert mp4mux._cut_points(track) == {1, 4, 6}
+    track.ctts = None
+    assert mp4mux._cut_points(track) == {1, 2, 3, 4, 5, 6}
@@ -0,0 +1,75 @@
+import pytest
+
+from staticvideo.progress import ProgressTracker, format_eta, parse_progress
+
+BLOCKS = """\
+frame=10
+out_time_us=2500000
+speed=12.5x
+progress=continue
+out_time_ms=5000000
+speed=N/A
+progress=continue
+out_time_us=-23000
+progress=continue
+out_time_us=10000000
+speed= 20x
+progress=end
+"""
+
+
+def test_parse_progress_blocks():
+    assert list(parse_progress(BLOCKS.splitlines())) == [
+        {"time": 2.5, "speed": 12.5, "done": False},
+        {"time": 5.0, "speed": None, "done": False},
+        {"time": 0.0, "speed": None, "done": False},
+        {"time": 10.0, "speed": 20.0, "done": True},
+    ]
+
+
+def test_parse_progress_ignores_noise():
+    lines = ["", "not a key value line", "out_time_us=N/A", "progress=continue"]
+    assert list(parse_progress(lines)) == [{"time": 0.0, "speed": None, "done": False}]
+
+
+@pytest.mark.parametrize("seconds, text", [(None, "--:--"), (0, "0:00"), (75.9, "1:15"), (3725, "1:02:05")])
+def test_format_eta(seconds, text):
+    assert format_eta(seconds) == text
+
+
+def test_tracker_weights_stages_by_media_and_speed():
+    updates = []
+    tracker = ProgressTracker(updates.append)
+    tracker.plan("seed", 10, speed=10)    # weight 1
+    tracker.plan("mux", 300, speed=100)   # weight 3
+    seed = tracker.stage("seed")
+    seed({"time": 5, "speed": 2.0, "done": False})
+    assert updates[-1]["stage"] == "seed"
+    assert updates[-1]["stage_fraction"] == pytest.approx(0.5)
+    assert updates[-1]["overall"] == pytest.approx(0.125)
+    assert updates[-1]["speed"] == 2.0
+    seed({"time": 9, "speed": None, "done": True})
+    assert updates[-1]["stage_fraction"] == 1.0
+    assert updates[-1]["overall"] == pytest.approx(0.25)
+    assert set(updates[-1]["timings"]) == {"seed"}
+
+    tracker.stage("mux")({"time": 600, "speed": None, "done": False})
+    assert updates[-1]["stage_fraction"] == 1.0     # clamped to the planned media
+    tracker.skip("mux")
+    assert updates[-1]["overall"] == pytest.approx(1.0)
+    assert list(updates[-1]["timings"]) == ["seed", "mux"]
+
+
+def test_tracker_parts_add_up_and_finish_together():
+    updates = []
+    tracker = ProgressTracker(updates.append)
+    tracker.plan("audio", 100)
+    callbacks, finished = tracker.parts("audio", ["a", "b"])
+    callbacks["a"]({"time": 30, "speed": 1.0, "done": False})
+    callbacks["b"]({"time": 20, "speed": 1.0, "done": False})
+    assert updates[-1]["stage_fraction"] == pytest.approx(0.5)
+    finished("a")
+    assert "audio" not in tracker.timings
+    finished("b")
+    assert "audio" in tracker.timings
+    assert updates[-1]["stage_fraction"] == 1.0
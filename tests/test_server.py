@@ -0,0 +1,40 @@
+import pytest
+
+from staticvideo.server import JobError, parse_job_options
+
+DEFAULTS = {"res": "1920x1080", "seed_len": 60, "bitrate": "192k", "cache": None}
+
+
+def test_defaults_are_kept_and_not_modified():
+    opts = parse_job_options({}, DEFAULTS)
+    assert opts == DEFAULTS and opts is not DEFAULTS
+    opts = parse_job_options({"res": "1280x720"}, DEFAULTS)
+    assert opts["res"] == "1280x720" and DEFAULTS["res"] == "1920x1080"
+
+
+def test_spec_options_map_to_render_arguments():
+    spec = {"res": "640x480", "seed_len": "AUTO", "bitrate": 320, "audio_mode": "copy", "muxer": "native",
+            "layout": "faststart", "seed_fps": "1/2", "seed_profile": "x264", "verify": 1}
+    assert parse_job_options(spec, DEFAULTS) == {
+        **DEFAULTS, "res": "640x480", "seed_len": "auto", "bitrate": "320k", "audio_policy": "copy",
+        "muxer": "native", "layout": "faststart", "seed_fps": 0.5, "profile": "x264", "verify": True}
+    assert parse_job_options({"seed_len": "30", "seed_fps": ""}, DEFAULTS)["seed_len"] == 30
+    assert parse_job_options({"seed_fps": ""}, DEFAULTS)["seed_fps"] is None
+
+
+@pytest.mark.parametrize("spec, message", [
+    ({"res": "big"}, "resolution"),
+    ({"res": 1080}, None),
+    ({"seed_len": 0}, "positive"),
+    ({"seed_len": "long"}, None),
+    ({"seed_len": None}, None),
+    ({"bitrate": "fast"}, "bitrate"),
+    ({"audio_mode": "mp3"}, "audio_mode"),
+    ({"muxer": "mkvmerge"}, "muxer"),
+    ({"layout": "streaming"}, "layout"),
+    ({"seed_fps": -1}, "positive"),
+    ({"seed_profile": "mpeg2"}, "profile"),
+])
+def test_bad_specs_are_job_errors(spec, message):
+    with pytest.raises(JobError, match=message):
+        parse_job_options(spec, DEFAULTS)
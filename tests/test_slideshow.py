@@ -0,0 +1,90 @@
+import json
+
+import pytest
+
+from staticvideo import slideshow
+
+
+@pytest.fixture
+def images(tmp_path):
+    for name in ("intro.jpg", "a.png", "b.png"):
+        (tmp_path / name).write_bytes(b"")
+    return tmp_path
+
+
+@pytest.mark.parametrize("text, seconds", [("90", 90), ("12.5", 12.5), ("1:30", 90), ("01:02:03.5", 3723.5)])
+def test_parse_time(text, seconds):
+    assert slideshow.parse_time(text) == seconds
+
+
+@pytest.mark.parametrize("text", ["", "1:2:3:4", "-5", "1m30s", "1::2"])
+def test_parse_time_rejects(text):
+    with pytest.raises(ValueError):
+        slideshow.parse_time(text)
+
+
+def test_cue_sheet(images):
+    path = images / "mix.cue"
+    path.write_text('PERFORMER "DJ"\nTITLE "The mix"\nFILE "mix.wav" WAVE\n'
+                    '  TRACK 01 AUDIO\n    TITLE "Intro"\n    REM IMAGE "intro.jpg"\n    INDEX 01 00:00:00\n'
+                    '  TRACK 02 AUDIO\n    TITLE "Second"\n    INDEX 00 01:59:00\n    INDEX 01 02:00:37\n'
+                    '  TRACK 03 AUDIO\n    REM IMAGE a.png\n    INDEX 01 10:30:00\n')
+    cues = slideshow.load_cues(str(path))
+    assert [cue["start"] for cue in cues] == [0, pytest.approx(120.49333), 630]
+    assert [cue["title"] for cue in cues] == ["Intro", "Second", None]
+    assert cues[0]["image"] == cues[1]["image"] == str(images / "intro.jpg")
+    assert cues[2]["image"] == str(images / "a.png")
+
+
+def test_timestamps_default_image_and_sorting(images):
+    path = images / "chapters.txt"
+    path.write_text("# chapters\n5:00 b.png | Outro\n1:00 a.png\n\n2:30 Still a\n")
+    cues = slideshow.load_cues(str(path), default_image=str(images / "intro.jpg"))
+    assert [(cue["start"], cue["image"], cue["title"]) for cue in cues] == [
+        (0.0, str(images / "intro.jpg"), None),
+        (60.0, str(images / "a.png"), None),
+        (150.0, str(images / "a.png"), "Still a"),
+        (300.0, str(images / "b.png"), "Outro"),
+    ]
+
+
+def test_timestamps_bad_time_names_the_line(images):
+    path = images / "chapters.txt"
+    path.write_text("0:00 a.png\nsoon b.png\n")
+    with pytest.raises(ValueError, match=r"chapters\.txt:2"):
+        slideshow.load_cues(str(path))
+
+
+def test_csv_and_json_tables(images):
+    csv_path = images / "cues.csv"
+    csv_path.write_text("start,image,title\n0,a.png,First\n1:15,,Same picture\n")
+    json_path = images / "cues.json"
+    json_path.write_text(json.dumps([{"start": 0, "image": "a.png", "title": "First"},
+                                     {"start": "1:15", "title": "Same picture"}]))
+    for path in (csv_path, json_path):
+        cues = slideshow.load_cues(str(path))
+        assert [(cue["start"], cue["image"], cue["title"]) for cue in cues] == [
+            (0.0, str(images / "a.png"), "First"), (75.0, str(images / "a.png"), "Same picture")]
+
+
+def test_missing_images_are_errors(images):
+    path = images / "chapters.txt"
+    path.write_text("1:00 a.png\n")
+    with pytest.raises(ValueError, match="No image"):
+        slideshow.load_cues(str(path))
+    path.write_text("0:00 gone.png\n")
+    with pytest.raises(ValueError, match="not found"):
+        slideshow.load_cues(str(path))
+
+
+def test_plan_sections():
+    cues = [{"start": 0.0, "image": "a", "title": "A"},
+            {"start": 10.01, "image": "b", "title": None},
+            {"start": 10.02, "image": "c", "title": "Same frame as b"},
+            {"start": 30.0, "image": "d", "title": "After the end"}]
+    sections = slideshow.plan_sections(cues, 20.5, 25)
+    assert sections == [
+        {"image": "a", "title": "A", "start": 0, "frames": 250},
+        {"image": "c", "title": "Same frame as b", "start": 250, "frames": 263},
+    ]
+    assert sum(section["frames"] for section in sections) == 513
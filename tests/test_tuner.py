@@ -0,0 +1,53 @@
+import math
+
+from staticvideo import tuner
+
+SIZE = (1920, 1080)
+
+
+def _model(seed_fixed_s=0.5, seed_s_per_mpix_s=0.01, loop_s=0.002):
+    return {"seed_fixed_s": seed_fixed_s, "seed_s_per_mpix_s": seed_s_per_mpix_s, "loop_s": loop_s}
+
+
+def test_choose_seed_len_minimizes_the_prediction():
+    model = _model()
+    durations = [3600, 1800.5]
+    chosen = tuner.choose_seed_len(model, durations, SIZE)
+    best = min(tuner.predict(model, n, durations, SIZE) for n in range(1, tuner.MAX_SEED_LEN + 1))
+    assert tuner.predict(model, chosen, durations, SIZE) == best
+    # Continuous optimum of a*n + b*D/n, give or take the ceil() of the loop counts
+    megapixels = SIZE[0] * SIZE[1] / 1e6
+    rough = math.sqrt(model["loop_s"] * sum(durations) / (model["seed_s_per_mpix_s"] * megapixels))
+    assert abs(chosen - rough) < rough * 0.5
+
+
+def test_costs_move_the_choice():
+    durations = [3600]
+    base = tuner.choose_seed_len(_model(), durations, SIZE)
+    assert tuner.choose_seed_len(_model(loop_s=0.02), durations, SIZE) > base
+    assert tuner.choose_seed_len(_model(seed_s_per_mpix_s=0.1), durations, SIZE) < base
+    assert tuner.choose_seed_len(_model(), durations, (640, 360)) > base
+
+
+def test_choice_is_capped_by_the_audio_and_max_seed_len():
+    expensive_loops = _model(loop_s=100)
+    assert tuner.choose_seed_len(expensive_loops, 42.3, SIZE) == 43
+    assert tuner.choose_seed_len(expensive_loops, [0.2], SIZE) == 1
+    assert tuner.choose_seed_len(expensive_loops, [36000], SIZE) == tuner.MAX_SEED_LEN
+
+
+def test_ties_go_to_the_shorter_seed():
+    free = _model(seed_fixed_s=0, seed_s_per_mpix_s=0, loop_s=0)
+    assert tuner.choose_seed_len(free, [600], SIZE) == 1
+
+
+def test_auto_seed_len_uses_the_saved_model(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path))
+    messages = []
+    assert tuner.auto_seed_len([30], SIZE, log=messages.append) == 10
+    assert "No seed calibration" in messages[-1]
+    model = _model(loop_s=100)
+    tuner.save_model(model)
+    assert tuner.load_model() == model
+    assert tuner.auto_seed_len([30], SIZE, log=messages.append) == 30
+    assert tuner.load_model(seed_fps=0.5) is None
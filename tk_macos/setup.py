@@ -6,7 +6,7 @@ APP_NAME = "StaticVideoGenerator"
 
 OPTIONS = {
     'argv_emulation': False, # Set to False to prevent terminal-like behavior
-    'packages': ['PIL', 'tkinterdnd2'],
+    'packages': ['PIL', 'tkinterdnd2', 'staticvideo'],
     'plist': {
         'CFBundleName': APP_NAME,
         'CFBundleDisplayName': APP_NAME,